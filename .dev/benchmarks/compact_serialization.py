@@ -0,0 +1,78 @@
+"""
+Benchmark: tamanho (bytes e tokens estimados) de um catálogo realista serializado com
+tojson(indent=2) (antes) x JSON compacto x to_table.
+
+Uso (na raiz do repositório, não precisa do Home Assistant):
+    python .dev/benchmarks/compact_serialization.py
+"""
+import importlib.util
+import json
+from pathlib import Path
+
+_PATH = Path(__file__).resolve().parents[2] / 'custom_components' / 'stackspot' / 'serialization.py'
+_SPEC = importlib.util.spec_from_file_location('serialization', _PATH)
+serialization = importlib.util.module_from_spec(_SPEC)
+_SPEC.loader.exec_module(serialization)
+
+DOMAINS = ('light', 'switch', 'sensor', 'binary_sensor', 'climate', 'cover', 'media_player')
+AREAS = ('living_room', 'kitchen', 'bedroom', 'office', 'garage', None)
+
+
+def _entities(count: int) -> list[dict]:
+    return [
+        {
+            'entity_id': f'{DOMAINS[index % len(DOMAINS)]}.device_{index}',
+            'name': f'Device {index}',
+            'aliases': [f'alias {index}'] if index % 3 == 0 else [],
+            'labels': ['label_name'] if index % 10 == 0 else [],
+            'area_id': AREAS[index % len(AREAS)],
+        }
+        for index in range(count)
+    ]
+
+
+def _scripts(count: int) -> list[dict]:
+    return [
+        {
+            'entity_id': f'script.script_{index}',
+            'name': f'Script {index}',
+            'description': f'Runs the routine number {index}',
+            'fields': {'value_text': {'name': 'value text', 'selector': {'text': None}}},
+            'aliases': [],
+            'labels': [],
+        }
+        for index in range(count)
+    ]
+
+
+def _services(count: int) -> list[dict]:
+    return [
+        {'domain': DOMAINS[index % len(DOMAINS)], 'service': f'service_{index}',
+         'name': f'{DOMAINS[index % len(DOMAINS)]}.service_{index}'}
+        for index in range(count)
+    ]
+
+
+def _row(name: str, text: str, base: str | None = None) -> None:
+    size, tokens = len(text.encode()), serialization.estimate_tokens(text)
+    ratio = '' if base is None else f'{size / len(base.encode()):.0%}'
+    print(f'{name:<34} | {size:>9} | {tokens:>9} | {ratio:>6}')
+
+
+def main() -> None:
+    catalogs = {
+        'exposed_entities (1000)': _entities(1000),
+        'scripts (50)': _scripts(50),
+        'services (300)': _services(300),
+    }
+
+    print(f'{"":<34} | {"bytes":>9} | {"tokens":>9} | {"size":>6}')
+    for name, items in catalogs.items():
+        before = json.dumps(items, indent=2, ensure_ascii=False, sort_keys=True)
+        _row(f'{name} indent=2', before)
+        _row(f'{name} compact', serialization.to_compact_json(items), before)
+        _row(f'{name} table', serialization.to_table(items), before)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,69 @@
+"""
+Micro-benchmark: custo do render de um prompt que percorre exposed_entities,
+criando um Template a cada chamada (antes) x usando o cache de templates compilados (depois).
+
+Uso (na raiz do repositório, com as dependências de dev instaladas):
+    python .dev/benchmarks/render_template.py
+"""
+import asyncio
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[2]))
+
+from homeassistant.core import HomeAssistant  # noqa: E402
+from homeassistant.helpers.template import Template  # noqa: E402
+
+from custom_components.stackspot.util import clear_template_cache, get_template  # noqa: E402
+
+PROMPT = (
+    'My name is {{ user }}\n'
+    '{% for entity in exposed_entities %}'
+    '- {{ entity.entity_id }}: {{ entity.name }} {{ entity.aliases | join(", ") }}\n'
+    '{% endfor %}'
+    '{{ exposed_entities | selectattr("labels", "contains", "label_name") | list | tojson }}'
+)
+ENTITY_COUNTS = (100, 1000, 5000)
+ROUNDS = 50
+
+
+def _entities(count: int) -> list[dict]:
+    return [
+        {
+            'entity_id': f'light.light_{index}',
+            'name': f'Light {index}',
+            'aliases': [f'lamp {index}'],
+            'labels': ['label_name'] if index % 10 == 0 else [],
+        }
+        for index in range(count)
+    ]
+
+
+def _bench(render) -> float:
+    start = time.perf_counter()
+    for _ in range(ROUNDS):
+        render()
+    return (time.perf_counter() - start) / ROUNDS * 1000
+
+
+async def main() -> None:
+    hass = HomeAssistant(tempfile.mkdtemp())
+
+    print(f'{"entities":>8} | {"new Template (ms)":>18} | {"cached (ms)":>12} | {"speedup":>7}')
+    for count in ENTITY_COUNTS:
+        variables = {'user': 'bench', 'exposed_entities': _entities(count)}
+
+        before = _bench(lambda: Template(PROMPT, hass).async_render(variables, parse_result=False))
+
+        clear_template_cache()
+        after = _bench(lambda: get_template(hass, PROMPT).async_render(variables, parse_result=False))
+
+        print(f'{count:>8} | {before:>18.2f} | {after:>12.2f} | {before / after:>6.2f}x')
+
+    await hass.async_stop(force=True)
+
+
+if __name__ == '__main__':
+    asyncio.run(main())
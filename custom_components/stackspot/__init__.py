@@ -1,14 +1,28 @@
+import asyncio
 import logging
-from datetime import timedelta, datetime
+import time
+from datetime import timedelta
 
 from homeassistant.config_entries import ConfigEntry, ConfigSubentry
-from homeassistant.const import Platform
-from homeassistant.core import HomeAssistant
-from homeassistant.helpers.event import async_track_time_interval
+from homeassistant.const import EVENT_HOMEASSISTANT_CLOSE, Platform
+from homeassistant.core import Event, HomeAssistant, callback
+from homeassistant.helpers.start import async_at_started
 
 from .const import (
     DOMAIN,
     MANAGER,
+    API_CLIENT,
+    API_CLIENT_CLOSE,
+    WARM_UP,
+    PROMPT_CACHE,
+    CONVERSATION_STORE,
+    KS_SYNC_STATE,
+    KS_UPDATER,
+    JOB_SCHEDULER,
+    CONVERSATION_HISTORY_MAX_BYTES,
+    SECONDS_KEEP_CONVERSATION_HISTORY,
+    CONF_WARM_UP,
+    CONF_WARM_UP_DEFAULT,
     CONF_AGENT_NAME,
     CONF_AGENT_NAME_DEFAULT,
     CONF_KS_INTERVAL_UPDATE,
@@ -16,17 +30,37 @@ from .const import (
     SUBENTRY_KS,
     TEMPLATE_KEY_TOOLS,
 )
+from .client.stackspot_client import StackSpotApiClient, create_client_session
+from .conversation_store import ConversationStore
 from .data_utils import StackSpotLogin, KSData
 from .entities.stackspot_entity_manager import StackSpotEntityManager
-from .knowledge_source import ks_create, ks_update
+from .jobs import JobScheduler
+from .knowledge_source import KSSyncState, KSUpdater, ks_create
+from .prompt_cache import PromptRenderCache
 from .sensor import TokenTotalSensor
-from .util import load_exposed_entities, load_init_variables, load_scripts_from_yaml, load_services
+from .util import (
+    load_exposed_entities,
+    load_init_variables,
+    load_scripts_from_yaml,
+    load_services,
+    remove_token_manager,
+    get_token_manager,
+    get_request_scheduler,
+    remove_request_scheduler,
+    get_variables_ready,
+    unload_variables,
+    clear_template_cache,
+)
+from .warmup import StackSpotWarmUp
 
 _LOGGER = logging.getLogger(__name__)
 
 # PLATFORMS = [Platform.CONVERSATION, Platform.SENSOR, Platform.SELECT]
 PLATFORMS = [Platform.CONVERSATION, Platform.SENSOR, Platform.AI_TASK]
 
+VARIABLES_TASK = 'variables-task'
+KS_TASK = 'ks-task'
+
 
 async def async_setup_entry(hass: HomeAssistant, entry: ConfigEntry) -> bool:
     if DOMAIN not in hass.data:
@@ -35,19 +69,132 @@ async def async_setup_entry(hass: HomeAssistant, entry: ConfigEntry) -> bool:
     if MANAGER not in hass.data[DOMAIN]:
         hass.data[DOMAIN][MANAGER] = StackSpotEntityManager()
 
+    manager: StackSpotEntityManager = hass.data[DOMAIN][MANAGER]
+    if not manager.has_object(API_CLIENT):
+        api = StackSpotApiClient(create_client_session())
+        manager.add_objetc(API_CLIENT, api)
+
+        # A sessão é fechada no unload da última entry ou no encerramento do HA (que não descarrega as entries)
+        async def async_close_api_client(event: Event) -> None:
+            await api.close()
+
+        manager.add_objetc(API_CLIENT_CLOSE,
+                           hass.bus.async_listen_once(EVENT_HOMEASSISTANT_CLOSE, async_close_api_client))
+
+    if not manager.has_object(PROMPT_CACHE):
+        manager.add_objetc(PROMPT_CACHE, PromptRenderCache(hass))
+
+    if not manager.has_object(CONVERSATION_STORE):
+        manager.add_objetc(CONVERSATION_STORE,
+                           ConversationStore(hass, SECONDS_KEEP_CONVERSATION_HISTORY, CONVERSATION_HISTORY_MAX_BYTES))
+
+    if not manager.has_object(KS_SYNC_STATE):
+        manager.add_objetc(KS_SYNC_STATE, KSSyncState(hass))
+
+    if not manager.has_object(JOB_SCHEDULER):
+        manager.add_objetc(JOB_SCHEDULER, JobScheduler(hass))
+
+    get_request_scheduler(hass, StackSpotLogin.from_entry(entry), entry.data)
+
+    warm_up: StackSpotWarmUp | None = None
+    if entry.data.get(CONF_WARM_UP, CONF_WARM_UP_DEFAULT):
+        warm_up = StackSpotWarmUp(hass, manager.get_object_by(API_CLIENT),
+                                  get_token_manager(hass, StackSpotLogin.from_entry(entry)))
+        manager.add_objetc(f'{WARM_UP}_{entry.entry_id}', warm_up)
+
+    start = time.perf_counter()
     await hass.config_entries.async_forward_entry_setups(entry, PLATFORMS)
-    await process_variables(hass)
+    _LOGGER.debug(f'[{entry.title}] STARTUP - platforms set up in {_elapsed_ms(start):.0f} ms')
+    if warm_up is not None:
+        warm_up.async_start()
 
-    for subentry in entry.subentries.values():
-        if subentry.subentry_type == SUBENTRY_KS:
-            await process_subentry_ks(hass, entry, subentry)
+    # Variáveis e KS dependem de I/O (scripts.yaml e StackSpot), não seguram o start do HA
+    @callback
+    def async_start_background(_hass: HomeAssistant) -> None:
+        entry.async_create_background_task(hass, async_setup_background(hass, entry),
+                                           f'{DOMAIN}_setup_{entry.entry_id}')
 
+    entry.async_on_unload(async_at_started(hass, async_start_background))
     return True
 
 
+async def async_setup_background(hass: HomeAssistant, entry: ConfigEntry) -> None:
+    start = time.perf_counter()
+    try:
+        await process_variables(hass)
+    except Exception as e:
+        _LOGGER.error(f'[{entry.title}] Template variables setup failed: {e!r}')
+    else:
+        _LOGGER.debug(f'[{entry.title}] STARTUP - variables loaded in {_elapsed_ms(start):.0f} ms')
+    finally:
+        # Mesmo com falha os agentes não aguardam o timeout, renderizam com as variáveis disponíveis
+        get_variables_ready(hass).set()
+
+    ks_start = time.perf_counter()
+    subentries = [subentry for subentry in entry.subentries.values() if subentry.subentry_type == SUBENTRY_KS]
+    results = await asyncio.gather(*(process_subentry_ks(hass, entry, subentry) for subentry in subentries),
+                                   return_exceptions=True)
+    for subentry, result in zip(subentries, results):
+        if isinstance(result, Exception):
+            _LOGGER.error(f'[{entry.title}] KS {subentry.title} setup failed: {result!r}')
+    _LOGGER.debug(f'[{entry.title}] STARTUP - {len(subentries)} KS processed in {_elapsed_ms(ks_start):.0f} ms')
+
+    _LOGGER.info(f'[{entry.title}] Background setup finished in {_elapsed_ms(start):.0f} ms')
+
+
 async def async_unload_entry(hass: HomeAssistant, entry: ConfigEntry) -> bool:
     """Unload a config entry."""
     unload_ok = await hass.config_entries.async_unload_platforms(entry, PLATFORMS)
+    if unload_ok:
+        manager: StackSpotEntityManager = hass.data[DOMAIN][MANAGER]
+
+        # Reload acontece ao reconfigurar uma subentry, os templates antigos não são mais usados
+        clear_template_cache()
+        prompt_cache: PromptRenderCache | None = manager.get_object_by(PROMPT_CACHE)
+        if prompt_cache is not None:
+            prompt_cache.async_clear()
+
+        warm_up: StackSpotWarmUp | None = manager.remove_object(f'{WARM_UP}_{entry.entry_id}')
+        if warm_up is not None:
+            warm_up.async_stop()
+
+        for subentry in entry.subentries.values():
+            if subentry.subentry_type == SUBENTRY_KS:
+                stop_subentry_ks(hass, subentry.subentry_id)
+
+        remove_token_manager(hass, StackSpotLogin.from_entry(entry))
+        remove_request_scheduler(hass, StackSpotLogin.from_entry(entry))
+
+    other_entries = [e for e in hass.config_entries.async_loaded_entries(DOMAIN) if e.entry_id != entry.entry_id]
+    if unload_ok and not other_entries:
+        manager: StackSpotEntityManager = hass.data[DOMAIN][MANAGER]
+        remove_listener = manager.remove_object(VARIABLES_TASK)
+        if remove_listener is not None:
+            remove_listener()
+        unload_variables(hass)
+
+        prompt_cache: PromptRenderCache | None = manager.remove_object(PROMPT_CACHE)
+        if prompt_cache is not None:
+            prompt_cache.async_stop()
+
+        conversation_store: ConversationStore | None = manager.remove_object(CONVERSATION_STORE)
+        if conversation_store is not None:
+            await conversation_store.async_shutdown()
+
+        manager.remove_object(KS_SYNC_STATE)
+
+        jobs: JobScheduler | None = manager.remove_object(JOB_SCHEDULER)
+        if jobs is not None:
+            jobs.async_stop()
+
+        remove_close_listener = manager.remove_object(API_CLIENT_CLOSE)
+        if remove_close_listener is not None:
+            remove_close_listener()
+
+        api: StackSpotApiClient | None = manager.remove_object(API_CLIENT)
+        if api is not None:
+            await api.close()
+
     return unload_ok
 
 
@@ -58,18 +205,17 @@ async def process_variables(hass: HomeAssistant) -> None:
     await load_scripts_from_yaml(hass)
 
     manager: StackSpotEntityManager = hass.data[DOMAIN][MANAGER]
-    key = 'variables-task'
+    key = VARIABLES_TASK
 
     remove_listener = manager.get_object_by(key)
     if remove_listener is not None:
         remove_listener()
 
-    async def task(now: datetime) -> None:
-        await load_exposed_entities(hass)
-        await load_services(hass)
+    async def task() -> None:
         await load_scripts_from_yaml(hass)
 
-    remove_listener = async_track_time_interval(hass, task, timedelta(minutes=5))
+    jobs: JobScheduler = manager.get_object_by(JOB_SCHEDULER)
+    remove_listener = jobs.async_add_job(key, timedelta(minutes=5), task)
     manager.add_objetc(key, remove_listener)
 
 
@@ -78,26 +224,42 @@ async def process_subentry_ks(hass: HomeAssistant, entry: ConfigEntry, subentry:
     ks_data = KSData.from_entry(subentry)
     subentry_id = subentry.subentry_id
     manager: StackSpotEntityManager = hass.data[DOMAIN][MANAGER]
-    key_prefix = 'ks-task_'
 
-    await ks_create(data_token, ks_data)
+    start = time.perf_counter()
+    await ks_create(hass, data_token, ks_data)
+    _LOGGER.debug(f'KS {ks_data.slug} created in {_elapsed_ms(start):.0f} ms')
 
-    remove_listener = manager.get_object_by(key_prefix + subentry_id)
-    if remove_listener is not None:
-        remove_listener()
+    stop_subentry_ks(hass, subentry_id)
+
+    jobs: JobScheduler = manager.get_object_by(JOB_SCHEDULER)
+    updater = KSUpdater(hass, data_token, ks_data, jobs)
+    updater.async_start()
+    manager.add_objetc(f'{KS_UPDATER}_{subentry_id}', updater)
 
     interval: dict = subentry.data.get(CONF_KS_INTERVAL_UPDATE, CONF_KS_INTERVAL_UPDATE_DEFAULT)
+    remove_listener = jobs.async_add_job(f'{KS_TASK}_{subentry_id}',
+                                         timedelta(
+                                             days=interval.get('days', 0),
+                                             hours=interval.get('hours', 0),
+                                             minutes=interval.get('minutes', 0),
+                                             seconds=interval.get('seconds', 0)
+                                         ),
+                                         updater.async_update)
+
+    manager.add_objetc(f'{KS_TASK}_{subentry_id}', remove_listener)
+
+
+def stop_subentry_ks(hass: HomeAssistant, subentry_id: str) -> None:
+    manager: StackSpotEntityManager = hass.data[DOMAIN][MANAGER]
+
+    remove_listener = manager.remove_object(f'{KS_TASK}_{subentry_id}')
+    if remove_listener is not None:
+        remove_listener()
 
-    async def task(now: datetime) -> None:
-        await ks_update(hass, data_token, ks_data)
+    updater: KSUpdater | None = manager.remove_object(f'{KS_UPDATER}_{subentry_id}')
+    if updater is not None:
+        updater.async_stop()
 
-    remove_listener = async_track_time_interval(hass, task,
-                                                timedelta(
-                                                    days=interval.get('days', 0),
-                                                    hours=interval.get('hours', 0),
-                                                    minutes=interval.get('minutes', 0),
-                                                    seconds=interval.get('seconds', 0)
-                                                )
-                                                )
 
-    manager.add_objetc(key_prefix + subentry_id, remove_listener)
+def _elapsed_ms(start: float) -> float:
+    return (time.perf_counter() - start) * 1000
@@ -1,11 +1,15 @@
 from __future__ import annotations
 
-import json
+import asyncio
 import logging
-from datetime import datetime, UTC, timedelta
-from typing import Optional
+import time
+from contextlib import nullcontext
+from dataclasses import dataclass, field
+from typing import Optional, AsyncIterator, ContextManager
 
 from homeassistant.components.conversation import (
+    AssistantContent,
+    ChatLog,
     ConversationResult,
     ConversationInput
 )
@@ -13,27 +17,87 @@ from homeassistant.const import STATE_UNKNOWN
 from homeassistant.core import HomeAssistant
 from homeassistant.helpers import intent
 from homeassistant.helpers.entity import Entity
+from homeassistant.util.ulid import ulid_now
 
 from . import StackSpotEntityManager
 from .client.stackspot_client import StackSpotApiClient
+from .client.scheduler import RequestPriority, RequestScheduler
+from .client.token_manager import StackSpotTokenManager
 from .const import (
     DOMAIN,
     MANAGER,
+    PROMPT_CACHE,
+    CONVERSATION_STORE,
+    JOB_SCHEDULER,
     SENSOR_USER_TOKEN,
     SENSOR_OUTPUT_TOKEN,
     SENSOR_ENRICHMENT_TOKEN,
     SENSOR_TOTAL_TOKEN,
-    SECONDS_KEEP_CONVERSATION_HISTORY,
     SENSOR_TOTAL_GENERAL_TOKEN,
+    SENSOR_PROMPT_SIZE,
     TEMPLATE_KEY_USER,
 )
-from .data_utils import ContextValue, StackSpotAgentConfig, MessageRole
+from .conversation_store import ConversationStore, ConversationKey
+from .data_utils import ContextValue, Message, StackSpotAgentConfig, MessageRole, StackSpotLogin, AgentRunStats
 from .entities.token_sensor import TokenSensor
-from .tools import PROMPT_TOOLS, process_response_tools
-from .util import render_template, get_username_by_conversation_input
+from .sensor import PromptSizeSensor
+from .tools import PROMPT_TOOLS, ToolResult, process_response_tools
+from .jobs import JobScheduler
+from .prompt_cache import PromptRenderCache
+from .serialization import to_compact_json, estimate_tokens
+from .util import (
+    get_username_by_conversation_input,
+    get_api_client,
+    get_token_manager,
+    get_request_scheduler,
+    async_wait_variables_ready,
+)
 
 _LOGGER = logging.getLogger(__name__)
 
+# Início de resposta que pode ser uma tool call, por isso não é enviada em streaming
+_TOOL_CALL_PREFIXES = ('{', '`')
+
+# O loop de tools para quando o LLM repete a mesma chamada mais vezes que isso no turno
+TOOL_MAX_REPEATED_CALLS = 3
+
+TOOL_LOOP_LIMIT_RESPONSE = "Sorry, I couldn't finish this request within the limits configured for me."
+
+CIRCUIT_OPEN_RESPONSE = "Sorry, Stackspot is unavailable right now, please try again in a moment."
+
+STALE_TURN_RESPONSE = "This request was replaced by a newer one."
+
+HISTORY_SUMMARY_PROMPT = (
+    "Summarize the conversation below in a few sentences, keeping the facts, names, entities, decisions "
+    "and pending requests needed to continue it. Reply only with the summary, in the language of the conversation."
+    "\n\n<previous_summary>\n{summary}\n</previous_summary>"
+    "\n\n<history>\n{history}\n</history>"
+)
+
+
+@dataclass
+class ChatLogStream:
+    """Destino dos deltas de uma resposta em streaming, streamed é o texto enviado ao chat log pelo último envio."""
+    chat_log: ChatLog
+    agent_id: str
+    streamed: str = ''
+
+
+@dataclass
+class _ConversationTurns:
+    """Fila de turnos de uma conversa."""
+    lock: asyncio.Lock = field(default_factory=asyncio.Lock)
+    in_flight: asyncio.Task | None = None
+    sequence: int = 0
+    pending: int = 0
+
+
+@dataclass
+class _StreamState:
+    parts: list[str] = field(default_factory=list)
+    tokens: dict | None = None
+    error: dict | None = None
+
 
 class StackSpotAgent:
     def __init__(self, hass: HomeAssistant, config: StackSpotAgentConfig) -> None:
@@ -41,90 +105,276 @@ class StackSpotAgent:
         self.hass: HomeAssistant = hass
         self.manager: StackSpotEntityManager = hass.data[DOMAIN][MANAGER]
         self.config: StackSpotAgentConfig = config
-        self._access_token: str | None = None
-        self._expires_token: datetime | None = None
-        self._history: dict[str, ContextValue] = {}
-        self._api: StackSpotApiClient = StackSpotApiClient()
+        self._token_manager: StackSpotTokenManager = get_token_manager(hass, StackSpotLogin.from_agent_config(config))
+        self._scheduler: RequestScheduler = get_request_scheduler(hass, StackSpotLogin.from_agent_config(config))
+        self._history: ConversationStore = self.manager.get_object_by(CONVERSATION_STORE)
+        self._api: StackSpotApiClient = get_api_client(hass)
+        self.last_run_stats: AgentRunStats | None = None
+        self._last_history_size: tuple[int, int] = (0, 0)
+        self._summarizing: set[ConversationKey] = set()
+        self._turns: dict[str, _ConversationTurns] = {}
+        self._jobs: JobScheduler | None = self.manager.get_object_by(JOB_SCHEDULER)
 
     async def async_process(self, user_input: ConversationInput) -> ConversationResult:
         """Processa a entrada do usuário e retorna a resposta."""
-        # History
-        await self._add_message(user_input.conversation_id, MessageRole.USER, user_input.text)
-
-        text_response = await self._run_agent(user_input)
+        conversation_id = user_input.conversation_id or ulid_now()
+        text_response = await self._run_turn(user_input, conversation_id)
 
         intent_response = intent.IntentResponse(language=user_input.language)
         intent_response.async_set_speech(text_response)
-        return ConversationResult(response=intent_response, conversation_id=user_input.conversation_id)
+        return ConversationResult(response=intent_response, conversation_id=conversation_id)
 
-    async def _run_agent(self, user_input: ConversationInput) -> str:
+    async def async_process_chat_log(self, user_input: ConversationInput, chat_log: ChatLog, agent_id: str) -> None:
         """
-        Loop recursivo: envia prompt pro LLM,
-        executa tools se necessário e continua até resposta final.
+        Processa a entrada do usuário escrevendo a resposta no chat log.
+        Com streaming habilitado os deltas são repassados ao chat log (e ao TTS) enquanto o modelo gera.
         """
-        final_prompt = await self._get_final_prompt(user_input)
+        chat_stream = ChatLogStream(chat_log, agent_id) if self.config.streaming else None
+        text_response = await self._run_turn(user_input, chat_log.conversation_id, chat_stream)
+
+        # A resposta final pode não ter sido enviada (ou só em parte) pelo streaming: tool call retida,
+        # limite do loop de tools ou turno substituído
+        if chat_stream is None or text_response.strip() != chat_stream.streamed.strip():
+            chat_log.async_add_assistant_content_without_tools(
+                AssistantContent(agent_id=agent_id, content=text_response)
+            )
 
-        text_response = await self._send_prompt_to_stackspot(final_prompt)
-        await self._add_message(user_input.conversation_id, MessageRole.ASSISTANT, text_response)
+    async def _run_turn(self, user_input: ConversationInput, conversation_id: str,
+                        chat_stream: ChatLogStream | None = None) -> str:
+        """
+        Os turnos de uma mesma conversa são executados em fila (um por vez).
+        Com cancel_stale_turn, um turno novo cancela o que está em andamento (requisição HTTP e loop de tools)
+        e os que ainda aguardam na fila são descartados.
+        conversation_id é o id atribuído pelo HA (chat log), o do user_input é None em conversas novas.
+        """
+        turns = self._turns.get(conversation_id)
+        if turns is None:
+            turns = self._turns[conversation_id] = _ConversationTurns()
 
-        if not self.config.allow_control:
-            return text_response
+        turns.pending += 1
+        turns.sequence += 1
+        sequence = turns.sequence
+        if self.config.cancel_stale_turn and turns.in_flight is not None and not turns.in_flight.done():
+            _LOGGER.debug(f'[{self.config.agent_name}] TURN - cancelling stale turn of {conversation_id}')
+            turns.in_flight.cancel()
 
-        process_tool = await process_response_tools(self.hass, text_response)
-        if process_tool and process_tool["tools"]:
-            await self._add_message(
-                user_input.conversation_id,
-                MessageRole.TOOL,
-                process_tool["content"]
-            )
+        try:
+            async with turns.lock:
+                if self.config.cancel_stale_turn and sequence != turns.sequence:
+                    return STALE_TURN_RESPONSE
+
+                # A tarefa é criada antes do primeiro await, um turno mais novo consegue cancelar o turno
+                # inteiro, inclusive enquanto a mensagem do usuário é gravada no histórico
+                task = self.hass.async_create_task(
+                    self._run_user_turn(user_input, conversation_id, chat_stream), f'stackspot-turn-{conversation_id}'
+                )
+                turns.in_flight = task
+                try:
+                    with self._conversation_in_flight():
+                        return await task
+                except asyncio.CancelledError:
+                    # Cancelado por quem chamou (propaga) ou por um turno mais novo da conversa
+                    if asyncio.current_task().cancelling():
+                        raise
+                    return STALE_TURN_RESPONSE
+                finally:
+                    turns.in_flight = None
+        finally:
+            turns.pending -= 1
+            if not turns.pending:
+                del self._turns[conversation_id]
+
+    async def _run_user_turn(self, user_input: ConversationInput, conversation_id: str,
+                             chat_stream: ChatLogStream | None = None) -> str:
+        await self._add_message(conversation_id, MessageRole.USER, user_input.text)
+        return await self._run_agent(user_input, conversation_id, chat_stream)
+
+    def _conversation_in_flight(self) -> ContextManager[None]:
+        """As sincronizações de KS aguardam as conversas em andamento (JobScheduler)."""
+        return self._jobs.conversation() if self._jobs is not None else nullcontext()
+
+    async def _run_agent(self, user_input: ConversationInput, conversation_id: str,
+                         chat_stream: ChatLogStream | None = None) -> str:
+        """
+        Loop iterativo: envia prompt pro LLM, executa tools se necessário e continua até resposta final,
+        respeitando os limites de iterações, tempo e tokens do agente.
+        O histórico é gravado com o conversation_id atribuído pelo HA, o mesmo retornado ao cliente.
+        """
+        stats = AgentRunStats()
+        tool_cache: dict[str, ToolResult] = {}
 
-            return await self._run_agent(user_input)
+        # O system prompt é renderizado uma única vez por turno, apenas o histórico muda entre as iterações
+        user: str = await get_username_by_conversation_input(self.hass, user_input)
+        system_prompt: str = await self._get_system_prompt({TEMPLATE_KEY_USER: user})
 
-        return text_response
+        try:
+            while True:
+                iteration_start = time.perf_counter()
+                final_prompt = await self._get_final_prompt(conversation_id, system_prompt)
+                self._update_prompt_size_sensor(final_prompt)
+
+                text_response = await self._send_prompt_to_stackspot(final_prompt, chat_stream, stats)
+                await self._add_message(conversation_id, MessageRole.ASSISTANT, text_response)
+
+                if not self.config.allow_control:
+                    stats.add_iteration(iteration_start)
+                    return text_response
+
+                process_tool = await process_response_tools(self.hass, text_response, tool_cache, stats.tool_calls)
+                stats.add_iteration(iteration_start, process_tool.get("executed", 0), process_tool.get("memoized", 0),
+                                    process_tool.get("repeated", 0))
+                if not process_tool["tools"]:
+                    return text_response
+
+                await self._add_message(
+                    conversation_id,
+                    MessageRole.TOOL,
+                    process_tool["content"]
+                )
+
+                exceeded = self._tool_loop_budget_exceeded(stats)
+                if exceeded:
+                    _LOGGER.warning(f'[{self.config.agent_name}] Tool loop stopped: {exceeded}')
+                    return TOOL_LOOP_LIMIT_RESPONSE
+        finally:
+            self.last_run_stats = stats
+            _LOGGER.debug(f'[{self.config.agent_name}] RUN - {stats.as_dict()}')
+            if self.config.history_summary:
+                self._schedule_history_summary(conversation_id)
+
+    def _tool_loop_budget_exceeded(self, stats: AgentRunStats) -> str | None:
+        """Retorna o motivo caso algum limite do loop de tools tenha sido atingido."""
+        if len(stats.iterations) >= self.config.max_tool_iterations:
+            return f'{len(stats.iterations)} iterations'
+        if self.config.tool_loop_timeout and stats.elapsed_seconds() >= self.config.tool_loop_timeout:
+            return f'{stats.elapsed_seconds():.1f} seconds'
+        if self.config.tool_loop_token_budget and stats.tokens >= self.config.tool_loop_token_budget:
+            return f'{stats.tokens} tokens'
+        if stats.max_tool_repeats > TOOL_MAX_REPEATED_CALLS:
+            return f'same tool call made {stats.max_tool_repeats} times'
+        return None
 
     async def process_task(self, prompt_task: str) -> str:
         # Prompt
         agent_prompt = await self._get_system_prompt({TEMPLATE_KEY_USER: STATE_UNKNOWN})
         message = f'{agent_prompt} \n {prompt_task}'
 
-        text_response = await self._send_prompt_to_stackspot(message)
+        text_response = await self._send_prompt_to_stackspot(message, priority=RequestPriority.AI_TASK)
         return text_response
 
-    async def _get_access_token(self, force_new=False) -> str | None:
-        """Obtém o token de acesso da Stackspot AI."""
-        if not force_new and self._access_token and datetime.now() < self._expires_token:
-            return self._access_token
-
-        token_data = await self._api.generate_access_token(self.config.realm, self.config.client_id,
-                                                           self.config.client_key)
-        try:
-            self._access_token = token_data.get("access_token")
-            expires_in_seconds = token_data.get("expires_in")
-            self._expires_token = datetime.now() + timedelta(seconds=expires_in_seconds)
+    async def _get_access_token(self, rejected_token: str | None = None) -> str | None:
+        """Obtém o token de acesso da Stackspot AI, compartilhado por todos os agentes da conta."""
+        return await self._token_manager.async_get_token(rejected_token)
 
-            return self._access_token
-        except Exception as e:
-            _LOGGER.error(f"Erro ao obter token da Stackspot AI: {e}")
-            return None
+    async def _send_prompt_to_stackspot(self, prompt: str, chat_stream: ChatLogStream | None = None,
+                                        stats: AgentRunStats | None = None,
+                                        priority: RequestPriority = RequestPriority.INTERACTIVE) -> str:
+        """Envia o prompt para a Stackspot AI e retorna a resposta, aguardando a vaga da classe no scheduler da conta."""
+        async with self._scheduler.slot(priority):
+            if chat_stream is not None:
+                return await self._stream_prompt_to_stackspot(prompt, chat_stream, stats)
+            return await self._request_prompt_to_stackspot(prompt, stats)
 
-    async def _send_prompt_to_stackspot(self, prompt: str) -> str:
-        """Envia o prompt para a Stackspot AI e retorna a resposta."""
+    async def _request_prompt_to_stackspot(self, prompt: str, stats: AgentRunStats | None = None) -> str:
         access_token = await self._get_access_token()
         if not access_token:
             return "Sorry, I couldn't authenticate myself with Stackspot there."
 
         response = await self._api.send_prompt(access_token, self.config.agent_id, prompt)
-        if response.get('error', False):
-            access_token = await self._get_access_token(force_new=True)
+        if response.get('status') == 401:
+            access_token = await self._get_access_token(rejected_token=access_token)
             response = await self._api.send_prompt(access_token, self.config.agent_id, prompt)
 
+        if response.get('circuit_open', False):
+            return CIRCUIT_OPEN_RESPONSE
         if response.get('error', False):
             return 'Sorry, I had a problem when communicating with stackspot there.'
 
-        await self._actions_with_response(response)
+        await self._actions_with_response(response, stats)
         return response.get("message", "No Stackspot Awards Ai.")
 
-    async def _actions_with_response(self, response: dict) -> None:
+    async def _stream_prompt_to_stackspot(self, prompt: str, chat_stream: ChatLogStream,
+                                          stats: AgentRunStats | None = None) -> str:
+        """
+        Envia o prompt em modo streaming. Os deltas vão para o chat log assim que fica claro
+        que a resposta não é uma tool call, os tokens são contabilizados ao final.
+        A partir de um possível início de tool call no meio da resposta ({ ou bloco de código) o texto é retido.
+        """
+        chat_stream.streamed = ''
+        access_token = await self._get_access_token()
+        if not access_token:
+            return "Sorry, I couldn't authenticate myself with Stackspot there."
+
+        state = _StreamState()
+        deltas = self._iter_deltas(self._api.send_prompt_stream(access_token, self.config.agent_id, prompt), state)
+        first_delta = await anext(deltas, None)
+
+        if state.error is not None and state.error.get('status') == 401:
+            access_token = await self._get_access_token(rejected_token=access_token)
+            state = _StreamState()
+            deltas = self._iter_deltas(self._api.send_prompt_stream(access_token, self.config.agent_id, prompt), state)
+            first_delta = await anext(deltas, None)
+
+        if state.error is not None and not state.parts:
+            if state.error.get('circuit_open', False):
+                return CIRCUIT_OPEN_RESPONSE
+            return 'Sorry, I had a problem when communicating with stackspot there.'
+
+        # Acumula até o primeiro caractere visível para decidir se a resposta pode ser uma tool call
+        buffered = first_delta or ''
+        while not buffered.strip():
+            delta = await anext(deltas, None)
+            if delta is None:
+                break
+            buffered += delta
+
+        may_be_tool_call = self.config.allow_control and buffered.lstrip().startswith(_TOOL_CALL_PREFIXES)
+        if may_be_tool_call or not buffered.strip():
+            async for _ in deltas:
+                pass
+        else:
+            async def content_stream() -> AsyncIterator[dict]:
+                yield {'role': 'assistant'}
+                text: str | None = buffered
+                while text is not None:
+                    start = _tool_call_start(text) if self.config.allow_control else None
+                    visible = text if start is None else text[:start]
+                    if visible:
+                        chat_stream.streamed += visible
+                        yield {'content': visible}
+                    if start is not None:
+                        return
+                    text = await anext(deltas, None)
+
+            async for _ in chat_stream.chat_log.async_add_delta_content_stream(chat_stream.agent_id, content_stream()):
+                pass
+            # O restante da resposta (possível tool call) não vai para o chat log
+            async for _ in deltas:
+                pass
+
+        if state.tokens is not None:
+            await self._actions_with_response({'tokens': state.tokens}, stats)
+
+        text_response = ''.join(state.parts)
+        return text_response or "No Stackspot Awards Ai."
+
+    @staticmethod
+    async def _iter_deltas(events: AsyncIterator[dict], state: _StreamState) -> AsyncIterator[str]:
+        """Extrai o texto de cada evento do streaming, guardando tokens e erros em state."""
+        async for event in events:
+            if event.get('error', False):
+                state.error = event
+                return
+
+            if isinstance(event.get('tokens'), dict):
+                state.tokens = event['tokens']
+
+            text = event.get('message')
+            if text:
+                state.parts.append(text)
+                yield text
+
+    async def _actions_with_response(self, response: dict, stats: AgentRunStats | None = None) -> None:
         if "tokens" in response and isinstance(response["tokens"], dict):
             # TODO: Verificar quando o pessoal atualizar a documentação
             user_tokens = response["tokens"].get("user") or 0
@@ -132,6 +382,8 @@ class StackSpotAgent:
             enrichment_tokens = response["tokens"].get("enrichment") or 0
             output_tokens = response["tokens"].get("output") or 0
 
+            if stats is not None:
+                stats.tokens += user_tokens + input_token + enrichment_tokens + output_tokens
             await self._update_token_sensors(user_tokens + input_token, enrichment_tokens, output_tokens)
         else:
             _LOGGER.debug("Resposta da StackSpot AI sem dados de tokens.")
@@ -155,6 +407,14 @@ class StackSpotAgent:
         except Exception:
             _LOGGER.error('Erro ao processar tokens')
 
+    def _update_prompt_size_sensor(self, prompt: str) -> None:
+        sensor = self.manager.get_entity_by(self.config.subentry_id, SENSOR_PROMPT_SIZE)
+        if not isinstance(sensor, PromptSizeSensor):
+            return
+
+        history_messages, history_tokens = self._last_history_size
+        sensor.update_prompt_size(estimate_tokens(prompt), len(prompt.encode()), history_messages, history_tokens)
+
     def _get_sensor_by(self, key: str, config_id='sub-entry') -> Optional[TokenSensor]:
         if config_id == 'sub-entry':
             config_id = self.config.subentry_id
@@ -166,38 +426,79 @@ class StackSpotAgent:
         return entity
 
     async def _get_history(self, conversation_id: str) -> str:
-        ctx: ContextValue = self._history[conversation_id]
-        messages: list[dict] = ctx.get_history()
+        ctx: ContextValue | None = self._history.get((self.config.subentry_id, conversation_id))
+        messages: list[dict] = ctx.get_history(self.config.history_token_budget) if ctx is not None else []
+        history = to_compact_json(messages)
+
+        selected = len(messages) - (1 if ctx is not None and ctx.summary else 0)
+        if ctx is not None and selected < len(ctx.messages):
+            _LOGGER.debug(f'[{self.config.agent_name}] HISTORY - {selected} of {len(ctx.messages)} messages '
+                          f'within {self.config.history_token_budget} tokens')
+        self._last_history_size = (selected, estimate_tokens(history))
 
-        return f"<history>\n{json.dumps(messages, indent=2, ensure_ascii=False)}\n</history>"
+        return f"<history>\n{history}\n</history>"
 
     async def _add_message(self, conversation_id: str, role: MessageRole, content: str):
-        ctx: ContextValue = self._history.setdefault(conversation_id, ContextValue())
-        ctx.add_message(role, content)
-        ctx.trim(self.config.max_messages_history)
+        ctx: ContextValue = await self._history.async_add_message(
+            (self.config.subentry_id, conversation_id), role, content, self.config.max_messages_history
+        )
         _LOGGER.debug(
             f'[{self.config.agent_name}] HISTORY - context message: {len(ctx.messages)} of {self.config.max_messages_history}')
-        _LOGGER.debug(f'[{self.config.agent_name}] HISTORY - all conversations: {self._history.keys()}')
+        _LOGGER.debug(
+            f'[{self.config.agent_name}] HISTORY - all conversations: {self._history.size} ({self._history.bytes} bytes)')
 
-        await self._cleanup()
+    def _schedule_history_summary(self, conversation_id: str) -> None:
+        """Resume em background as mensagens antigas quando o histórico passa do limite, o turno não espera."""
+        key = (self.config.subentry_id, conversation_id)
+        ctx: ContextValue | None = self._history.get(key)
+        if ctx is None or key in self._summarizing:
+            return
 
-    async def _cleanup(self):
-        now = datetime.now(UTC)
-        for cid, ctx in list(self._history.items()):
-            if (now - ctx.last_interaction).total_seconds() > SECONDS_KEEP_CONVERSATION_HISTORY:
-                del self._history[cid]
-                _LOGGER.debug(f'Conversation {cid} deleted!')
+        folded = ctx.messages_to_fold(self.config.history_token_budget)
+        if not folded:
+            return
 
-    async def _get_system_prompt(self, variables: dict[str: any]) -> str:
-        render = await render_template(self.hass, self.config.prompt, variables)
-        return f"<system_prompt>\n{str(render)}\n</system_prompt>"
+        self._summarizing.add(key)
+        self.hass.async_create_background_task(
+            self._summarize_history(key, ctx.summary, folded), f'stackspot-history-summary-{conversation_id}'
+        )
 
-    async def _get_final_prompt(self, user_input: ConversationInput) -> str:
-        user: str = await get_username_by_conversation_input(self.hass, user_input)
+    async def _summarize_history(self, key: ConversationKey, summary: str | None, folded: list[Message]) -> None:
+        try:
+            history = to_compact_json([{"role": msg.role.value, "content": msg.content} for msg in folded])
+            prompt = HISTORY_SUMMARY_PROMPT.format(summary=summary or '', history=history)
 
-        system_prompt: str = await self._get_system_prompt({TEMPLATE_KEY_USER: user})
-        history_prompt: str = await self._get_history(user_input.conversation_id)
+            access_token = await self._get_access_token()
+            if not access_token:
+                return
+
+            async with self._scheduler.slot(RequestPriority.AI_TASK):
+                response = await self._api.send_prompt(access_token, self.config.agent_id, prompt)
+            if response.get('error', False) or not response.get('message'):
+                _LOGGER.warning(f'[{self.config.agent_name}] HISTORY - summary failed, will retry on the next turn')
+                return
+
+            await self._actions_with_response(response)
+            self._history.async_apply_summary(key, response['message'], folded)
+            _LOGGER.debug(f'[{self.config.agent_name}] HISTORY - {len(folded)} messages folded into the summary')
+        finally:
+            self._summarizing.discard(key)
+
+    async def _get_system_prompt(self, variables: dict[str: any]) -> str:
+        await async_wait_variables_ready(self.hass)
+        prompt_cache: PromptRenderCache = self.manager.get_object_by(PROMPT_CACHE)
+        render = await prompt_cache.async_render(self.config.subentry_id, self.config.prompt, variables)
+        return f"<system_prompt>\n{render}\n</system_prompt>"
+
+    async def _get_final_prompt(self, conversation_id: str, system_prompt: str) -> str:
+        history_prompt: str = await self._get_history(conversation_id)
 
         if self.config.allow_control:
             return f'{system_prompt}\n\n{str(history_prompt)} \n{PROMPT_TOOLS}'
         return f'{system_prompt}\n\n{str(history_prompt)}'
+
+
+def _tool_call_start(text: str) -> int | None:
+    """Posição do primeiro caractere que pode iniciar uma tool call (JSON ou bloco de código)."""
+    positions = [position for position in (text.find(prefix) for prefix in _TOOL_CALL_PREFIXES) if position >= 0]
+    return min(positions) if positions else None
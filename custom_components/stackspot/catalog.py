@@ -0,0 +1,357 @@
+import logging
+import sys
+from abc import abstractmethod
+from pathlib import Path
+from typing import Callable, Iterable, Iterator
+
+import yaml
+from homeassistant.const import EVENT_SERVICE_REGISTERED, EVENT_SERVICE_REMOVED, ATTR_DOMAIN, ATTR_SERVICE
+from homeassistant.core import HomeAssistant, CALLBACK_TYPE, Event, callback
+from homeassistant.helpers import device_registry, entity_registry
+
+try:
+    from yaml import CSafeLoader as _YamlLoader
+except ImportError:
+    from yaml import SafeLoader as _YamlLoader
+
+_LOGGER = logging.getLogger(__name__)
+
+
+class CatalogView(list):
+    """
+    Lista de um catálogo entregue aos templates (materializada uma vez por versão),
+    com filtros que percorrem os itens sem copiar a lista inteira.
+    É uma lista de verdade (e não um iterável preguiçoso) porque o tojson serializa a lista diretamente.
+    Ex.: {{ exposed_entities.by_label('label_name') | list | tojson }}
+    """
+
+    def by_label(self, label: str) -> Iterator[dict]:
+        return (item for item in self if label in (item.get('labels') or ()))
+
+    def by_domain(self, domain: str) -> Iterator[dict]:
+        return (item for item in self if _item_domain(item) == domain)
+
+    def by_area(self, area_id: str) -> Iterator[dict]:
+        return (item for item in self if item.get('area_id') == area_id)
+
+
+class Catalog:
+    """
+    Base dos catálogos entregues como variáveis de template.
+    Cada alteração incrementa a versão, usada pelos consumidores para invalidar caches.
+    """
+
+    def __init__(self, hass: HomeAssistant) -> None:
+        self.hass = hass
+        self.version: int = 0
+        self._list_cache: CatalogView | None = None
+        self._unsubs: list[CALLBACK_TYPE] = []
+        self._listeners: list[Callable[[], None]] = []
+
+    def as_list(self) -> CatalogView:
+        """Lista materializada uma única vez por versão, quando um template referencia a variável."""
+        if self._list_cache is None:
+            self._list_cache = CatalogView(self._items())
+        return self._list_cache
+
+    @abstractmethod
+    def _items(self) -> Iterable[dict]:
+        raise NotImplementedError
+
+    @callback
+    def async_add_listener(self, listener: Callable[[], None]) -> CALLBACK_TYPE:
+        """Registra um callback chamado a cada nova versão do catálogo."""
+        self._listeners.append(listener)
+
+        @callback
+        def remove_listener() -> None:
+            if listener in self._listeners:
+                self._listeners.remove(listener)
+
+        return remove_listener
+
+    @callback
+    def async_stop(self) -> None:
+        for unsub in self._unsubs:
+            unsub()
+        self._unsubs.clear()
+
+    @callback
+    def _async_changed(self) -> None:
+        self.version += 1
+        self._list_cache = None
+        for listener in list(self._listeners):
+            listener()
+
+
+class ExposedEntityIndex(Catalog):
+    """
+    Índice das entidades expostas ao assist, mantido pelos eventos do entity registry
+    (a configuração de exposição fica nas options da entidade no registry).
+    """
+
+    def __init__(self, hass: HomeAssistant) -> None:
+        super().__init__(hass)
+        self._entities: dict[str, dict] = {}
+
+    @callback
+    def async_start(self) -> None:
+        registry = entity_registry.async_get(self.hass)
+        devices = device_registry.async_get(self.hass)
+        for entry in registry.entities.values():
+            if _is_exposed(entry):
+                self._entities[entry.entity_id] = _exposed_entity_dict(entry, devices)
+
+        self._unsubs.append(
+            self.hass.bus.async_listen(entity_registry.EVENT_ENTITY_REGISTRY_UPDATED, self._async_registry_updated)
+        )
+        self._unsubs.append(
+            self.hass.bus.async_listen(device_registry.EVENT_DEVICE_REGISTRY_UPDATED, self._async_device_updated)
+        )
+        self._async_changed()
+        _LOGGER.info(f'Expose entities index created with {len(self._entities)} entities!')
+
+    def _items(self) -> Iterable[dict]:
+        return self._entities.values()
+
+    @callback
+    def _async_registry_updated(self, event: Event) -> None:
+        entity_id: str = event.data['entity_id']
+        changed = False
+
+        old_entity_id = event.data.get('old_entity_id')
+        if old_entity_id is not None and self._entities.pop(old_entity_id, None) is not None:
+            changed = True
+
+        entry = entity_registry.async_get(self.hass).async_get(entity_id)
+        if entry is not None and _is_exposed(entry):
+            entity = _exposed_entity_dict(entry, device_registry.async_get(self.hass))
+            if self._entities.get(entity_id) != entity:
+                self._entities[entity_id] = entity
+                changed = True
+        elif self._entities.pop(entity_id, None) is not None:
+            changed = True
+
+        if changed:
+            _LOGGER.debug(f'Expose entities index updated by {entity_id} ({event.data["action"]})')
+            self._async_changed()
+
+    @callback
+    def _async_device_updated(self, event: Event) -> None:
+        """A área de uma entidade sem área própria vem do device."""
+        if event.data['action'] != 'update' or 'area_id' not in event.data.get('changes', {}):
+            return
+
+        registry = entity_registry.async_get(self.hass)
+        devices = device_registry.async_get(self.hass)
+        changed = False
+        for entry in entity_registry.async_entries_for_device(registry, event.data['device_id']):
+            if entry.entity_id not in self._entities:
+                continue
+            entity = _exposed_entity_dict(entry, devices)
+            if self._entities[entry.entity_id] != entity:
+                self._entities[entry.entity_id] = entity
+                changed = True
+
+        if changed:
+            self._async_changed()
+
+
+class ScriptCatalog(Catalog):
+    """
+    Scripts lidos do scripts.yaml. O arquivo só é relido (fora do event loop) quando mtime ou tamanho mudam,
+    aliases e labels vêm do entity registry e são atualizados pelos eventos dele.
+    """
+
+    def __init__(self, hass: HomeAssistant) -> None:
+        super().__init__(hass)
+        self._file_key: tuple[float, int] | None = None
+        self._scripts_data: dict = {}
+        self._scripts: list[dict] = []
+
+    async def async_start(self) -> None:
+        await self.async_refresh()
+        self._unsubs.append(
+            self.hass.bus.async_listen(
+                entity_registry.EVENT_ENTITY_REGISTRY_UPDATED,
+                self._async_registry_updated,
+                event_filter=_is_script_event,
+            )
+        )
+
+    async def async_refresh(self) -> None:
+        """Relê o scripts.yaml caso ele tenha mudado desde a última leitura."""
+        scripts_file = Path(self.hass.config.config_dir) / "scripts.yaml"
+
+        try:
+            result = await self.hass.async_add_executor_job(_read_scripts_file, scripts_file, self._file_key)
+        except Exception as e:
+            _LOGGER.error(f"Error reading scripts.yaml: {e}")
+            return
+
+        if result is None:
+            return
+
+        # Com um arquivo inválido a última lista válida é mantida até o arquivo mudar de novo
+        self._file_key, scripts_data = result
+        if not isinstance(scripts_data, dict):
+            _LOGGER.error(f"Error reading scripts.yaml: expected scripts by id, found {type(scripts_data).__name__}")
+            return
+
+        previous_data = self._scripts_data
+        self._scripts_data = scripts_data
+        if not self._async_build():
+            self._scripts_data = previous_data
+            return
+        _LOGGER.info(f'Scripts from YAML loaded! Found {len(self._scripts)} scripts.')
+
+    def _items(self) -> Iterable[dict]:
+        return self._scripts
+
+    @callback
+    def _async_registry_updated(self, event: Event) -> None:
+        script_id = event.data['entity_id'].removeprefix('script.')
+        if script_id in self._scripts_data:
+            self._async_build()
+
+    @callback
+    def _async_build(self) -> bool:
+        """Monta a lista de scripts, em caso de erro a lista anterior é mantida."""
+        registry = entity_registry.async_get(self.hass)
+
+        scripts_list = []
+        try:
+            for script_id, script_config in self._scripts_data.items():
+                if not isinstance(script_config, dict):
+                    continue
+                entity_id = f"script.{script_id}"
+
+                script_dict = {
+                    'entity_id': entity_id,
+                    'name': script_config.get('alias', script_id),
+                    'description': script_config.get('description', ''),
+                    'fields': script_config.get('fields', {}),
+                }
+
+                entry = registry.entities.get(entity_id)
+                if entry is not None:
+                    script_dict['aliases'] = list(entry.aliases)
+                    script_dict['labels'] = entry.as_partial_dict.get('labels', [])
+
+                scripts_list.append(script_dict)
+        except Exception as e:
+            _LOGGER.error(f"Error loading scripts from scripts.yaml: {e}")
+            return False
+
+        self._scripts = scripts_list
+        self._async_changed()
+        return True
+
+
+class ServiceCatalog(Catalog):
+    """
+    Serviços registrados no HA, guardados como tuplas (domain, service) internadas,
+    mantidos pelos eventos de registro/remoção e materializados só quando a variável é lida.
+    """
+
+    # Os scripts já são entregues pela variável scripts
+    _IGNORED_DOMAINS = ('script',)
+
+    def __init__(self, hass: HomeAssistant) -> None:
+        super().__init__(hass)
+        self._services: dict[tuple[str, str], None] = {}
+
+    @callback
+    def async_start(self) -> None:
+        for domain, services in self.hass.services.async_services().items():
+            if domain in self._IGNORED_DOMAINS:
+                continue
+            for service_name in services:
+                self._services[_service_key(domain, service_name)] = None
+
+        self._unsubs.append(self.hass.bus.async_listen(EVENT_SERVICE_REGISTERED, self._async_service_registered))
+        self._unsubs.append(self.hass.bus.async_listen(EVENT_SERVICE_REMOVED, self._async_service_removed))
+        self._async_changed()
+        _LOGGER.info(f'Services catalog created with {len(self._services)} services!')
+
+    def _items(self) -> Iterable[dict]:
+        for domain, service in self._services:
+            yield {
+                "domain": domain,
+                "service": service,
+                "name": f"{domain}.{service}"
+            }
+
+    @callback
+    def _async_service_registered(self, event: Event) -> None:
+        domain = event.data[ATTR_DOMAIN]
+        if domain in self._IGNORED_DOMAINS:
+            return
+
+        key = _service_key(domain, event.data[ATTR_SERVICE])
+        if key not in self._services:
+            self._services[key] = None
+            self._async_changed()
+
+    @callback
+    def _async_service_removed(self, event: Event) -> None:
+        key = (event.data[ATTR_DOMAIN], event.data[ATTR_SERVICE])
+        if key in self._services:
+            del self._services[key]
+            self._async_changed()
+
+
+def _service_key(domain: str, service: str) -> tuple[str, str]:
+    return sys.intern(domain), sys.intern(service)
+
+
+def _read_scripts_file(scripts_file: Path, known_key: tuple[float, int] | None) -> tuple[tuple[float, int], dict] | None:
+    """
+    Executado no executor: retorna None se o arquivo não mudou, senão a nova chave (mtime, tamanho) e o conteúdo.
+    """
+    if not scripts_file.exists():
+        if known_key == (0.0, 0):
+            return None
+        _LOGGER.warning(f"File scripts.yaml not found in {scripts_file}")
+        return (0.0, 0), {}
+
+    stat = scripts_file.stat()
+    file_key = (stat.st_mtime, stat.st_size)
+    if file_key == known_key:
+        return None
+
+    with open(scripts_file, 'r', encoding='utf-8') as file:
+        scripts_data = yaml.load(file, Loader=_YamlLoader) or {}
+
+    return file_key, scripts_data
+
+
+@callback
+def _is_script_event(event_data: dict) -> bool:
+    return event_data['entity_id'].startswith('script.')
+
+
+def _is_exposed(entry: entity_registry.RegistryEntry) -> bool:
+    return entry.options.get('conversation', {}).get('should_expose', False)
+
+
+def _exposed_entity_dict(entry: entity_registry.RegistryEntry, devices: device_registry.DeviceRegistry) -> dict:
+    area_id = entry.area_id
+    if area_id is None and entry.device_id is not None:
+        device = devices.async_get(entry.device_id)
+        area_id = device.area_id if device is not None else None
+
+    return {
+        'entity_id': entry.entity_id,
+        'name': entry.as_partial_dict.get('original_name', ''),
+        'aliases': list(entry.aliases),
+        'labels': entry.as_partial_dict.get('labels', []),
+        'area_id': area_id,
+    }
+
+
+def _item_domain(item: dict) -> str | None:
+    if 'domain' in item:
+        return item['domain']
+    entity_id: str = item.get('entity_id', '')
+    return entity_id.split('.', 1)[0] if entity_id else None
@@ -0,0 +1,144 @@
+import logging
+import random
+import time
+from dataclasses import dataclass
+from email.utils import parsedate_to_datetime
+from enum import StrEnum
+from typing import Callable, Mapping
+
+import aiohttp
+from homeassistant.core import CALLBACK_TYPE, callback
+
+_LOGGER = logging.getLogger(__name__)
+
+# Status em que a requisição é repetida (limite de taxa e indisponibilidade do upstream)
+RETRY_STATUSES = frozenset({429, 500, 502, 503, 504})
+# Em requisições não idempotentes (POST) só são repetidos os status em que o servidor recusou a requisição
+NON_IDEMPOTENT_RETRY_STATUSES = frozenset({429, 503})
+# Erros em que a conexão nem foi estabelecida, a requisição não chegou ao servidor
+CONNECTION_ERRORS = (aiohttp.ClientConnectorError, aiohttp.ConnectionTimeoutError)
+# Um Retry-After maior que isso não é aguardado, a falha volta para quem chamou
+MAX_RETRY_AFTER_SECONDS = 30
+
+
+@dataclass(frozen=True)
+class RetryPolicy:
+    """
+    Timeout por tentativa e backoff exponencial com jitter entre as tentativas.
+    Uma requisição não idempotente (idempotent=False) pode ter sido processada pelo servidor mesmo sem resposta,
+    por isso só é repetida quando a conexão falhou ou o servidor a recusou (429 e 503).
+    """
+    timeout: float
+    attempts: int = 3
+    base_delay: float = 0.5
+    max_delay: float = 8.0
+    idempotent: bool = True
+
+    def retry_error(self, error: BaseException) -> bool:
+        return self.idempotent or isinstance(error, CONNECTION_ERRORS)
+
+    def retry_status(self, status: int) -> bool:
+        return status in (RETRY_STATUSES if self.idempotent else NON_IDEMPOTENT_RETRY_STATUSES)
+
+    def delay(self, attempt: int, retry_after: float | None = None) -> float:
+        """Espera antes da próxima tentativa, o Retry-After do servidor tem precedência sobre o backoff."""
+        if retry_after is not None:
+            return retry_after
+        return random.uniform(0, min(self.max_delay, self.base_delay * 2 ** (attempt - 1)))
+
+
+class CircuitState(StrEnum):
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half_open'
+
+
+class CircuitOpenError(Exception):
+    """O circuit breaker do host está aberto, a requisição nem é enviada."""
+
+
+class CircuitBreaker:
+    """
+    Abre após failure_threshold falhas seguidas de um host e falha rápido por reset_timeout segundos.
+    Depois disso uma única requisição de teste (half open) decide se o circuito fecha ou abre de novo.
+    """
+
+    def __init__(self, name: str, failure_threshold: int = 5, reset_timeout: float = 30) -> None:
+        self.name = name
+        self._failure_threshold = failure_threshold
+        self._reset_timeout = reset_timeout
+        self._opened_at: float = 0.0
+        self._probe_in_flight = False
+        self._listeners: list[Callable[[], None]] = []
+
+        self.state: CircuitState = CircuitState.CLOSED
+        self.consecutive_failures: int = 0
+        self.open_count: int = 0
+
+    def allow(self) -> bool:
+        if self.state == CircuitState.CLOSED:
+            return True
+
+        if self.state == CircuitState.OPEN:
+            if time.monotonic() - self._opened_at < self._reset_timeout:
+                return False
+            self._set_state(CircuitState.HALF_OPEN)
+
+        if self._probe_in_flight:
+            return False
+        self._probe_in_flight = True
+        return True
+
+    def record_success(self) -> None:
+        self.consecutive_failures = 0
+        self._probe_in_flight = False
+        if self.state != CircuitState.CLOSED:
+            _LOGGER.info(f'Circuit breaker {self.name} closed')
+            self._set_state(CircuitState.CLOSED)
+
+    def record_failure(self) -> None:
+        self.consecutive_failures += 1
+        self._probe_in_flight = False
+        if self.state == CircuitState.HALF_OPEN or self.consecutive_failures >= self._failure_threshold:
+            if self.state != CircuitState.OPEN:
+                _LOGGER.warning(f'Circuit breaker {self.name} open after {self.consecutive_failures} failures')
+                self.open_count += 1
+            self._opened_at = time.monotonic()
+            self._set_state(CircuitState.OPEN)
+
+    def release_probe(self) -> None:
+        """A requisição de teste terminou sem resultado (cancelada ou erro inesperado), a próxima testa o host."""
+        self._probe_in_flight = False
+
+    @callback
+    def async_add_listener(self, listener: Callable[[], None]) -> CALLBACK_TYPE:
+        self._listeners.append(listener)
+
+        @callback
+        def remove_listener() -> None:
+            if listener in self._listeners:
+                self._listeners.remove(listener)
+
+        return remove_listener
+
+    def _set_state(self, state: CircuitState) -> None:
+        self.state = state
+        for listener in list(self._listeners):
+            listener()
+
+
+def parse_retry_after(headers: Mapping[str, str]) -> float | None:
+    """Retry-After em segundos ou data HTTP, None quando ausente ou inválido."""
+    value = headers.get('Retry-After')
+    if not value:
+        return None
+
+    try:
+        return max(float(value), 0.0)
+    except ValueError:
+        pass
+
+    try:
+        return max(parsedate_to_datetime(value).timestamp() - time.time(), 0.0)
+    except (TypeError, ValueError):
+        return None
@@ -0,0 +1,143 @@
+import asyncio
+import itertools
+import logging
+import time
+from contextlib import asynccontextmanager
+from dataclasses import dataclass, field
+from enum import IntEnum
+from typing import AsyncIterator, Callable
+
+from homeassistant.core import CALLBACK_TYPE, callback
+
+_LOGGER = logging.getLogger(__name__)
+
+
+class RequestPriority(IntEnum):
+    """Classes de prioridade das chamadas à StackSpot, menor valor é atendido primeiro."""
+    INTERACTIVE = 0
+    AI_TASK = 1
+    KS_SYNC = 2
+
+
+@dataclass
+class _Waiter:
+    priority: RequestPriority
+    sequence: int
+    future: asyncio.Future = field(compare=False)
+
+
+@dataclass
+class RequestClassStats:
+    active: int = 0
+    waiting: int = 0
+    requests: int = 0
+    total_wait_ms: float = 0.0
+    last_wait_ms: float | None = None
+    max_wait_ms: float = 0.0
+
+    @property
+    def average_wait_ms(self) -> float | None:
+        return self.total_wait_ms / self.requests if self.requests else None
+
+
+class RequestScheduler:
+    """
+    Limita as chamadas simultâneas de uma conta à StackSpot.
+    Todas as classes dividem o limite total (a conversa interativa só é limitada por ele),
+    as demais também têm um limite próprio. Quando há fila, a classe de maior prioridade é atendida primeiro.
+    """
+
+    def __init__(self, limit: int, class_limits: dict[RequestPriority, int]) -> None:
+        self._limit = limit
+        self._class_limits = class_limits
+        self._active: int = 0
+        self._waiters: list[_Waiter] = []
+        self._sequence = itertools.count()
+        self._listeners: list[Callable[[], None]] = []
+        self.stats: dict[RequestPriority, RequestClassStats] = {
+            priority: RequestClassStats() for priority in RequestPriority
+        }
+
+    @property
+    def queue_depth(self) -> int:
+        return len(self._waiters)
+
+    @asynccontextmanager
+    async def slot(self, priority: RequestPriority) -> AsyncIterator[None]:
+        """Aguarda uma vaga para a classe e a libera ao sair do bloco."""
+        await self._acquire(priority)
+        try:
+            yield
+        finally:
+            self._release(priority)
+
+    @callback
+    def async_add_listener(self, listener: Callable[[], None]) -> CALLBACK_TYPE:
+        self._listeners.append(listener)
+
+        @callback
+        def remove_listener() -> None:
+            if listener in self._listeners:
+                self._listeners.remove(listener)
+
+        return remove_listener
+
+    async def _acquire(self, priority: RequestPriority) -> None:
+        start = time.perf_counter()
+        stats = self.stats[priority]
+
+        if not any(waiter.priority <= priority for waiter in self._waiters) and self._can_run(priority):
+            self._start(priority)
+        else:
+            waiter = _Waiter(priority, next(self._sequence), asyncio.get_running_loop().create_future())
+            self._waiters.append(waiter)
+            self._waiters.sort(key=lambda item: (item.priority, item.sequence))
+            stats.waiting += 1
+            self._notify_listeners()
+            try:
+                await waiter.future
+            except asyncio.CancelledError:
+                if waiter.future.done() and not waiter.future.cancelled():
+                    # A vaga foi concedida junto com o cancelamento
+                    self._release(priority)
+                else:
+                    self._waiters.remove(waiter)
+                    stats.waiting -= 1
+                    self._notify_listeners()
+                raise
+
+        wait_ms = (time.perf_counter() - start) * 1000
+        stats.requests += 1
+        stats.total_wait_ms += wait_ms
+        stats.last_wait_ms = wait_ms
+        stats.max_wait_ms = max(stats.max_wait_ms, wait_ms)
+        if wait_ms >= 1000:
+            _LOGGER.debug(f'Request {priority.name} waited {wait_ms:.0f} ms for a slot')
+        self._notify_listeners()
+
+    def _release(self, priority: RequestPriority) -> None:
+        self._active -= 1
+        self.stats[priority].active -= 1
+
+        for waiter in list(self._waiters):
+            # Um waiter cancelado sai da fila sozinho ao ser acordado
+            if not waiter.future.done() and self._can_run(waiter.priority):
+                self._waiters.remove(waiter)
+                self.stats[waiter.priority].waiting -= 1
+                self._start(waiter.priority)
+                waiter.future.set_result(None)
+
+        self._notify_listeners()
+
+    def _can_run(self, priority: RequestPriority) -> bool:
+        if self._active >= self._limit:
+            return False
+        return self.stats[priority].active < self._class_limits.get(priority, self._limit)
+
+    def _start(self, priority: RequestPriority) -> None:
+        self._active += 1
+        self.stats[priority].active += 1
+
+    def _notify_listeners(self) -> None:
+        for listener in list(self._listeners):
+            listener()
@@ -1,13 +1,143 @@
+import asyncio
+import json
 import logging
+import time
+from typing import Any, AsyncIterator
+from urllib.parse import urlsplit
 
 import aiohttp
+from homeassistant.util.ssl import get_default_context
+
+from .resilience import (
+    RETRY_STATUSES,
+    MAX_RETRY_AFTER_SECONDS,
+    CircuitBreaker,
+    CircuitOpenError,
+    RetryPolicy,
+    parse_retry_after,
+)
 
 _LOGGER = logging.getLogger(__name__)
 
+# Limites do pool de conexões compartilhado
+CONNECTION_LIMIT = 30
+CONNECTION_LIMIT_PER_HOST = 10
+DNS_CACHE_SECONDS = 300
+KEEPALIVE_SECONDS = 60
+
+INFERENCE_URL = 'https://genai-inference-app.stackspot.com'
+INFERENCE_HOST = urlsplit(INFERENCE_URL).netloc
+
+# Timeout de cada tentativa, a inferência repete menos porque cada tentativa pode gastar tokens.
+# O envio de prompt e de conteúdo para o KS não são idempotentes (uma repetição pode duplicar o efeito)
+TOKEN_POLICY = RetryPolicy(timeout=15)
+INFERENCE_POLICY = RetryPolicy(timeout=60, attempts=2, idempotent=False)
+KS_POLICY = RetryPolicy(timeout=60)
+KS_CONTENT_POLICY = RetryPolicy(timeout=60, idempotent=False)
+WARM_UP_TIMEOUT = 10
+# No streaming o timeout vale para a conexão e para o intervalo entre dois eventos, não para a resposta inteira
+STREAM_TIMEOUT = aiohttp.ClientTimeout(total=None, sock_connect=15, sock_read=60)
+
+_SSE_DONE = object()
+
+
+def create_client_session() -> aiohttp.ClientSession:
+    """
+    Cria a sessão HTTP compartilhada entre agentes, AI tasks e KS.
+    Mantém as conexões vivas (keep-alive) e o cache de DNS para reaproveitar o handshake TLS.
+    """
+    connector = aiohttp.TCPConnector(
+        limit=CONNECTION_LIMIT,
+        limit_per_host=CONNECTION_LIMIT_PER_HOST,
+        ttl_dns_cache=DNS_CACHE_SECONDS,
+        keepalive_timeout=KEEPALIVE_SECONDS,
+        enable_cleanup_closed=True,
+        ssl=get_default_context(),
+    )
+    return aiohttp.ClientSession(connector=connector)
+
 
 class StackSpotApiClient:
-    def __init__(self) -> None:
-        self._session = aiohttp.ClientSession()
+    def __init__(self, session: aiohttp.ClientSession) -> None:
+        self._session = session
+        # Momento (monotonic) da última chamada ao host de inferência
+        self.last_inference_activity: float = 0.0
+        # Um circuit breaker por host da StackSpot
+        self.breakers: dict[str, CircuitBreaker] = {INFERENCE_HOST: CircuitBreaker(INFERENCE_HOST)}
+
+    def breaker_for(self, url: str) -> CircuitBreaker:
+        host = urlsplit(url).netloc
+        if host not in self.breakers:
+            self.breakers[host] = CircuitBreaker(host)
+        return self.breakers[host]
+
+    async def _open(self, method: str, url: str, policy: RetryPolicy,
+                    timeout: aiohttp.ClientTimeout | None = None, **kwargs) -> aiohttp.ClientResponse:
+        """
+        Envia a requisição passando pelo circuit breaker do host, com timeout por tentativa e novas tentativas
+        (backoff com jitter ou Retry-After) em erros de conexão, timeouts, 429 e 5xx.
+        Requisições não idempotentes só são repetidas em falhas ao conectar, 429 e 503 (RetryPolicy.idempotent).
+        Retorna a resposta ainda não lida, quem chama deve liberá-la (async with).
+        """
+        breaker = self.breaker_for(url)
+        if not breaker.allow():
+            raise CircuitOpenError(breaker.name)
+
+        try:
+            return await self._open_with_retry(method, url, policy, breaker, timeout, **kwargs)
+        finally:
+            # Sem resultado (cancelamento, timeout externo ou erro inesperado) a próxima requisição testa o host
+            breaker.release_probe()
+
+    async def _open_with_retry(self, method: str, url: str, policy: RetryPolicy, breaker: CircuitBreaker,
+                               timeout: aiohttp.ClientTimeout | None, **kwargs) -> aiohttp.ClientResponse:
+        timeout = timeout or aiohttp.ClientTimeout(total=policy.timeout)
+        attempt = 0
+        while True:
+            attempt += 1
+            last_attempt = attempt == policy.attempts
+            try:
+                response = await self._session.request(method, url, timeout=timeout, **kwargs)
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                if last_attempt or not policy.retry_error(e):
+                    breaker.record_failure()
+                    raise
+                delay = policy.delay(attempt)
+                _LOGGER.debug(f'{method} {url} failed ({e!r}), attempt {attempt} of {policy.attempts}')
+            else:
+                if response.status not in RETRY_STATUSES:
+                    breaker.record_success()
+                    return response
+
+                retry_after = parse_retry_after(response.headers)
+                if (last_attempt or not policy.retry_status(response.status)
+                        or (retry_after is not None and retry_after > MAX_RETRY_AFTER_SECONDS)):
+                    breaker.record_failure()
+                    return response
+                response.release()
+                delay = policy.delay(attempt, retry_after)
+                _LOGGER.debug(f'{method} {url} returned {response.status}, attempt {attempt} of {policy.attempts}')
+
+            await asyncio.sleep(delay)
+
+    async def _request(self, method: str, url: str, policy: RetryPolicy, **kwargs) -> tuple[int, Any]:
+        """Como _open, retornando o status e o JSON (None em status de erro)."""
+        async with await self._open(method, url, policy, **kwargs) as response:
+            if response.status >= 400:
+                return response.status, None
+            body = await response.read()
+
+        try:
+            return response.status, json.loads(body) if body else None
+        except ValueError:
+            _LOGGER.debug(f"{method} {url} returned a body that is not JSON")
+            return response.status, None
+
+    async def close(self) -> None:
+        """Fecha a sessão HTTP e libera as conexões do pool."""
+        if not self._session.closed:
+            await self._session.close()
+            _LOGGER.debug("StackSpot client session closed.")
 
     async def generate_access_token(self, realm: str, client_id: str, client_key: str) -> dict:
         """Obtém o token de acesso da Stackspot AI."""
@@ -21,47 +151,139 @@ class StackSpotApiClient:
         }
 
         try:
-            async with self._session.post(token_url, headers=headers, data=data) as response:
-                response.raise_for_status()
-                _LOGGER.debug("Token da Stackspot AI obtido com sucesso.")
-                token_data = await response.json()
-                return token_data
-        except aiohttp.ClientError as e:
-            _LOGGER.error(f"Erro ao obter token da Stackspot AI: {e}")
+            status, token_data = await self._request('POST', token_url, TOKEN_POLICY, headers=headers, data=data)
+        except (aiohttp.ClientError, asyncio.TimeoutError, CircuitOpenError) as e:
+            _LOGGER.error(f"Erro ao obter token da Stackspot AI: {e!r}")
+            return {}
+
+        if status >= 400:
+            _LOGGER.error(f"Erro ao obter token da Stackspot AI: status {status}")
             return {}
 
+        _LOGGER.debug("Token da Stackspot AI obtido com sucesso.")
+        return token_data
+
     async def send_prompt(self, access_token: str, agent_id: str, prompt: str) -> dict:
         """Envia o prompt para a Stackspot AI e retorna a resposta."""
 
-        chat_url = f"https://genai-inference-app.stackspot.com/v1/agent/{agent_id}/chat"
-        headers = {
-            "Authorization": f"Bearer {access_token}",
-            "Content-Type": "application/json",
-        }
-        payload = {
-            "streaming": False,
-            "user_prompt": prompt,
-            "stackspot_knowledge": False,
-            "return_ks_in_response": False,
-        }
+        chat_url, headers, payload = self._chat_request(access_token, agent_id, prompt, streaming=False)
+        self.last_inference_activity = time.monotonic()
 
         try:
-            async with self._session.post(chat_url, headers=headers, json=payload) as response:
+            status, data = await self._request('POST', chat_url, INFERENCE_POLICY, headers=headers, json=payload)
+        except CircuitOpenError:
+            _LOGGER.warning("Prompt não enviado, circuit breaker da Stackspot AI aberto")
+            return {
+                'error': True,
+                'circuit_open': True
+            }
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            _LOGGER.error(f"Erro ao enviar prompt para Stackspot AI: {e!r}")
+            return {
+                'error': True
+            }
+
+        if status == 401:
+            _LOGGER.info('Token expirado')
+            return {
+                'error': True,
+                'status': 401
+            }
+        if status >= 400:
+            _LOGGER.error(f"Erro ao enviar prompt para Stackspot AI: status {status}")
+            return {
+                'error': True,
+                'status': status
+            }
+
+        return data
+
+    async def send_prompt_stream(self, access_token: str, agent_id: str, prompt: str) -> AsyncIterator[dict]:
+        """
+        Envia o prompt em modo streaming e retorna os eventos SSE conforme chegam.
+        Cada evento é o JSON de uma linha `data:`, os erros seguem o mesmo formato do send_prompt.
+        """
+
+        chat_url, headers, payload = self._chat_request(access_token, agent_id, prompt, streaming=True)
+        self.last_inference_activity = time.monotonic()
+
+        try:
+            response = await self._open('POST', chat_url, INFERENCE_POLICY, timeout=STREAM_TIMEOUT,
+                                        headers=headers, json=payload)
+        except CircuitOpenError:
+            _LOGGER.warning("Prompt não enviado, circuit breaker da Stackspot AI aberto")
+            yield {
+                'error': True,
+                'circuit_open': True
+            }
+            return
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            _LOGGER.error(f"Erro ao enviar prompt (streaming) para Stackspot AI: {e!r}")
+            yield {
+                'error': True
+            }
+            return
+
+        try:
+            async with response:
                 if response.status == 401:
                     _LOGGER.info('Token expirado')
-                    return {
+                    yield {
                         'error': True,
                         'status': 401
                     }
+                    return
 
                 response.raise_for_status()
-                return await response.json()
-        except aiohttp.ClientError as e:
-            _LOGGER.error(f"Erro ao enviar prompt para Stackspot AI: {e}")
-            return {
+
+                if response.content_type == 'application/json':
+                    yield await response.json()
+                    return
+
+                async for line in response.content:
+                    event = _parse_sse_line(line)
+                    if event is _SSE_DONE:
+                        return
+                    if event is not None:
+                        yield event
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            _LOGGER.error(f"Erro ao enviar prompt (streaming) para Stackspot AI: {e!r}")
+            yield {
                 'error': True
             }
 
+    @staticmethod
+    def _chat_request(access_token: str, agent_id: str, prompt: str, streaming: bool) -> tuple[str, dict, dict]:
+        chat_url = f"{INFERENCE_URL}/v1/agent/{agent_id}/chat"
+        headers = {
+            "Authorization": f"Bearer {access_token}",
+            "Content-Type": "application/json",
+        }
+        if streaming:
+            headers["Accept"] = "text/event-stream"
+
+        payload = {
+            "streaming": streaming,
+            "user_prompt": prompt,
+            "stackspot_knowledge": False,
+            "return_ks_in_response": False,
+        }
+        return chat_url, headers, payload
+
+    async def warm_up(self) -> bool:
+        """
+        Abre (ou reaproveita) uma conexão keep-alive com o host de inferência,
+        pagando DNS, TCP e TLS fora do turno do usuário. Qualquer status HTTP é aceito.
+        """
+        try:
+            async with self._session.head(INFERENCE_URL,
+                                          timeout=aiohttp.ClientTimeout(total=WARM_UP_TIMEOUT)) as response:
+                _LOGGER.debug(f"Warm-up da conexão com {INFERENCE_URL}: {response.status}")
+                return True
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            _LOGGER.warning(f"Erro no warm-up da conexão com a Stackspot AI: {e}")
+            return False
+
     async def create_knowledge_sources(self, access_token: str, name: str, slug: str) -> dict:
         """Cria um knowledge-sources KS"""
 
@@ -79,23 +301,27 @@ class StackSpotApiClient:
         }
 
         try:
-            async with self._session.post(url, headers=headers, json=payload) as response:
-                if response.status == 422:
-                    _LOGGER.debug("KS already created!")
-                    return {
-                        'slug': slug
-                    }
+            status, response_data = await self._request('POST', url, KS_POLICY, headers=headers, json=payload)
+        except (aiohttp.ClientError, asyncio.TimeoutError, CircuitOpenError) as e:
+            _LOGGER.error(f"Erro ao criar KS no Stackspot AI: {e!r}")
+            return {
+                'error': True
+            }
 
-                response.raise_for_status()
-                _LOGGER.debug("KS created!")
-                response_data = await response.json()
-                return response_data
-        except aiohttp.ClientError as e:
-            _LOGGER.error(f"Erro ao criar KS no Stackspot AI: {e}")
+        if status == 422:
+            _LOGGER.debug("KS already created!")
+            return {
+                'slug': slug
+            }
+        if status >= 400:
+            _LOGGER.error(f"Erro ao criar KS no Stackspot AI: status {status}")
             return {
                 'error': True
             }
 
+        _LOGGER.debug("KS created!")
+        return response_data
+
     async def add_content_knowledge_sources(self, access_token: str, slug: str, content: str) -> dict:
         """Cria um knowledge-sources KS"""
 
@@ -109,17 +335,22 @@ class StackSpotApiClient:
         }
 
         try:
-            async with self._session.post(url, headers=headers, json=payload) as response:
-                response.raise_for_status()
-                _LOGGER.debug("KS content added!")
-                response_data = await response.json()
-                return response_data
-        except aiohttp.ClientError as e:
-            _LOGGER.error(f"Erro ao adicionar content no KS no Stackspot AI: {e}")
+            status, response_data = await self._request('POST', url, KS_CONTENT_POLICY, headers=headers, json=payload)
+        except (aiohttp.ClientError, asyncio.TimeoutError, CircuitOpenError) as e:
+            _LOGGER.error(f"Erro ao adicionar content no KS no Stackspot AI: {e!r}")
+            return {
+                'error': True
+            }
+
+        if status >= 400:
+            _LOGGER.error(f"Erro ao adicionar content no KS no Stackspot AI: status {status}")
             return {
                 'error': True
             }
 
+        _LOGGER.debug("KS content added!")
+        return response_data
+
     async def clear_objects_knowledge_sources(self, access_token: str, slug: str):
         url = f'https://data-integration-api.stackspot.com/v1/knowledge-sources/{slug}/objects'
         headers = {
@@ -128,13 +359,65 @@ class StackSpotApiClient:
         }
 
         try:
-            async with self._session.delete(url, headers=headers) as response:
-                response.raise_for_status()
-                _LOGGER.debug("KS objects delete!")
-                response_data = await response.json()
-                return response_data
-        except aiohttp.ClientError as e:
-            _LOGGER.error(f"Erro ao tentar limpar os objetos no KS no Stackspot AI: {e}")
+            status, response_data = await self._request('DELETE', url, KS_POLICY, headers=headers)
+        except (aiohttp.ClientError, asyncio.TimeoutError, CircuitOpenError) as e:
+            _LOGGER.error(f"Erro ao tentar limpar os objetos no KS no Stackspot AI: {e!r}")
             return {
                 'error': True
             }
+
+        if status >= 400:
+            _LOGGER.error(f"Erro ao tentar limpar os objetos no KS no Stackspot AI: status {status}")
+            return {
+                'error': True
+            }
+
+        _LOGGER.debug("KS objects delete!")
+        return response_data
+
+    async def delete_object_knowledge_sources(self, access_token: str, slug: str, object_id: str) -> dict:
+        """Remove um objeto do KS"""
+
+        url = f'https://data-integration-api.stackspot.com/v1/knowledge-sources/{slug}/objects/{object_id}'
+        headers = {
+            "Authorization": f"Bearer {access_token}",
+            "Content-Type": "application/json",
+        }
+
+        try:
+            status, response_data = await self._request('DELETE', url, KS_POLICY, headers=headers)
+        except (aiohttp.ClientError, asyncio.TimeoutError, CircuitOpenError) as e:
+            _LOGGER.error(f"Erro ao remover o objeto {object_id} do KS no Stackspot AI: {e!r}")
+            return {
+                'error': True
+            }
+
+        if status >= 400 and status != 404:
+            _LOGGER.error(f"Erro ao remover o objeto {object_id} do KS no Stackspot AI: status {status}")
+            return {
+                'error': True
+            }
+
+        _LOGGER.debug(f"KS object {object_id} deleted!")
+        return response_data or {}
+
+
+def _parse_sse_line(line: bytes) -> dict | object | None:
+    """Converte uma linha `data: {...}` do SSE em dict, ignorando comentários e linhas vazias."""
+    text = line.decode('utf-8').strip()
+    if not text.startswith('data:'):
+        return None
+
+    data = text[len('data:'):].strip()
+    if not data:
+        return None
+    if data == '[DONE]':
+        return _SSE_DONE
+
+    try:
+        event = json.loads(data)
+    except json.JSONDecodeError:
+        _LOGGER.debug(f"Evento SSE ignorado: {data}")
+        return None
+
+    return event if isinstance(event, dict) else None
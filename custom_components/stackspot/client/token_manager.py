@@ -0,0 +1,142 @@
+import asyncio
+import logging
+import time
+from datetime import datetime
+from typing import Callable
+
+from homeassistant.core import HomeAssistant, CALLBACK_TYPE, callback
+from homeassistant.helpers.event import async_call_later
+
+from .stackspot_client import StackSpotApiClient
+
+_LOGGER = logging.getLogger(__name__)
+
+# Renova o token este tempo antes de expirar
+REFRESH_AHEAD_SECONDS = 60
+
+
+class StackSpotTokenManager:
+    """
+    Cache do token OAuth de uma conta (realm, client_id), compartilhado por agentes, AI tasks e KS.
+    Apenas uma renovação acontece por vez (single-flight) e o token é renovado antes de expirar.
+    """
+
+    def __init__(self, hass: HomeAssistant, api: StackSpotApiClient, realm: str, client_id: str,
+                 client_key: str) -> None:
+        self.hass = hass
+        self._api = api
+        self.realm = realm
+        self.client_id = client_id
+        self._client_key = client_key
+        self._lock = asyncio.Lock()
+        self._access_token: str | None = None
+        self._expires_at: float = 0.0
+        self._used_since_refresh = False
+        self._unsub_refresh: CALLBACK_TYPE | None = None
+        self._listeners: list[Callable[[], None]] = []
+
+        # Métricas
+        self.refresh_count: int = 0
+        self.refresh_errors: int = 0
+        self.last_refresh_latency_ms: float | None = None
+        self.total_refresh_latency_ms: float = 0.0
+        self.last_refresh: datetime | None = None
+
+    @property
+    def average_refresh_latency_ms(self) -> float | None:
+        if self.refresh_count == 0:
+            return None
+        return self.total_refresh_latency_ms / self.refresh_count
+
+    async def async_get_token(self, rejected_token: str | None = None) -> str | None:
+        """
+        Retorna um token válido, renovando apenas quando necessário.
+        rejected_token é o token recusado pela API (401), ele força a renovação caso ainda seja o atual.
+        """
+        self._used_since_refresh = True
+        if self._is_valid(rejected_token):
+            return self._access_token
+
+        async with self._lock:
+            # Outro chamador pode ter renovado enquanto aguardávamos o lock
+            if self._is_valid(rejected_token):
+                return self._access_token
+
+            await self._async_refresh()
+            return self._access_token
+
+    @callback
+    def async_add_listener(self, listener: Callable[[], None]) -> CALLBACK_TYPE:
+        """Registra um callback chamado após cada renovação (usado pelos sensores de métricas)."""
+        self._listeners.append(listener)
+
+        @callback
+        def remove_listener() -> None:
+            if listener in self._listeners:
+                self._listeners.remove(listener)
+
+        return remove_listener
+
+    @callback
+    def async_shutdown(self) -> None:
+        """Cancela a renovação agendada."""
+        if self._unsub_refresh is not None:
+            self._unsub_refresh()
+            self._unsub_refresh = None
+
+    def _is_valid(self, rejected_token: str | None = None) -> bool:
+        if not self._access_token:
+            return False
+        if rejected_token is not None and rejected_token == self._access_token:
+            return False
+        return time.monotonic() < self._expires_at - REFRESH_AHEAD_SECONDS
+
+    async def _async_refresh(self) -> None:
+        start = time.perf_counter()
+        token_data = await self._api.generate_access_token(self.realm, self.client_id, self._client_key)
+        latency_ms = (time.perf_counter() - start) * 1000
+
+        access_token = token_data.get("access_token")
+        expires_in = token_data.get("expires_in")
+        if not access_token or not isinstance(expires_in, (int, float)):
+            self.refresh_errors += 1
+            self._access_token = None
+            _LOGGER.error(f"Erro ao obter token da Stackspot AI para o client {self.client_id}")
+            self._notify_listeners()
+            return
+
+        self._access_token = access_token
+        self._expires_at = time.monotonic() + expires_in
+        self._used_since_refresh = False
+
+        self.refresh_count += 1
+        self.last_refresh_latency_ms = latency_ms
+        self.total_refresh_latency_ms += latency_ms
+        self.last_refresh = datetime.now()
+        _LOGGER.debug(f"Token renovado para o client {self.client_id} em {latency_ms:.0f} ms")
+
+        self._schedule_refresh(expires_in)
+        self._notify_listeners()
+
+    def _schedule_refresh(self, expires_in: float) -> None:
+        """Agenda a renovação antes da expiração, para que ela não fique no caminho do usuário."""
+        self.async_shutdown()
+        delay = max(expires_in - 2 * REFRESH_AHEAD_SECONDS, 0)
+
+        @callback
+        def _refresh_ahead(now: datetime) -> None:
+            self._unsub_refresh = None
+            # Token sem uso desde a última renovação: deixa expirar e renova sob demanda
+            if not self._used_since_refresh:
+                return
+            self.hass.async_create_background_task(self._async_refresh_ahead(), 'stackspot-token-refresh')
+
+        self._unsub_refresh = async_call_later(self.hass, delay, _refresh_ahead)
+
+    async def _async_refresh_ahead(self) -> None:
+        async with self._lock:
+            await self._async_refresh()
+
+    def _notify_listeners(self) -> None:
+        for listener in list(self._listeners):
+            listener()
@@ -30,10 +30,22 @@ from .const import (
     CONF_REALM_DEFAULT,
     CONF_CLIENT_ID,
     CONF_CLIENT_KEY,
+    CONF_WARM_UP,
+    CONF_WARM_UP_DEFAULT,
+    CONF_REQUEST_CONCURRENCY,
+    CONF_REQUEST_CONCURRENCY_DEFAULT,
+    CONF_REQUEST_CONCURRENCY_AI_TASK,
+    CONF_REQUEST_CONCURRENCY_AI_TASK_DEFAULT,
+    CONF_REQUEST_CONCURRENCY_KS,
+    CONF_REQUEST_CONCURRENCY_KS_DEFAULT,
     CONF_AGENT_NAME,
     CONF_AGENT_NAME_DEFAULT,
     CONF_AGENT_ID,
     CONF_AGENT_MAX_MESSAGES_HISTORY,
+    CONF_AGENT_HISTORY_TOKEN_BUDGET,
+    CONF_AGENT_HISTORY_TOKEN_BUDGET_DEFAULT,
+    CONF_AGENT_HISTORY_SUMMARY,
+    CONF_AGENT_HISTORY_SUMMARY_DEFAULT,
     SUBENTRY_AGENT,
     SUBENTRY_AI_TASK,
     CONF_AGENT_PROMPT,
@@ -46,10 +58,26 @@ from .const import (
     CONF_KS_SLUG,
     CONF_KS_INTERVAL_UPDATE,
     CONF_KS_INTERVAL_UPDATE_DEFAULT,
+    CONF_KS_UPDATE_ON_CHANGE,
+    CONF_KS_UPDATE_ON_CHANGE_DEFAULT,
+    CONF_KS_UPDATE_DEBOUNCE,
+    CONF_KS_UPDATE_DEBOUNCE_DEFAULT,
+    CONF_KS_UPDATE_MIN_INTERVAL,
+    CONF_KS_UPDATE_MIN_INTERVAL_DEFAULT,
     CONF_KS_TEMPLATE,
     CONF_KS_TEMPLATE_DEFAULT,
     CONF_AGENT_ALLOW_CONTROL,
     CONF_AGENT_ALLOW_CONTROL_DEFAULT,
+    CONF_AGENT_STREAMING,
+    CONF_AGENT_STREAMING_DEFAULT,
+    CONF_AGENT_CANCEL_STALE_TURN,
+    CONF_AGENT_CANCEL_STALE_TURN_DEFAULT,
+    CONF_AGENT_MAX_TOOL_ITERATIONS,
+    CONF_AGENT_MAX_TOOL_ITERATIONS_DEFAULT,
+    CONF_AGENT_TOOL_LOOP_TIMEOUT,
+    CONF_AGENT_TOOL_LOOP_TIMEOUT_DEFAULT,
+    CONF_AGENT_TOOL_LOOP_TOKEN_BUDGET,
+    CONF_AGENT_TOOL_LOOP_TOKEN_BUDGET_DEFAULT,
     CONF_LLM_MODEL,
     PLACEHOLDER_KS_URL,
     CONF_KS_BASE_URL,
@@ -90,6 +118,10 @@ class StackspotConfigFlow(ConfigFlow, domain=DOMAIN):
                     CONF_REALM: user_input[CONF_REALM],
                     CONF_CLIENT_ID: user_input[CONF_CLIENT_ID],
                     CONF_CLIENT_KEY: user_input[CONF_CLIENT_KEY],
+                    CONF_WARM_UP: user_input[CONF_WARM_UP],
+                    CONF_REQUEST_CONCURRENCY: user_input[CONF_REQUEST_CONCURRENCY],
+                    CONF_REQUEST_CONCURRENCY_AI_TASK: user_input[CONF_REQUEST_CONCURRENCY_AI_TASK],
+                    CONF_REQUEST_CONCURRENCY_KS: user_input[CONF_REQUEST_CONCURRENCY_KS],
                 }
             )
 
@@ -98,6 +130,8 @@ class StackspotConfigFlow(ConfigFlow, domain=DOMAIN):
             vol.Required(CONF_REALM, default=CONF_REALM_DEFAULT): str,
             vol.Required(CONF_CLIENT_ID): str,
             vol.Required(CONF_CLIENT_KEY): str,
+            vol.Required(CONF_WARM_UP, default=CONF_WARM_UP_DEFAULT): BooleanSelector(),
+            **_get_schema_request_concurrency(),
         })
 
         return self.async_show_form(
@@ -130,6 +164,10 @@ class StackspotOptionsFlowHandler(OptionsFlow):
                     CONF_REALM: user_input[CONF_REALM],
                     CONF_CLIENT_ID: user_input[CONF_CLIENT_ID],
                     CONF_CLIENT_KEY: user_input[CONF_CLIENT_KEY],
+                    CONF_WARM_UP: user_input[CONF_WARM_UP],
+                    CONF_REQUEST_CONCURRENCY: user_input[CONF_REQUEST_CONCURRENCY],
+                    CONF_REQUEST_CONCURRENCY_AI_TASK: user_input[CONF_REQUEST_CONCURRENCY_AI_TASK],
+                    CONF_REQUEST_CONCURRENCY_KS: user_input[CONF_REQUEST_CONCURRENCY_KS],
                 },
             )
 
@@ -146,7 +184,9 @@ class StackspotOptionsFlowHandler(OptionsFlow):
                 vol.Required(CONF_ACCOUNT): str,
                 vol.Required(CONF_REALM): str,
                 vol.Required(CONF_CLIENT_ID): str,
-                vol.Required(CONF_CLIENT_KEY): str
+                vol.Required(CONF_CLIENT_KEY): str,
+                vol.Required(CONF_WARM_UP, default=CONF_WARM_UP_DEFAULT): BooleanSelector(),
+                **_get_schema_request_concurrency(),
             }),
             current_data
         )
@@ -160,10 +200,30 @@ class StackspotOptionsFlowHandler(OptionsFlow):
         )
 
 
+def _get_schema_request_concurrency() -> dict:
+    def concurrency_selector() -> NumberSelector:
+        return NumberSelector(NumberSelectorConfig(min=1, max=10, step=1, mode=NumberSelectorMode.BOX))
+
+    return {
+        vol.Required(CONF_REQUEST_CONCURRENCY, default=CONF_REQUEST_CONCURRENCY_DEFAULT): concurrency_selector(),
+        vol.Required(CONF_REQUEST_CONCURRENCY_AI_TASK,
+                     default=CONF_REQUEST_CONCURRENCY_AI_TASK_DEFAULT): concurrency_selector(),
+        vol.Required(CONF_REQUEST_CONCURRENCY_KS, default=CONF_REQUEST_CONCURRENCY_KS_DEFAULT): concurrency_selector(),
+    }
+
+
 def _get_schema_subentry_agent() -> vol.Schema:
     max_message = vol.Required(CONF_AGENT_MAX_MESSAGES_HISTORY, default=10)
+    history_token_budget = vol.Required(CONF_AGENT_HISTORY_TOKEN_BUDGET, default=CONF_AGENT_HISTORY_TOKEN_BUDGET_DEFAULT)
+    history_summary = vol.Required(CONF_AGENT_HISTORY_SUMMARY, default=CONF_AGENT_HISTORY_SUMMARY_DEFAULT)
     prompt = vol.Optional(CONF_AGENT_PROMPT, default=CONF_AGENT_PROMPT_DEFAULT)
     allow_control = vol.Required(CONF_AGENT_ALLOW_CONTROL, default=CONF_AGENT_ALLOW_CONTROL_DEFAULT)
+    streaming = vol.Required(CONF_AGENT_STREAMING, default=CONF_AGENT_STREAMING_DEFAULT)
+    cancel_stale_turn = vol.Required(CONF_AGENT_CANCEL_STALE_TURN, default=CONF_AGENT_CANCEL_STALE_TURN_DEFAULT)
+    max_tool_iterations = vol.Required(CONF_AGENT_MAX_TOOL_ITERATIONS, default=CONF_AGENT_MAX_TOOL_ITERATIONS_DEFAULT)
+    tool_loop_timeout = vol.Required(CONF_AGENT_TOOL_LOOP_TIMEOUT, default=CONF_AGENT_TOOL_LOOP_TIMEOUT_DEFAULT)
+    tool_loop_token_budget = vol.Required(CONF_AGENT_TOOL_LOOP_TOKEN_BUDGET,
+                                          default=CONF_AGENT_TOOL_LOOP_TOKEN_BUDGET_DEFAULT)
 
     return vol.Schema({
         vol.Required(CONF_AGENT_NAME, default=CONF_AGENT_NAME_DEFAULT): str,
@@ -171,7 +231,22 @@ def _get_schema_subentry_agent() -> vol.Schema:
         max_message: NumberSelector(
             NumberSelectorConfig(min=2, max=100, step=2, mode=NumberSelectorMode.SLIDER)
         ),
+        history_token_budget: NumberSelector(
+            NumberSelectorConfig(min=0, step=100, unit_of_measurement='tokens', mode=NumberSelectorMode.BOX)
+        ),
+        history_summary: BooleanSelector(),
         allow_control: BooleanSelector(),
+        max_tool_iterations: NumberSelector(
+            NumberSelectorConfig(min=1, max=20, step=1, mode=NumberSelectorMode.SLIDER)
+        ),
+        tool_loop_timeout: NumberSelector(
+            NumberSelectorConfig(min=0, max=600, step=5, unit_of_measurement='s', mode=NumberSelectorMode.BOX)
+        ),
+        tool_loop_token_budget: NumberSelector(
+            NumberSelectorConfig(min=0, step=100, unit_of_measurement='tokens', mode=NumberSelectorMode.BOX)
+        ),
+        streaming: BooleanSelector(),
+        cancel_stale_turn: BooleanSelector(),
         prompt: TemplateSelector(),
         vol.Optional(CONF_LLM_MODEL): str,
     })
@@ -194,7 +269,10 @@ def _get_schema_subentry_ks() -> vol.Schema:
         vol.Required(CONF_KS_TEMPLATE, default=CONF_KS_TEMPLATE_DEFAULT): TemplateSelector(),
         vol.Required(CONF_KS_INTERVAL_UPDATE, default=CONF_KS_INTERVAL_UPDATE_DEFAULT): DurationSelector(
             DurationSelectorConfig(enable_day=True)
-        )
+        ),
+        vol.Required(CONF_KS_UPDATE_ON_CHANGE, default=CONF_KS_UPDATE_ON_CHANGE_DEFAULT): BooleanSelector(),
+        vol.Required(CONF_KS_UPDATE_DEBOUNCE, default=CONF_KS_UPDATE_DEBOUNCE_DEFAULT): DurationSelector(),
+        vol.Required(CONF_KS_UPDATE_MIN_INTERVAL, default=CONF_KS_UPDATE_MIN_INTERVAL_DEFAULT): DurationSelector(),
     })
 
 
@@ -3,6 +3,17 @@ from homeassistant.helpers import llm
 INTEGRATION_NAME = 'StackSpot AI'
 DOMAIN = 'stackspot'
 MANAGER = 'key-manager'
+API_CLIENT = 'api-client'
+API_CLIENT_CLOSE = 'api-client-close'
+TOKEN_MANAGER = 'token-manager'
+WARM_UP = 'warm-up'
+PROMPT_CACHE = 'prompt-cache'
+CONVERSATION_STORE = 'conversation-store'
+REQUEST_SCHEDULER = 'request-scheduler'
+KS_SYNC_STATE = 'ks-sync-state'
+KS_UPDATER = 'ks-updater'
+VARIABLES_READY = 'variables-ready'
+JOB_SCHEDULER = 'job-scheduler'
 
 # CONF
 CONF_ACCOUNT = 'account_name'
@@ -11,6 +22,15 @@ CONF_REALM = 'realm'
 CONF_REALM_DEFAULT = 'stackspot-freemium'
 CONF_CLIENT_ID = 'client_id'
 CONF_CLIENT_KEY = 'client_key'
+CONF_WARM_UP = 'warm_up'
+CONF_WARM_UP_DEFAULT = False
+# Chamadas simultâneas à StackSpot por conta (total) e das classes em background
+CONF_REQUEST_CONCURRENCY = 'request_concurrency'
+CONF_REQUEST_CONCURRENCY_DEFAULT = 4
+CONF_REQUEST_CONCURRENCY_AI_TASK = 'request_concurrency_ai_task'
+CONF_REQUEST_CONCURRENCY_AI_TASK_DEFAULT = 2
+CONF_REQUEST_CONCURRENCY_KS = 'request_concurrency_ks'
+CONF_REQUEST_CONCURRENCY_KS_DEFAULT = 2
 
 # SHARED CONF
 CONF_LLM_MODEL = 'llm_model'
@@ -21,8 +41,22 @@ CONF_AGENT_ID = 'agent_id'
 # CONF AGENT
 CONF_AGENT_NAME_DEFAULT = 'Agent'
 CONF_AGENT_MAX_MESSAGES_HISTORY = "max_messages_history"
+CONF_AGENT_HISTORY_TOKEN_BUDGET = 'history_token_budget'
+CONF_AGENT_HISTORY_TOKEN_BUDGET_DEFAULT = 0
+CONF_AGENT_HISTORY_SUMMARY = 'history_summary'
+CONF_AGENT_HISTORY_SUMMARY_DEFAULT = False
 CONF_AGENT_ALLOW_CONTROL = 'allow_control'
 CONF_AGENT_ALLOW_CONTROL_DEFAULT = False
+CONF_AGENT_STREAMING = 'streaming'
+CONF_AGENT_STREAMING_DEFAULT = False
+CONF_AGENT_CANCEL_STALE_TURN = 'cancel_stale_turn'
+CONF_AGENT_CANCEL_STALE_TURN_DEFAULT = False
+CONF_AGENT_MAX_TOOL_ITERATIONS = 'max_tool_iterations'
+CONF_AGENT_MAX_TOOL_ITERATIONS_DEFAULT = 5
+CONF_AGENT_TOOL_LOOP_TIMEOUT = 'tool_loop_timeout'
+CONF_AGENT_TOOL_LOOP_TIMEOUT_DEFAULT = 60
+CONF_AGENT_TOOL_LOOP_TOKEN_BUDGET = 'tool_loop_token_budget'
+CONF_AGENT_TOOL_LOOP_TOKEN_BUDGET_DEFAULT = 0
 CONF_AGENT_PROMPT_DEFAULT = (
         llm.DATE_TIME_PROMPT
         + '\n'
@@ -51,18 +85,27 @@ CONF_KS_NAME_DEFAULT = 'HA: Entities'
 CONF_KS_SLUG = 'ks_slug'
 CONF_KS_TEMPLATE = 'ks_template'
 CONF_KS_TEMPLATE_DEFAULT = (
-    '{## The variables [all_variables, exposed_entities, scripts, services, ...] are provided by the integration. ##}'
+    '{## The variables [all_variables, exposed_entities, scripts, services, ...] '
+    'and the functions [to_table, to_compact_json] are provided by the integration. ##}'
     '\n\n'
-    'All available values: {{ all_variables | tojson(indent=2) }}'
+    'All available values: {{ to_compact_json(all_variables) }}'
     '\n\n'
-    '{{ exposed_entities | selectattr("labels", "contains", "label_name") | list | tojson(indent=2) }}'
+    '{{ to_table(exposed_entities.by_label("label_name")) }}'
     '\n\n'
-    '{{ scripts | selectattr("labels", "contains", "label_name") | list | tojson(indent=2) }}'
+    '{{ to_table(scripts.by_label("label_name")) }}'
     '\n\n'
-    '{{ services | selectattr("domain", "equalto", "homeassistant") | list | tojson(indent=2) }}'
+    '{{ to_table(services.by_domain("homeassistant")) }}'
 )
 CONF_KS_INTERVAL_UPDATE = 'interval_update'
 CONF_KS_INTERVAL_UPDATE_DEFAULT = {'days': 0, 'hours': 48, 'minutes': 0, 'seconds': 0}
+CONF_KS_UPDATE_ON_CHANGE = 'update_on_change'
+CONF_KS_UPDATE_ON_CHANGE_DEFAULT = False
+CONF_KS_UPDATE_DEBOUNCE = 'update_debounce'
+CONF_KS_UPDATE_DEBOUNCE_DEFAULT = {'hours': 0, 'minutes': 1, 'seconds': 0}
+CONF_KS_UPDATE_MIN_INTERVAL = 'update_min_interval'
+CONF_KS_UPDATE_MIN_INTERVAL_DEFAULT = {'hours': 0, 'minutes': 15, 'seconds': 0}
+# Tamanho máximo de cada objeto enviado ao KS
+KS_CHUNK_MAX_CHARS = 8000
 
 # CONF OPTIONS
 # CONF_HA_ENTITIES_ACCESS = "ha_entities_access"
@@ -80,9 +123,20 @@ SENSOR_USER_TOKEN = 'user_tokens'
 SENSOR_ENRICHMENT_TOKEN = 'enrichment_tokens'
 SENSOR_OUTPUT_TOKEN = 'output_tokens'
 SENSOR_KS_LAST_UPDATE = 'ks_last_update'
+SENSOR_TOKEN_REFRESH = 'token_refresh'
+SENSOR_WARM_UP = 'warm_up_duration'
+SENSOR_PROMPT_CACHE = 'prompt_cache'
+SENSOR_PROMPT_SIZE = 'prompt_size'
+SENSOR_REQUEST_QUEUE = 'request_queue'
+SENSOR_REQUEST_WAIT = 'request_wait'
+SENSOR_CIRCUIT_BREAKER = 'circuit_breaker'
 
 # CONTEXT
 SECONDS_KEEP_CONVERSATION_HISTORY = 3600
+# Limite de memória do histórico de todas as conversas, as menos usadas são descartadas
+CONVERSATION_HISTORY_MAX_BYTES = 4 * 1024 * 1024
+# Tempo máximo que um agente aguarda as variáveis serem carregadas (em background após o start do HA)
+VARIABLES_READY_TIMEOUT = 10
 
 SELECT_RESET_INTERVAL_ENTITY = "token_reset_interval_select"
 
@@ -99,3 +153,7 @@ TEMPLATE_KEY_TOOLS_PROMPT = 'tools_prompt'
 TEMPLATE_KEY_ALL_VARIABLES = 'all_variables'
 TEMPLATE_KEY_SERVICES = 'services'
 TEMPLATE_KEY_SCRIPTS = 'scripts'
+
+# Template functions
+TEMPLATE_FUNCTION_TO_TABLE = 'to_table'
+TEMPLATE_FUNCTION_TO_COMPACT_JSON = 'to_compact_json'
@@ -1,7 +1,13 @@
 import logging
 from typing import Literal
 
-from homeassistant.components.conversation import ConversationEntity, ConversationInput, ConversationResult
+from homeassistant.components.conversation import (
+    ChatLog,
+    ConversationEntity,
+    ConversationInput,
+    ConversationResult,
+    async_get_result_from_chat_log,
+)
 from homeassistant.config_entries import ConfigEntry
 from homeassistant.core import HomeAssistant
 from homeassistant.helpers.entity_platform import AddConfigEntryEntitiesCallback
@@ -42,13 +48,15 @@ class StackSpotConversationEntity(ConversationEntity):
         self._agent_instance = agent_instance
         self._attr_unique_id = f'stackspot_conversation_{config.config_id}'
         self._attr_device_info = get_device_info_agent(config)
+        self._attr_supports_streaming = agent_instance.config.streaming
 
     @property
     def supported_languages(self) -> list[str] | Literal["*"]:
         return '*'
 
-    async def async_process(self, user_input: ConversationInput) -> ConversationResult:
+    async def _async_handle_message(self, user_input: ConversationInput, chat_log: ChatLog) -> ConversationResult:
         """Processa a entrada do usuário e retorna a resposta."""
         _LOGGER.debug(f"CONVERSATION: agent '{self._agent_name}' -> '{user_input.text}'")
 
-        return await self._agent_instance.async_process(user_input)
+        await self._agent_instance.async_process_chat_log(user_input, chat_log, self.entity_id)
+        return async_get_result_from_chat_log(user_input, chat_log)
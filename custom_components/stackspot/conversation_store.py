@@ -0,0 +1,180 @@
+import asyncio
+import logging
+import time
+from collections import OrderedDict
+from datetime import datetime
+
+from homeassistant.core import HomeAssistant, CALLBACK_TYPE, callback
+from homeassistant.helpers.event import async_call_later
+from homeassistant.helpers.storage import Store
+
+from .const import DOMAIN
+from .data_utils import ContextValue, Message, MessageRole
+
+_LOGGER = logging.getLogger(__name__)
+
+ConversationKey = tuple[str, str]
+
+STORAGE_KEY = f'{DOMAIN}.conversations'
+STORAGE_VERSION = 1
+# Gravações do histórico são agrupadas, no máximo uma a cada STORAGE_SAVE_DELAY segundos
+STORAGE_SAVE_DELAY = 10
+
+
+class ConversationStore:
+    """
+    Histórico das conversas de todos os agentes, chaveado por (subentry do agente, conversation_id).
+    As conversas ficam em ordem de última interação (LRU): a expiração e o limite de bytes
+    sempre removem pelo início, e um único timer é agendado para a próxima conversa a expirar.
+
+    O histórico é persistido com o Store do HA (write-behind, gravações agrupadas pelo async_delay_save).
+    O arquivo só é lido na primeira mensagem recebida e cada conversa só é reconstruída quando é usada de novo.
+    """
+
+    def __init__(self, hass: HomeAssistant, keep_seconds: float, max_bytes: int) -> None:
+        self.hass = hass
+        self._keep_seconds = keep_seconds
+        self._max_bytes = max_bytes
+        self._conversations: OrderedDict[ConversationKey, ContextValue] = OrderedDict()
+        self._bytes: int = 0
+        self._unsub_expire: CALLBACK_TYPE | None = None
+
+        self._store: Store[dict] = Store(hass, STORAGE_VERSION, STORAGE_KEY)
+        # Conversas persistidas que ainda não foram usadas desde o restart, no formato do arquivo
+        self._persisted: dict[ConversationKey, dict] = {}
+        self._load_lock = asyncio.Lock()
+        self._loaded = False
+
+    @property
+    def size(self) -> int:
+        return len(self._conversations)
+
+    @property
+    def bytes(self) -> int:
+        return self._bytes
+
+    def get(self, key: ConversationKey) -> ContextValue | None:
+        return self._conversations.get(key)
+
+    async def async_add_message(self, key: ConversationKey, role: MessageRole, content: str,
+                                max_messages: int) -> ContextValue:
+        ctx = self._conversations.get(key)
+        if ctx is None:
+            await self._async_load()
+            ctx = self._conversations.get(key)
+
+        if ctx is None:
+            data = self._persisted.pop(key, None)
+            if data is not None:
+                ctx = ContextValue.from_dict(data, max_messages)
+                self._bytes += ctx.size
+            else:
+                ctx = ContextValue(max_messages)
+            self._conversations[key] = ctx
+        else:
+            self._conversations.move_to_end(key)
+
+        old_size = ctx.size
+        ctx.add_message(role, content)
+        self._bytes += ctx.size - old_size
+
+        self._evict(keep=key)
+        self._schedule_expire()
+        self._schedule_save()
+        return ctx
+
+    @callback
+    def async_apply_summary(self, key: ConversationKey, summary: str, folded: list[Message]) -> None:
+        ctx = self._conversations.get(key)
+        if ctx is None:
+            return
+
+        old_size = ctx.size
+        ctx.apply_summary(summary, folded)
+        self._bytes += ctx.size - old_size
+        self._schedule_save()
+
+    @callback
+    def async_remove(self, key: ConversationKey) -> None:
+        self._persisted.pop(key, None)
+        ctx = self._conversations.pop(key, None)
+        if ctx is not None:
+            self._bytes -= ctx.size
+        self._schedule_save()
+
+    async def async_shutdown(self) -> None:
+        """Grava o que estiver pendente (reload da integração) e libera a memória."""
+        if self._unsub_expire is not None:
+            self._unsub_expire()
+            self._unsub_expire = None
+
+        if self._loaded:
+            await self._store.async_save(self._data_to_save())
+        self._conversations.clear()
+        self._persisted.clear()
+        self._bytes = 0
+
+    async def _async_load(self) -> None:
+        if self._loaded:
+            return
+
+        async with self._load_lock:
+            if self._loaded:
+                return
+
+            data = await self._store.async_load() or {}
+            limit = time.time() - self._keep_seconds
+            for item in data.get('conversations', []):
+                key = (item['agent'], item['conversation_id'])
+                if item['last_interaction'] > limit and key not in self._conversations:
+                    self._persisted[key] = item
+
+            self._loaded = True
+            _LOGGER.debug(f'{len(self._persisted)} conversations restored from storage')
+
+    @callback
+    def _schedule_save(self) -> None:
+        if self._loaded:
+            self._store.async_delay_save(self._data_to_save, STORAGE_SAVE_DELAY)
+
+    @callback
+    def _data_to_save(self) -> dict:
+        limit = time.time() - self._keep_seconds
+        conversations = [item for item in self._persisted.values() if item['last_interaction'] > limit]
+        for (agent, conversation_id), ctx in self._conversations.items():
+            conversations.append({'agent': agent, 'conversation_id': conversation_id, **ctx.as_dict()})
+
+        return {'conversations': conversations}
+
+    def _evict(self, keep: ConversationKey) -> None:
+        """Remove as conversas menos usadas até caber no limite de bytes, nunca a conversa atual."""
+        while self._bytes > self._max_bytes and len(self._conversations) > 1:
+            key, ctx = next(iter(self._conversations.items()))
+            if key == keep:
+                break
+            del self._conversations[key]
+            self._bytes -= ctx.size
+            _LOGGER.debug(f'Conversation {key[1]} evicted, history above {self._max_bytes} bytes')
+
+    def _schedule_expire(self) -> None:
+        if self._unsub_expire is not None or not self._conversations:
+            return
+
+        oldest = next(iter(self._conversations.values()))
+        delay = max(oldest.last_interaction + self._keep_seconds - time.monotonic(), 0)
+        self._unsub_expire = async_call_later(self.hass, delay, self._async_expire)
+
+    @callback
+    def _async_expire(self, now: datetime) -> None:
+        self._unsub_expire = None
+        limit = time.monotonic() - self._keep_seconds
+        while self._conversations:
+            key, ctx = next(iter(self._conversations.items()))
+            if ctx.last_interaction > limit:
+                break
+            del self._conversations[key]
+            self._bytes -= ctx.size
+            _LOGGER.debug(f'Conversation {key[1]} deleted!')
+
+        self._schedule_expire()
+        self._schedule_save()
@@ -1,11 +1,13 @@
+import time
+from collections import deque
 from dataclasses import dataclass, field
-from datetime import datetime, UTC, timezone
+from datetime import timedelta
 from enum import StrEnum
-from typing import List
 
 from homeassistant.config_entries import ConfigEntry, ConfigSubentry
 from homeassistant.const import STATE_UNKNOWN
 
+from custom_components.stackspot.serialization import estimate_tokens
 from custom_components.stackspot.const import (
     CONF_AGENT_ID,
     CONF_AGENT_NAME,
@@ -13,14 +15,34 @@ from custom_components.stackspot.const import (
     CONF_REALM,
     CONF_CLIENT_KEY,
     CONF_AGENT_MAX_MESSAGES_HISTORY,
+    CONF_AGENT_HISTORY_TOKEN_BUDGET,
+    CONF_AGENT_HISTORY_TOKEN_BUDGET_DEFAULT,
+    CONF_AGENT_HISTORY_SUMMARY,
+    CONF_AGENT_HISTORY_SUMMARY_DEFAULT,
     CONF_AGENT_PROMPT,
     CONF_AGENT_PROMPT_DEFAULT,
     CONF_KS_NAME,
     CONF_KS_SLUG,
     CONF_KS_TEMPLATE,
     CONF_KS_TEMPLATE_DEFAULT,
+    CONF_KS_UPDATE_ON_CHANGE,
+    CONF_KS_UPDATE_ON_CHANGE_DEFAULT,
+    CONF_KS_UPDATE_DEBOUNCE,
+    CONF_KS_UPDATE_DEBOUNCE_DEFAULT,
+    CONF_KS_UPDATE_MIN_INTERVAL,
+    CONF_KS_UPDATE_MIN_INTERVAL_DEFAULT,
     CONF_AGENT_ALLOW_CONTROL,
     CONF_AGENT_ALLOW_CONTROL_DEFAULT,
+    CONF_AGENT_STREAMING,
+    CONF_AGENT_STREAMING_DEFAULT,
+    CONF_AGENT_CANCEL_STALE_TURN,
+    CONF_AGENT_CANCEL_STALE_TURN_DEFAULT,
+    CONF_AGENT_MAX_TOOL_ITERATIONS,
+    CONF_AGENT_MAX_TOOL_ITERATIONS_DEFAULT,
+    CONF_AGENT_TOOL_LOOP_TIMEOUT,
+    CONF_AGENT_TOOL_LOOP_TIMEOUT_DEFAULT,
+    CONF_AGENT_TOOL_LOOP_TOKEN_BUDGET,
+    CONF_AGENT_TOOL_LOOP_TOKEN_BUDGET_DEFAULT,
     CONF_LLM_MODEL,
 )
 
@@ -34,37 +56,156 @@ class MessageRole(StrEnum):
     TOOL = "tool"
 
 
-@dataclass
+@dataclass(slots=True)
 class Message:
     role: MessageRole
     content: str
+    size: int = 0
+    tokens: int = 0
 
+    def __post_init__(self) -> None:
+        self.size = len(self.content.encode())
+        self.tokens = estimate_tokens(self.content)
 
-@dataclass
+
+@dataclass(slots=True)
 class ContextValue:
-    messages: List[Message] = field(default_factory=list)
-    last_interaction: datetime = field(default_factory=lambda: datetime.now(timezone.utc))
+    """Mensagens de uma conversa, limitadas a max_messages (as mais antigas são descartadas pelo deque)."""
+    max_messages: int
+    messages: deque[Message] = field(init=False)
+    size: int = 0
+    last_interaction: float = field(default_factory=time.monotonic)
+    # Resumo das mensagens mais antigas, já removidas de messages
+    summary: str | None = None
+    summary_tokens: int = 0
+
+    def __post_init__(self) -> None:
+        self.messages = deque(maxlen=max(self.max_messages, 0))
 
     def add_message(self, role: MessageRole, content: str) -> None:
         msg = Message(role=role, content=content)
+        if self.messages.maxlen is not None and len(self.messages) == self.messages.maxlen:
+            if self.messages:
+                self.size -= self.messages[0].size
+            else:
+                return
+
         self.messages.append(msg)
-        self.last_interaction = datetime.now(UTC)
+        self.size += msg.size
+        self.last_interaction = time.monotonic()
+
+    def as_dict(self) -> dict:
+        """Formato persistido, com a última interação em horário de parede (o monotonic não sobrevive ao restart)."""
+        return {
+            "last_interaction": time.time() - (time.monotonic() - self.last_interaction),
+            "summary": self.summary,
+            "messages": [[msg.role.value, msg.content] for msg in self.messages],
+        }
+
+    @classmethod
+    def from_dict(cls, data: dict, max_messages: int) -> "ContextValue":
+        ctx = cls(max_messages)
+        for role, content in data.get("messages", []):
+            ctx.add_message(MessageRole(role), content)
+
+        summary = data.get("summary")
+        if summary:
+            ctx.apply_summary(summary, [])
+        ctx.last_interaction = time.monotonic() - (time.time() - data["last_interaction"])
+        return ctx
 
-    def get_history(self) -> list[dict]:
-        return [
+    def get_history(self, token_budget: int = 0) -> list[dict]:
+        history = [
             {
                 "role": msg.role.value,
                 "content": msg.content
             }
-            for msg in self.messages
+            for msg in self.select_messages(token_budget)
         ]
+        if self.summary:
+            history.insert(0, {"role": "summary", "content": self.summary})
+        return history
+
+    def select_messages(self, token_budget: int = 0) -> list[Message]:
+        """
+        Mensagens mais recentes que cabem em token_budget (0 = sem limite).
+        A última mensagem do usuário e o que veio depois dela (respostas e resultados de tools) são sempre mantidos.
+        """
+        if not token_budget:
+            return list(self.messages)
+
+        selected: list[Message] = []
+        tokens = 0
+        required = True
+        for msg in reversed(self.messages):
+            if not required and tokens + msg.tokens > token_budget:
+                break
+            selected.append(msg)
+            tokens += msg.tokens
+            if msg.role == MessageRole.USER:
+                required = False
+
+        selected.reverse()
+        return selected
+
+    def messages_to_fold(self, token_budget: int = 0) -> list[Message]:
+        """
+        Mensagens mais antigas a serem resumidas quando o histórico passa do limite
+        (token_budget ou, sem ele, max_messages). Ficam as mais recentes até metade do limite.
+        """
+        if token_budget:
+            if sum(msg.tokens for msg in self.messages) <= token_budget:
+                return []
+            keep = len(self.select_messages(token_budget // 2))
+        else:
+            if len(self.messages) < self.max_messages:
+                return []
+            keep = self.max_messages // 2
+
+        return list(self.messages)[:len(self.messages) - keep]
 
-    def trim(self, max_messages: int) -> None:
-        if not isinstance(self.messages, list):
-            return
+    def apply_summary(self, summary: str, folded: list[Message]) -> None:
+        """Troca as mensagens resumidas (as que ainda estiverem no início do histórico) pelo novo resumo."""
+        folded_ids = {id(msg) for msg in folded}
+        while self.messages and id(self.messages[0]) in folded_ids:
+            self.size -= self.messages.popleft().size
 
-        while len(self.messages) > max_messages:
-            self.messages.pop(0)
+        self.size += len(summary.encode()) - len((self.summary or '').encode())
+        self.summary = summary
+        self.summary_tokens = estimate_tokens(summary)
+
+
+@dataclass
+class AgentRunStats:
+    """Métricas de um turno do agente (iterações do loop de tools, tempo e tokens)."""
+    started: float = field(default_factory=time.perf_counter)
+    tokens: int = 0
+    iterations: list[dict] = field(default_factory=list)
+    # Quantas vezes cada chamada de tool (nome + parâmetros) foi feita no turno
+    tool_calls: dict[str, int] = field(default_factory=dict)
+
+    def add_iteration(self, iteration_start: float, tools_executed: int = 0, tools_memoized: int = 0,
+                      tools_repeated: int = 0) -> None:
+        self.iterations.append({
+            'duration_ms': round((time.perf_counter() - iteration_start) * 1000, 1),
+            'tools_executed': tools_executed,
+            'tools_memoized': tools_memoized,
+            'tools_repeated': tools_repeated,
+        })
+
+    @property
+    def max_tool_repeats(self) -> int:
+        return max(self.tool_calls.values(), default=0)
+
+    def elapsed_seconds(self) -> float:
+        return time.perf_counter() - self.started
+
+    def as_dict(self) -> dict:
+        return {
+            'elapsed_ms': round(self.elapsed_seconds() * 1000, 1),
+            'tokens': self.tokens,
+            'iterations': self.iterations,
+        }
 
 
 @dataclass(frozen=True)
@@ -78,9 +219,16 @@ class StackSpotAgentConfig:
     client_id: str
     client_key: str
     max_messages_history: int
+    history_token_budget: int
+    history_summary: bool
     prompt: str
     allow_control: bool
     llm_model: str
+    streaming: bool
+    cancel_stale_turn: bool
+    max_tool_iterations: int
+    tool_loop_timeout: int
+    tool_loop_token_budget: int
 
     @classmethod
     def from_entry(cls, entry: ConfigEntry, subentry: ConfigSubentry) -> "StackSpotAgentConfig":
@@ -93,9 +241,19 @@ class StackSpotAgentConfig:
             client_id=entry.data[CONF_CLIENT_ID],
             client_key=entry.data[CONF_CLIENT_KEY],
             max_messages_history=int(subentry.data.get(CONF_AGENT_MAX_MESSAGES_HISTORY, 10)),
+            history_token_budget=int(
+                subentry.data.get(CONF_AGENT_HISTORY_TOKEN_BUDGET, CONF_AGENT_HISTORY_TOKEN_BUDGET_DEFAULT)),
+            history_summary=subentry.data.get(CONF_AGENT_HISTORY_SUMMARY, CONF_AGENT_HISTORY_SUMMARY_DEFAULT),
             prompt=subentry.data.get(CONF_AGENT_PROMPT, CONF_AGENT_PROMPT_DEFAULT),
             allow_control=subentry.data.get(CONF_AGENT_ALLOW_CONTROL, CONF_AGENT_ALLOW_CONTROL_DEFAULT),
             llm_model=subentry.data.get(CONF_LLM_MODEL, ''),
+            streaming=subentry.data.get(CONF_AGENT_STREAMING, CONF_AGENT_STREAMING_DEFAULT),
+            cancel_stale_turn=subentry.data.get(CONF_AGENT_CANCEL_STALE_TURN, CONF_AGENT_CANCEL_STALE_TURN_DEFAULT),
+            max_tool_iterations=int(
+                subentry.data.get(CONF_AGENT_MAX_TOOL_ITERATIONS, CONF_AGENT_MAX_TOOL_ITERATIONS_DEFAULT)),
+            tool_loop_timeout=int(subentry.data.get(CONF_AGENT_TOOL_LOOP_TIMEOUT, CONF_AGENT_TOOL_LOOP_TIMEOUT_DEFAULT)),
+            tool_loop_token_budget=int(
+                subentry.data.get(CONF_AGENT_TOOL_LOOP_TOKEN_BUDGET, CONF_AGENT_TOOL_LOOP_TOKEN_BUDGET_DEFAULT)),
         )
 
     @classmethod
@@ -109,9 +267,16 @@ class StackSpotAgentConfig:
             client_id=entry.data[CONF_CLIENT_ID],
             client_key=entry.data[CONF_CLIENT_KEY],
             max_messages_history=0,
+            history_token_budget=CONF_AGENT_HISTORY_TOKEN_BUDGET_DEFAULT,
+            history_summary=False,
             prompt=subentry.data.get(CONF_AGENT_PROMPT, CONF_AGENT_PROMPT_DEFAULT),
             allow_control=False,
             llm_model=subentry.data.get(CONF_LLM_MODEL, ''),
+            streaming=False,
+            cancel_stale_turn=False,
+            max_tool_iterations=CONF_AGENT_MAX_TOOL_ITERATIONS_DEFAULT,
+            tool_loop_timeout=CONF_AGENT_TOOL_LOOP_TIMEOUT_DEFAULT,
+            tool_loop_token_budget=CONF_AGENT_TOOL_LOOP_TOKEN_BUDGET_DEFAULT,
         )
 
 
@@ -130,6 +295,14 @@ class StackSpotLogin:
             client_key=entry.data[CONF_CLIENT_KEY]
         )
 
+    @classmethod
+    def from_agent_config(cls, config: StackSpotAgentConfig) -> "StackSpotLogin":
+        return cls(
+            realm=config.realm,
+            client_id=config.client_id,
+            client_key=config.client_key
+        )
+
 
 @dataclass(frozen=True)
 class KSData:
@@ -137,6 +310,9 @@ class KSData:
     name: str
     slug: str
     template: str
+    update_on_change: bool
+    update_debounce: float
+    update_min_interval: float
 
     @classmethod
     def from_entry(cls, subentry: ConfigSubentry) -> "KSData":
@@ -145,9 +321,24 @@ class KSData:
             name=subentry.data.get(CONF_KS_NAME, STATE_UNKNOWN),
             slug=subentry.data.get(CONF_KS_SLUG, STATE_UNKNOWN),
             template=subentry.data.get(CONF_KS_TEMPLATE, CONF_KS_TEMPLATE_DEFAULT),
+            update_on_change=subentry.data.get(CONF_KS_UPDATE_ON_CHANGE, CONF_KS_UPDATE_ON_CHANGE_DEFAULT),
+            update_debounce=_duration_seconds(
+                subentry.data.get(CONF_KS_UPDATE_DEBOUNCE, CONF_KS_UPDATE_DEBOUNCE_DEFAULT)),
+            update_min_interval=_duration_seconds(
+                subentry.data.get(CONF_KS_UPDATE_MIN_INTERVAL, CONF_KS_UPDATE_MIN_INTERVAL_DEFAULT)),
         )
 
 
+def _duration_seconds(duration: dict) -> float:
+    """Valor do DurationSelector em segundos."""
+    return timedelta(
+        days=duration.get('days', 0),
+        hours=duration.get('hours', 0),
+        minutes=duration.get('minutes', 0),
+        seconds=duration.get('seconds', 0),
+    ).total_seconds()
+
+
 @dataclass(frozen=True)
 class SensorConfig:
     """Dataclass for created a sensor"""
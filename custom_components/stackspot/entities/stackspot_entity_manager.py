@@ -59,6 +59,21 @@ class StackSpotEntityManager:
         _LOGGER.warning(f"'{key}' not found in objects!")
         return None
 
+    def has_object(self, key: str) -> bool:
+        """
+        Verifica se existe um objeto vinculado a key.
+        """
+        return key in self._objects
+
+    def remove_object(self, key: str) -> Optional[any]:
+        """
+        Remove e retorna o objeto vinculado a key.
+        """
+        obj = self._objects.pop(key, None)
+        if obj is not None:
+            _LOGGER.debug(f"'{key}' removed")
+        return obj
+
     def remove_entry(self, entry_id: str) -> None:
         """
         Remove todas as entidades associadas a uma ConfigEntry específica.
@@ -0,0 +1,160 @@
+import asyncio
+import logging
+import random
+import time
+from contextlib import asynccontextmanager, contextmanager
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from typing import AsyncIterator, Awaitable, Callable, Iterator
+
+from homeassistant.core import HomeAssistant, CALLBACK_TYPE, callback
+from homeassistant.helpers.event import async_call_later
+
+_LOGGER = logging.getLogger(__name__)
+
+# Cada execução é adiantada ou atrasada por até JOB_JITTER_RATIO do intervalo (no máximo JOB_MAX_JITTER_SECONDS),
+# o deslocamento é simétrico para que o intervalo médio entre as execuções continue sendo o configurado
+JOB_JITTER_RATIO = 0.1
+JOB_MAX_JITTER_SECONDS = 600
+# Sincronizações (envio de KS) simultâneas de toda a integração
+JOB_MAX_CONCURRENT_SYNCS = 2
+# Tempo máximo que uma sincronização aguarda as conversas em andamento terminarem
+JOB_MAX_SYNC_DEFER_SECONDS = 120
+
+
+@dataclass
+class _Job:
+    name: str
+    interval: float
+    function: Callable[[], Awaitable[None]]
+    next_run: float = 0.0
+    task: asyncio.Task | None = None
+
+
+class JobScheduler:
+    """
+    Dono dos jobs periódicos da integração (atualização dos KS e dos catálogos).
+    Um único timer é agendado para o próximo job, e cada execução tem jitter para que jobs
+    criados juntos (após um restart) não rodem no mesmo instante.
+
+    As sincronizações (sync_slot) são limitadas a JOB_MAX_CONCURRENT_SYNCS e aguardam, por até
+    JOB_MAX_SYNC_DEFER_SECONDS, as conversas em andamento terminarem antes de usar a API.
+    """
+
+    def __init__(self, hass: HomeAssistant) -> None:
+        self.hass = hass
+        self._jobs: dict[str, _Job] = {}
+        self._unsub_timer: CALLBACK_TYPE | None = None
+        self._sync_semaphore = asyncio.Semaphore(JOB_MAX_CONCURRENT_SYNCS)
+        self._conversations: int = 0
+        self._idle = asyncio.Event()
+        self._idle.set()
+
+    @property
+    def conversations_in_flight(self) -> int:
+        return self._conversations
+
+    @callback
+    def async_add_job(self, name: str, interval: timedelta,
+                      function: Callable[[], Awaitable[None]]) -> CALLBACK_TYPE:
+        """Agenda function a cada interval (com jitter), um job com o mesmo nome é substituído."""
+        self._async_remove_job(name)
+
+        seconds = interval.total_seconds()
+        job = _Job(name, seconds, function, time.monotonic() + seconds + _jitter(seconds))
+        self._jobs[name] = job
+        self._schedule_timer()
+
+        @callback
+        def remove_job() -> None:
+            if self._jobs.get(name) is job:
+                self._async_remove_job(name)
+
+        return remove_job
+
+    @contextmanager
+    def conversation(self) -> Iterator[None]:
+        """Marca uma conversa em andamento enquanto o bloco executa."""
+        self._conversations += 1
+        self._idle.clear()
+        try:
+            yield
+        finally:
+            self._conversations -= 1
+            if not self._conversations:
+                self._idle.set()
+
+    @asynccontextmanager
+    async def sync_slot(self) -> AsyncIterator[None]:
+        """Vaga para uma sincronização, adiada enquanto houver conversa em andamento."""
+        async with self._sync_semaphore:
+            if not self._idle.is_set():
+                start = time.perf_counter()
+                try:
+                    async with asyncio.timeout(JOB_MAX_SYNC_DEFER_SECONDS):
+                        await self._idle.wait()
+                except TimeoutError:
+                    _LOGGER.debug('Sync started with a conversation in flight, maximum deferral reached')
+                else:
+                    _LOGGER.debug(f'Sync deferred {time.perf_counter() - start:.1f}s by a conversation in flight')
+            yield
+
+    @callback
+    def async_stop(self) -> None:
+        if self._unsub_timer is not None:
+            self._unsub_timer()
+            self._unsub_timer = None
+
+        for name in list(self._jobs):
+            self._async_remove_job(name)
+
+    @callback
+    def _async_remove_job(self, name: str) -> None:
+        job = self._jobs.pop(name, None)
+        if job is not None and job.task is not None and not job.task.done():
+            job.task.cancel()
+
+    @callback
+    def _schedule_timer(self) -> None:
+        if self._unsub_timer is not None:
+            self._unsub_timer()
+            self._unsub_timer = None
+
+        if not self._jobs:
+            return
+
+        next_run = min(job.next_run for job in self._jobs.values())
+        self._unsub_timer = async_call_later(self.hass, max(next_run - time.monotonic(), 0), self._async_run_due)
+
+    @callback
+    def _async_run_due(self, now: datetime) -> None:
+        self._unsub_timer = None
+        current = time.monotonic()
+
+        for job in self._jobs.values():
+            if job.next_run > current:
+                continue
+
+            job.next_run = current + job.interval + _jitter(job.interval)
+            if job.task is not None and not job.task.done():
+                _LOGGER.debug(f'Job {job.name} still running, execution skipped')
+                continue
+
+            job.task = self.hass.async_create_background_task(self._async_run(job), f'stackspot-job-{job.name}')
+
+        self._schedule_timer()
+
+    @staticmethod
+    async def _async_run(job: _Job) -> None:
+        start = time.perf_counter()
+        try:
+            await job.function()
+        except Exception as e:
+            _LOGGER.error(f'Job {job.name} failed: {e!r}')
+            return
+        _LOGGER.debug(f'Job {job.name} finished in {(time.perf_counter() - start) * 1000:.0f} ms')
+
+
+def _jitter(interval: float) -> float:
+    jitter = min(interval * JOB_JITTER_RATIO, JOB_MAX_JITTER_SECONDS)
+    return random.uniform(-jitter, jitter)
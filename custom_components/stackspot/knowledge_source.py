@@ -1,40 +1,245 @@
+import asyncio
+import hashlib
 import logging
+import time
+from datetime import datetime
 
-from homeassistant.core import HomeAssistant
+from homeassistant.core import HomeAssistant, CALLBACK_TYPE, callback
+from homeassistant.helpers.event import async_call_later
+from homeassistant.helpers.storage import Store
 
 from . import StackSpotEntityManager, MANAGER
+from .client.scheduler import RequestPriority
 from .client.stackspot_client import StackSpotApiClient
-from .const import DOMAIN, SENSOR_KS_LAST_UPDATE
+from .catalog import Catalog
+from .const import (
+    DOMAIN,
+    SENSOR_KS_LAST_UPDATE,
+    KS_SYNC_STATE,
+    KS_CHUNK_MAX_CHARS,
+    TEMPLATE_KEY_EXPOSED_ENTITIES,
+    TEMPLATE_KEY_SCRIPTS,
+    TEMPLATE_KEY_SERVICES,
+)
 from .data_utils import StackSpotLogin, KSData
+from .jobs import JobScheduler
 from .sensor import KSDateTimeSensor
-from .util import render_template
+from .serialization import split_chunks
+from .util import render_template, get_api_client, get_token_manager, get_request_scheduler
 
 _LOGGER = logging.getLogger(__name__)
 
+STORAGE_KEY = f'{DOMAIN}.knowledge_sources'
+STORAGE_VERSION = 1
 
-async def ks_create(data_token: StackSpotLogin, data: KSData) -> bool:
-    api = StackSpotApiClient()
-    access_token = await api.generate_access_token(data_token.realm, data_token.client_id, data_token.client_key)
-    data = await api.create_knowledge_sources(access_token['access_token'], data.name, data.slug)
+
+class KSSyncState:
+    """
+    Objetos enviados para cada KS (hash de cada parte do conteúdo -> id do objeto na StackSpot), persistidos
+    para que um restart não reenvie conteúdo que não mudou.
+    """
+
+    def __init__(self, hass: HomeAssistant) -> None:
+        self._store: Store[dict] = Store(hass, STORAGE_VERSION, STORAGE_KEY)
+        self._data: dict[str, dict] | None = None
+        self._lock = asyncio.Lock()
+
+    async def async_get_objects(self, slug: str) -> dict[str, str | None]:
+        data = await self._async_load()
+        return dict(data.get(slug, {}).get('objects', {}))
+
+    async def async_set_objects(self, slug: str, objects: dict[str, str | None]) -> None:
+        data = await self._async_load()
+        data[slug] = {'objects': objects}
+        await self._store.async_save(data)
+
+    async def _async_load(self) -> dict[str, dict]:
+        async with self._lock:
+            if self._data is None:
+                self._data = await self._store.async_load() or {}
+        return self._data
+
+
+class KSUpdater:
+    """
+    Executa as atualizações de um KS, uma por vez. Com update_on_change, mudanças nos catálogos
+    (entidades expostas, scripts, serviços) disparam uma atualização update_debounce segundos depois
+    da última mudança, então uma sequência de mudanças gera um único envio, respeitando update_min_interval
+    entre os envios.
+    """
+
+    def __init__(self, hass: HomeAssistant, data_token: StackSpotLogin, data: KSData,
+                 jobs: JobScheduler | None = None) -> None:
+        self.hass = hass
+        self._data_token = data_token
+        self._data = data
+        self._jobs = jobs
+        self._lock = asyncio.Lock()
+        self._last_update: float | None = None
+        self._unsubs: list[CALLBACK_TYPE] = []
+        self._unsub_delayed: CALLBACK_TYPE | None = None
+        self._unsub_debounce: CALLBACK_TYPE | None = None
+
+    @callback
+    def async_start(self) -> None:
+        if not self._data.update_on_change:
+            return
+
+        manager: StackSpotEntityManager = self.hass.data[DOMAIN][MANAGER]
+        for key in (TEMPLATE_KEY_EXPOSED_ENTITIES, TEMPLATE_KEY_SCRIPTS, TEMPLATE_KEY_SERVICES):
+            catalog: Catalog | None = manager.get_object_by(key)
+            if catalog is not None:
+                self._unsubs.append(catalog.async_add_listener(self._async_catalog_changed))
+
+    @callback
+    def async_stop(self) -> None:
+        for unsub in self._unsubs:
+            unsub()
+        self._unsubs.clear()
+        if self._unsub_delayed is not None:
+            self._unsub_delayed()
+            self._unsub_delayed = None
+        if self._unsub_debounce is not None:
+            self._unsub_debounce()
+            self._unsub_debounce = None
+
+    async def async_update(self) -> None:
+        async with self._lock:
+            self._last_update = time.monotonic()
+            if self._jobs is None:
+                await ks_update(self.hass, self._data_token, self._data)
+                return
+
+            async with self._jobs.sync_slot():
+                await ks_update(self.hass, self._data_token, self._data)
+
+    @callback
+    def _async_catalog_changed(self) -> None:
+        # Cada mudança reinicia a espera
+        if self._unsub_debounce is not None:
+            self._unsub_debounce()
+        self._unsub_debounce = async_call_later(self.hass, self._data.update_debounce, self._async_changed_update)
+
+    async def _async_changed_update(self, now: datetime | None = None) -> None:
+        self._unsub_debounce = None
+        if self._unsub_delayed is not None:
+            return
+
+        if self._last_update is not None:
+            remaining = self._last_update + self._data.update_min_interval - time.monotonic()
+            if remaining > 0:
+                _LOGGER.debug(f'KS {self._data.slug} changed, update delayed {remaining:.0f}s by the minimum interval')
+                self._unsub_delayed = async_call_later(self.hass, remaining, self._async_delayed_update)
+                return
+
+        await self.async_update()
+
+    async def _async_delayed_update(self, now: datetime) -> None:
+        self._unsub_delayed = None
+        await self.async_update()
+
+
+async def ks_create(hass: HomeAssistant, data_token: StackSpotLogin, data: KSData) -> bool:
+    api: StackSpotApiClient = get_api_client(hass)
+    access_token = await get_token_manager(hass, data_token).async_get_token()
+    if not access_token:
+        _LOGGER.error(f'KS {data.slug} has not been created, no access token')
+        return False
+
+    async with get_request_scheduler(hass, data_token).slot(RequestPriority.KS_SYNC):
+        data = await api.create_knowledge_sources(access_token, data.name, data.slug)
 
     return data is None or not data.get('error', False)
 
 
 async def ks_update(hass: HomeAssistant, data_token: StackSpotLogin, data: KSData) -> None:
-    api = StackSpotApiClient()
-    token_response = await api.generate_access_token(data_token.realm, data_token.client_id, data_token.client_key)
-    access_token = token_response['access_token']
+    """
+    O conteúdo renderizado é dividido em partes (split_chunks) e cada parte é um objeto no KS.
+    Só as partes novas ou alteradas são enviadas, em paralelo (limitado pelo scheduler da conta),
+    e as que não existem mais são removidas depois do envio, assim o KS nunca fica vazio.
+    O KS só é limpo antes do envio quando não há estado salvo (primeira sincronização ou atualização da integração).
+    Partes antigas sem o id do objeto (não retornado pela API) não podem ser removidas e continuam no KS.
+    """
+    manager: StackSpotEntityManager = hass.data[DOMAIN][MANAGER]
+    sensor: KSDateTimeSensor = manager.get_entity_by(data.subentry_id, SENSOR_KS_LAST_UPDATE)
+    sync_state: KSSyncState = manager.get_object_by(KS_SYNC_STATE)
 
-    await api.clear_objects_knowledge_sources(access_token, data.slug)
+    content: str = str(await render_template(hass, data.template, {}))
+    chunks = {_content_hash(chunk): chunk for chunk in split_chunks(content, KS_CHUNK_MAX_CHARS)}
+    previous = await sync_state.async_get_objects(data.slug)
 
-    manager: StackSpotEntityManager = hass.data[DOMAIN][MANAGER]
+    new = chunks.keys() - previous.keys()
+    stale = {key: value for key, value in previous.items() if key not in chunks}
+    unknown = {key: value for key, value in stale.items() if value is None}
 
-    content: str = await render_template(hass, data.template, {})
-    response = await api.add_content_knowledge_sources(access_token, data.slug, str(content))
+    if not new and len(unknown) == len(stale):
+        _LOGGER.info(f'KS {data.slug} content has not changed, upload skipped')
+        sensor.async_set_sync_result(uploaded=0, skipped=len(chunks))
+        return
 
-    if response is None or not response.get('error', False):
-        _LOGGER.info(f'KS {data.slug} content has been updated')
-        sensor: KSDateTimeSensor = manager.get_entity_by(data.subentry_id, SENSOR_KS_LAST_UPDATE)
-        await sensor.async_set_datetime()
+    api: StackSpotApiClient = get_api_client(hass)
+    access_token = await get_token_manager(hass, data_token).async_get_token()
+    if not access_token:
+        _LOGGER.error(f'KS {data.slug} content has not been updated, no access token')
+        return
+
+    scheduler = get_request_scheduler(hass, data_token)
+    if not previous:
+        async with scheduler.slot(RequestPriority.KS_SYNC):
+            await api.clear_objects_knowledge_sources(access_token, data.slug)
+
+    async def upload(chunk_hash: str) -> tuple[str, dict | None]:
+        async with scheduler.slot(RequestPriority.KS_SYNC):
+            return chunk_hash, await api.add_content_knowledge_sources(access_token, data.slug, chunks[chunk_hash])
+
+    async def delete(chunk_hash: str) -> tuple[str, dict | None]:
+        async with scheduler.slot(RequestPriority.KS_SYNC):
+            return chunk_hash, await api.delete_object_knowledge_sources(access_token, data.slug, stale[chunk_hash])
+
+    objects = {key: value for key, value in previous.items() if key in chunks or key in unknown}
+    failed = 0
+    for chunk_hash, response in await asyncio.gather(*(upload(chunk_hash) for chunk_hash in new)):
+        if response is not None and response.get('error', False):
+            failed += 1
+        else:
+            objects[chunk_hash] = _object_id(response)
+
+    removed = 0
+    if failed:
+        # As partes antigas continuam no KS até o próximo envio completo
+        objects.update(stale)
+        _LOGGER.error(f'KS {data.slug}: {failed} of {len(new)} chunks have not been uploaded')
     else:
-        _LOGGER.error(f'KS {data.slug} content has not been updated')
+        removable = [chunk_hash for chunk_hash in stale if chunk_hash not in unknown]
+        for chunk_hash, response in await asyncio.gather(*(delete(chunk_hash) for chunk_hash in removable)):
+            if response is not None and response.get('error', False):
+                # Continua no estado para ser removida na próxima sincronização
+                objects[chunk_hash] = stale[chunk_hash]
+            else:
+                removed += 1
+
+    without_id = sum(1 for chunk_hash in new if chunk_hash in objects and objects[chunk_hash] is None)
+    if without_id:
+        _LOGGER.warning(f'KS {data.slug}: object id not returned for {without_id} chunks, '
+                        f'they will be kept in the KS when the content changes')
+    if unknown:
+        _LOGGER.warning(f'KS {data.slug}: {len(unknown)} outdated chunks without object id kept in the KS')
+
+    await sync_state.async_set_objects(data.slug, objects)
+    _LOGGER.info(f'KS {data.slug} content has been updated: {len(new) - failed} chunks uploaded, '
+                 f'{len(chunks) - len(new)} unchanged, {removed} removed')
+    if len(new) > failed:
+        await sensor.async_set_datetime()
+    sensor.async_set_sync_result(uploaded=len(new) - failed, skipped=len(chunks) - len(new))
+
+
+def _content_hash(content: str) -> str:
+    return hashlib.sha256(content.encode()).hexdigest()
+
+
+def _object_id(response: dict | None) -> str | None:
+    """Id do objeto criado no KS, quando a API o retorna."""
+    if not isinstance(response, dict):
+        return None
+    object_id = response.get('id')
+    return str(object_id) if object_id is not None else None
@@ -0,0 +1,125 @@
+import logging
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Callable
+
+from homeassistant.const import EVENT_STATE_CHANGED
+from homeassistant.core import HomeAssistant, CALLBACK_TYPE, Event, callback
+from homeassistant.helpers.template import RenderInfo
+
+from .util import render_template_to_info, get_variables_version
+
+_LOGGER = logging.getLogger(__name__)
+
+PROMPT_CACHE_SIZE = 64
+# Templates que usam now()/utcnow() são renderizados de novo a cada virada de minuto
+PROMPT_CACHE_TIME_GRANULARITY = 60
+
+
+@dataclass
+class _CacheEntry:
+    result: str
+    entities: frozenset[str]
+    domains: frozenset[str]
+    all_states: bool
+    expires_at: float | None
+
+    @classmethod
+    def from_render_info(cls, result: str, render_info: RenderInfo) -> "_CacheEntry":
+        expires_at = None
+        if render_info.has_time:
+            now = time.time()
+            expires_at = now - (now % PROMPT_CACHE_TIME_GRANULARITY) + PROMPT_CACHE_TIME_GRANULARITY
+
+        return cls(
+            result=result,
+            entities=frozenset(render_info.entities),
+            domains=frozenset(render_info.domains) | frozenset(render_info.domains_lifecycle),
+            all_states=render_info.all_states or render_info.all_states_lifecycle,
+            expires_at=expires_at,
+        )
+
+    def is_expired(self) -> bool:
+        return self.expires_at is not None and time.time() >= self.expires_at
+
+    def depends_on(self, entity_id: str) -> bool:
+        return self.all_states or entity_id in self.entities or entity_id.split('.', 1)[0] in self.domains
+
+
+class PromptRenderCache:
+    """
+    Cache dos system prompts renderizados, chaveado por (subentry, usuário, versões dos catálogos, template).
+    Usa o RenderInfo do HA: uma entrada só é invalidada pelas entidades/domínios que o template leu
+    ou pela virada de minuto, quando o template usa o horário.
+    """
+
+    def __init__(self, hass: HomeAssistant) -> None:
+        self.hass = hass
+        self.hits: int = 0
+        self.misses: int = 0
+        self._entries: OrderedDict[tuple, _CacheEntry] = OrderedDict()
+        self._listeners: list[Callable[[], None]] = []
+        self._unsub: CALLBACK_TYPE = hass.bus.async_listen(EVENT_STATE_CHANGED, self._async_state_changed)
+
+    @property
+    def size(self) -> int:
+        return len(self._entries)
+
+    async def async_render(self, subentry_id: str, template_str: str, variables: dict) -> str:
+        key = (subentry_id, tuple(sorted(variables.items())), get_variables_version(self.hass), template_str)
+
+        entry = self._entries.get(key)
+        if entry is not None and not entry.is_expired():
+            self._entries.move_to_end(key)
+            self.hits += 1
+            self._notify_listeners()
+            return entry.result
+
+        result, render_info = await render_template_to_info(self.hass, template_str, variables)
+        result = str(result)
+
+        self._entries[key] = _CacheEntry.from_render_info(result, render_info)
+        if len(self._entries) > PROMPT_CACHE_SIZE:
+            self._entries.popitem(last=False)
+
+        self.misses += 1
+        self._notify_listeners()
+        return result
+
+    @callback
+    def async_clear(self) -> None:
+        self._entries.clear()
+
+    @callback
+    def async_stop(self) -> None:
+        self._unsub()
+        self._entries.clear()
+
+    @callback
+    def async_add_listener(self, listener: Callable[[], None]) -> CALLBACK_TYPE:
+        self._listeners.append(listener)
+
+        @callback
+        def remove_listener() -> None:
+            if listener in self._listeners:
+                self._listeners.remove(listener)
+
+        return remove_listener
+
+    @callback
+    def _async_state_changed(self, event: Event) -> None:
+        if not self._entries:
+            return
+
+        entity_id: str = event.data['entity_id']
+        stale = [key for key, entry in self._entries.items() if entry.depends_on(entity_id)]
+        for key in stale:
+            del self._entries[key]
+
+        if stale:
+            _LOGGER.debug(f'Prompt cache: {len(stale)} entries invalidated by {entity_id}')
+
+    def _notify_listeners(self) -> None:
+        for listener in list(self._listeners):
+            listener()
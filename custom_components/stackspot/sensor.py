@@ -1,9 +1,11 @@
 import logging
 from datetime import datetime
 
-from homeassistant.components.sensor import SensorEntity
+from homeassistant.components.sensor import SensorEntity, SensorStateClass, SensorDeviceClass
 from homeassistant.config_entries import ConfigEntry
-from homeassistant.core import HomeAssistant
+from homeassistant.const import EntityCategory, UnitOfTime, PERCENTAGE
+from homeassistant.core import HomeAssistant, callback
+from homeassistant.helpers.debounce import Debouncer
 from homeassistant.helpers.entity_platform import AddConfigEntryEntitiesCallback
 from homeassistant.helpers.restore_state import RestoreEntity
 from homeassistant.util import dt as dt_util
@@ -21,13 +23,38 @@ from .const import (
     SUBENTRY_AI_TASK,
     SUBENTRY_KS,
     CONF_KS_SLUG, CONF_KS_NAME, SENSOR_KS_LAST_UPDATE,
+    SENSOR_TOKEN_REFRESH,
+    SENSOR_WARM_UP,
+    SENSOR_PROMPT_CACHE,
+    SENSOR_PROMPT_SIZE,
+    SENSOR_REQUEST_QUEUE,
+    SENSOR_REQUEST_WAIT,
+    SENSOR_CIRCUIT_BREAKER,
+    WARM_UP,
+    PROMPT_CACHE,
 )
-from .data_utils import SensorConfig
+from .client.resilience import CircuitState
+from .client.scheduler import RequestScheduler, RequestPriority
+from .client.stackspot_client import StackSpotApiClient, INFERENCE_HOST
+from .client.token_manager import StackSpotTokenManager
+from .data_utils import SensorConfig, StackSpotLogin
 from .entities.token_sensor import TokenSensor
-from .util import get_device_general, get_device_info_ks
+from .util import (
+    get_device_general,
+    get_device_info_ks,
+    get_device_info_agent,
+    get_token_manager,
+    get_request_scheduler,
+    get_api_client,
+)
+from .prompt_cache import PromptRenderCache
+from .warmup import StackSpotWarmUp
 
 _LOGGER = logging.getLogger(__name__)
 
+# Sensores atualizados a cada requisição gravam o estado (e uma linha no recorder) no máximo uma vez nesse intervalo
+SENSOR_WRITE_COOLDOWN_SECONDS = 10
+
 
 async def async_setup_entry(hass: HomeAssistant, entry: ConfigEntry,
                             async_add_entities: AddConfigEntryEntitiesCallback) -> None:
@@ -55,10 +82,39 @@ async def async_setup_entry(hass: HomeAssistant, entry: ConfigEntry,
         manager.add_entity(subentry_id, SENSOR_ENRICHMENT_TOKEN, enrichment_sensor)
         manager.add_entity(subentry_id, SENSOR_OUTPUT_TOKEN, output_sensor)
 
+        if subentry.subentry_type == SUBENTRY_AGENT:
+            prompt_size_sensor = PromptSizeSensor(sensor_config)
+            async_add_entities([prompt_size_sensor], config_subentry_id=subentry_id)
+            manager.add_entity(subentry_id, SENSOR_PROMPT_SIZE, prompt_size_sensor)
+
     total_geral_sensor = TokenGeneralTotalSensor(entry_id)
     manager.add_entity(entry_id, SENSOR_TOTAL_GENERAL_TOKEN, total_geral_sensor)
     entities.append(total_geral_sensor)
 
+    token_refresh_sensor = TokenRefreshSensor(entry_id, get_token_manager(hass, StackSpotLogin.from_entry(entry)))
+    manager.add_entity(entry_id, SENSOR_TOKEN_REFRESH, token_refresh_sensor)
+    entities.append(token_refresh_sensor)
+
+    prompt_cache_sensor = PromptCacheSensor(entry_id, manager.get_object_by(PROMPT_CACHE))
+    manager.add_entity(entry_id, SENSOR_PROMPT_CACHE, prompt_cache_sensor)
+    entities.append(prompt_cache_sensor)
+
+    scheduler = get_request_scheduler(hass, StackSpotLogin.from_entry(entry))
+    request_queue_sensor = RequestQueueSensor(entry_id, scheduler)
+    request_wait_sensor = RequestWaitSensor(entry_id, scheduler)
+    manager.add_entity(entry_id, SENSOR_REQUEST_QUEUE, request_queue_sensor)
+    manager.add_entity(entry_id, SENSOR_REQUEST_WAIT, request_wait_sensor)
+    entities.extend([request_queue_sensor, request_wait_sensor])
+
+    circuit_breaker_sensor = CircuitBreakerSensor(entry_id, get_api_client(hass))
+    manager.add_entity(entry_id, SENSOR_CIRCUIT_BREAKER, circuit_breaker_sensor)
+    entities.append(circuit_breaker_sensor)
+
+    if manager.has_object(f'{WARM_UP}_{entry_id}'):
+        warm_up_sensor = WarmUpDurationSensor(entry_id, manager.get_object_by(f'{WARM_UP}_{entry_id}'))
+        manager.add_entity(entry_id, SENSOR_WARM_UP, warm_up_sensor)
+        entities.append(warm_up_sensor)
+
     for subentry in entry.subentries.values():
         if subentry.subentry_type != SUBENTRY_KS:
             continue
@@ -82,6 +138,258 @@ class TokenGeneralTotalSensor(TokenSensor):
         self._attr_unique_id = f'stackspot_global_total_general_tokens_{config_id}'
 
 
+class TokenRefreshSensor(SensorEntity):
+    """Quantidade de renovações do token OAuth da conta, com a latência nos atributos."""
+
+    _attr_has_entity_name = True
+    _attr_name = "Token Refreshes"
+    _attr_icon = "mdi:key-change"
+    _attr_should_poll = False
+    _attr_entity_category = EntityCategory.DIAGNOSTIC
+    _attr_state_class = SensorStateClass.TOTAL_INCREASING
+
+    def __init__(self, config_id: str, token_manager: StackSpotTokenManager):
+        self._token_manager = token_manager
+        self._attr_device_info = get_device_general(config_id)
+        self._attr_unique_id = f'stackspot_token_refresh_{config_id}'
+
+    @property
+    def native_value(self) -> int:
+        return self._token_manager.refresh_count
+
+    @property
+    def extra_state_attributes(self) -> dict:
+        return {
+            'errors': self._token_manager.refresh_errors,
+            'last_latency_ms': _round(self._token_manager.last_refresh_latency_ms),
+            'average_latency_ms': _round(self._token_manager.average_refresh_latency_ms),
+            'last_refresh': self._token_manager.last_refresh,
+        }
+
+    async def async_added_to_hass(self) -> None:
+        await super().async_added_to_hass()
+        self.async_on_remove(self._token_manager.async_add_listener(self.async_write_ha_state))
+
+
+class WarmUpDurationSensor(SensorEntity):
+    """Duração do último warm-up (token + conexão com o host de inferência)."""
+
+    _attr_has_entity_name = True
+    _attr_name = "Warm-up Duration"
+    _attr_icon = "mdi:timer-sand"
+    _attr_should_poll = False
+    _attr_entity_category = EntityCategory.DIAGNOSTIC
+    _attr_device_class = SensorDeviceClass.DURATION
+    _attr_native_unit_of_measurement = UnitOfTime.MILLISECONDS
+
+    def __init__(self, config_id: str, warm_up: StackSpotWarmUp):
+        self._warm_up = warm_up
+        self._attr_device_info = get_device_general(config_id)
+        self._attr_unique_id = f'stackspot_warm_up_duration_{config_id}'
+
+    @property
+    def native_value(self) -> float | None:
+        return _round(self._warm_up.last_duration_ms)
+
+    @property
+    def extra_state_attributes(self) -> dict:
+        return {
+            'last_warm_up': self._warm_up.last_warm_up,
+            'success': self._warm_up.last_success,
+        }
+
+    async def async_added_to_hass(self) -> None:
+        await super().async_added_to_hass()
+        self.async_on_remove(self._warm_up.async_add_listener(self.async_write_ha_state))
+
+
+class ThrottledSensor(SensorEntity):
+    """
+    Sensor que muda a cada requisição: a primeira mudança é gravada na hora e as seguintes são agrupadas,
+    gravando o último valor ao fim de SENSOR_WRITE_COOLDOWN_SECONDS.
+    """
+
+    _write_debouncer: Debouncer | None = None
+
+    async def async_added_to_hass(self) -> None:
+        await super().async_added_to_hass()
+        self._write_debouncer = Debouncer(self.hass, _LOGGER, cooldown=SENSOR_WRITE_COOLDOWN_SECONDS, immediate=True,
+                                          function=self.async_write_ha_state)
+        self.async_on_remove(self._write_debouncer.async_cancel)
+
+    @callback
+    def async_schedule_write_ha_state(self) -> None:
+        if self._write_debouncer is not None:
+            self._write_debouncer.async_schedule_call()
+
+
+class PromptCacheSensor(ThrottledSensor):
+    """Taxa de acerto do cache de system prompts, com hits e misses nos atributos."""
+
+    _attr_has_entity_name = True
+    _attr_name = "Prompt Cache Hit Ratio"
+    _attr_icon = "mdi:cached"
+    _attr_should_poll = False
+    _attr_entity_category = EntityCategory.DIAGNOSTIC
+    _attr_native_unit_of_measurement = PERCENTAGE
+
+    def __init__(self, config_id: str, prompt_cache: PromptRenderCache):
+        self._prompt_cache = prompt_cache
+        self._attr_device_info = get_device_general(config_id)
+        self._attr_unique_id = f'stackspot_prompt_cache_{config_id}'
+
+    @property
+    def native_value(self) -> float | None:
+        total = self._prompt_cache.hits + self._prompt_cache.misses
+        if total == 0:
+            return None
+        return _round(self._prompt_cache.hits / total * 100)
+
+    @property
+    def extra_state_attributes(self) -> dict:
+        return {
+            'hits': self._prompt_cache.hits,
+            'misses': self._prompt_cache.misses,
+            'size': self._prompt_cache.size,
+        }
+
+    async def async_added_to_hass(self) -> None:
+        await super().async_added_to_hass()
+        self.async_on_remove(self._prompt_cache.async_add_listener(self.async_schedule_write_ha_state))
+
+
+class RequestQueueSensor(ThrottledSensor):
+    """Requisições à StackSpot aguardando vaga no scheduler da conta, com a fila e as ativas por classe."""
+
+    _attr_has_entity_name = True
+    _attr_name = "Request Queue Depth"
+    _attr_icon = "mdi:tray-full"
+    _attr_should_poll = False
+    _attr_entity_category = EntityCategory.DIAGNOSTIC
+    _attr_state_class = SensorStateClass.MEASUREMENT
+    _attr_native_unit_of_measurement = "requests"
+
+    def __init__(self, config_id: str, scheduler: RequestScheduler):
+        self._scheduler = scheduler
+        self._attr_device_info = get_device_general(config_id)
+        self._attr_unique_id = f'stackspot_request_queue_{config_id}'
+
+    @property
+    def native_value(self) -> int:
+        return self._scheduler.queue_depth
+
+    @property
+    def extra_state_attributes(self) -> dict:
+        attributes = {}
+        for priority, stats in self._scheduler.stats.items():
+            name = priority.name.lower()
+            attributes[f'{name}_waiting'] = stats.waiting
+            attributes[f'{name}_active'] = stats.active
+        return attributes
+
+    async def async_added_to_hass(self) -> None:
+        await super().async_added_to_hass()
+        self.async_on_remove(self._scheduler.async_add_listener(self.async_schedule_write_ha_state))
+
+
+class RequestWaitSensor(ThrottledSensor):
+    """Espera média por uma vaga das requisições interativas, com as esperas das demais classes nos atributos."""
+
+    _attr_has_entity_name = True
+    _attr_name = "Request Wait Time"
+    _attr_icon = "mdi:timer-sand"
+    _attr_should_poll = False
+    _attr_entity_category = EntityCategory.DIAGNOSTIC
+    _attr_state_class = SensorStateClass.MEASUREMENT
+    _attr_device_class = SensorDeviceClass.DURATION
+    _attr_native_unit_of_measurement = UnitOfTime.MILLISECONDS
+
+    def __init__(self, config_id: str, scheduler: RequestScheduler):
+        self._scheduler = scheduler
+        self._attr_device_info = get_device_general(config_id)
+        self._attr_unique_id = f'stackspot_request_wait_{config_id}'
+
+    @property
+    def native_value(self) -> float | None:
+        return _round(self._scheduler.stats[RequestPriority.INTERACTIVE].average_wait_ms)
+
+    @property
+    def extra_state_attributes(self) -> dict:
+        attributes = {}
+        for priority, stats in self._scheduler.stats.items():
+            name = priority.name.lower()
+            attributes[f'{name}_requests'] = stats.requests
+            attributes[f'{name}_average_wait_ms'] = _round(stats.average_wait_ms)
+            attributes[f'{name}_last_wait_ms'] = _round(stats.last_wait_ms)
+            attributes[f'{name}_max_wait_ms'] = _round(stats.max_wait_ms)
+        return attributes
+
+    async def async_added_to_hass(self) -> None:
+        await super().async_added_to_hass()
+        self.async_on_remove(self._scheduler.async_add_listener(self.async_schedule_write_ha_state))
+
+
+class CircuitBreakerSensor(SensorEntity):
+    """Estado do circuit breaker do host de inferência, os demais hosts ficam nos atributos."""
+
+    _attr_has_entity_name = True
+    _attr_name = "API Circuit Breaker"
+    _attr_icon = "mdi:electric-switch"
+    _attr_should_poll = False
+    _attr_entity_category = EntityCategory.DIAGNOSTIC
+    _attr_device_class = SensorDeviceClass.ENUM
+    _attr_options = [state.value for state in CircuitState]
+
+    def __init__(self, config_id: str, api: StackSpotApiClient):
+        self._api = api
+        self._attr_device_info = get_device_general(config_id)
+        self._attr_unique_id = f'stackspot_circuit_breaker_{config_id}'
+
+    @property
+    def native_value(self) -> str:
+        return self._api.breakers[INFERENCE_HOST].state.value
+
+    @property
+    def extra_state_attributes(self) -> dict:
+        inference = self._api.breakers[INFERENCE_HOST]
+        return {
+            'consecutive_failures': inference.consecutive_failures,
+            'open_count': inference.open_count,
+            'hosts': {host: breaker.state.value for host, breaker in self._api.breakers.items()},
+        }
+
+    async def async_added_to_hass(self) -> None:
+        await super().async_added_to_hass()
+        self.async_on_remove(self._api.breakers[INFERENCE_HOST].async_add_listener(self.async_write_ha_state))
+
+
+class PromptSizeSensor(SensorEntity):
+    """Tamanho estimado (tokens) do último prompt enviado pelo agente, para ajustar os limites do histórico."""
+
+    _attr_has_entity_name = True
+    _attr_name = "Prompt Size"
+    _attr_icon = "mdi:text-box-outline"
+    _attr_should_poll = False
+    _attr_entity_category = EntityCategory.DIAGNOSTIC
+    _attr_state_class = SensorStateClass.MEASUREMENT
+    _attr_native_unit_of_measurement = "tokens"
+
+    def __init__(self, config: SensorConfig):
+        self._attr_device_info = get_device_info_agent(config)
+        self._attr_unique_id = f'stackspot_prompt_size_{config.config_id}'
+        self._attr_extra_state_attributes = {}
+
+    def update_prompt_size(self, tokens: int, size: int, history_messages: int, history_tokens: int) -> None:
+        self._attr_native_value = tokens
+        self._attr_extra_state_attributes = {
+            'bytes': size,
+            'history_messages': history_messages,
+            'history_tokens': history_tokens,
+        }
+        if self.hass is not None:
+            self.async_write_ha_state()
+
+
 class TokenTotalSensor(TokenSensor):
     _attr_name = "Total Tokens Count"
 
@@ -127,17 +435,28 @@ class KSDateTimeSensor(SensorEntity, RestoreEntity):
         self._attr_unique_id = f"{entry_id}_ks_last_update"
         self._attr_native_value: datetime | None = None
         self._attr_device_info = get_device_info_ks(entry_id, slug, name)
+        self._attr_extra_state_attributes = {'uploaded': 0, 'skipped': 0}
 
     async def async_set_datetime(self):
         """Atualiza a data/hora do sensor."""
         self._attr_native_value = dt_util.utcnow()
         self.async_write_ha_state()
 
+    def async_set_sync_result(self, uploaded: int, skipped: int) -> None:
+        """Conta as partes do conteúdo enviadas e as que não foram enviadas por não terem mudado."""
+        self._attr_extra_state_attributes['uploaded'] += uploaded
+        self._attr_extra_state_attributes['skipped'] += skipped
+        self.async_write_ha_state()
+
     async def async_added_to_hass(self):
         """Restaura último valor após reinício do HA."""
         await super().async_added_to_hass()
 
         last_state = await self.async_get_last_state()
+        if last_state is not None:
+            for key in self._attr_extra_state_attributes:
+                self._attr_extra_state_attributes[key] = int(last_state.attributes.get(key, 0))
+
         if last_state is None or last_state.state in ("unknown", "unavailable"):
             _LOGGER.warning("Não foi possível restaurar datetime anterior")
             return
@@ -148,3 +467,7 @@ class KSDateTimeSensor(SensorEntity, RestoreEntity):
             return
 
         self._attr_native_value = restored
+
+
+def _round(value: float | None) -> float | None:
+    return round(value, 1) if value is not None else None
@@ -0,0 +1,211 @@
+import json
+import re
+from typing import Any, Iterable
+
+TABLE_SEPARATOR = '|'
+TABLE_LIST_SEPARATOR = ','
+
+_TOKEN_PATTERN = re.compile(r'\w+|[^\w\s]|\n\s*')
+_BLOCK_PATTERN = re.compile(r'\n\s*\n')
+
+
+def to_compact_json(value: Any) -> str:
+    """JSON sem indentação e sem espaços entre os separadores."""
+    return json.dumps(value, ensure_ascii=False, separators=(',', ':'), default=str)
+
+
+def to_table(items: Iterable[dict], keys: list[str] | None = None) -> str:
+    """
+    Formato tabular: uma linha de cabeçalho com as chaves (escritas uma única vez)
+    e uma linha por item, sem indentação. Listas viram valores separados por vírgula,
+    o separador dentro de um valor é escapado com barra invertida.
+
+    entity_id|name|aliases|labels
+    light.sala|Luz sala|luz,lâmpada|
+    """
+    rows = list(items)
+    if keys is None:
+        keys = []
+        for row in rows:
+            for key in row:
+                if key not in keys:
+                    keys.append(key)
+
+    lines = [TABLE_SEPARATOR.join(keys)]
+    for row in rows:
+        lines.append(TABLE_SEPARATOR.join(_table_cell(row.get(key)) for key in keys))
+
+    return '\n'.join(lines)
+
+
+def estimate_tokens(text: str) -> int:
+    """
+    Estimativa local e rápida de tokens: palavras longas contam como vários tokens (~4 caracteres por token),
+    cada pontuação e cada quebra de linha com a indentação seguinte contam como um token.
+    """
+    tokens = 0
+    for piece in _TOKEN_PATTERN.findall(text):
+        tokens += 1 if piece[0] == '\n' else (len(piece) + 3) // 4
+    return tokens
+
+
+def split_chunks(text: str, max_chars: int) -> list[str]:
+    """
+    Divide o texto em partes com sentido próprio, cada uma com no máximo max_chars caracteres.
+    Blocos separados por linha em branco são partes diferentes; tabelas (to_table) são divididas
+    por grupo (domínio do entity_id ou primeira coluna) repetindo o cabeçalho, e JSON (to_compact_json)
+    por chave ou por itens da lista, repetindo o texto que vem antes dele na linha.
+    Assim uma mudança em uma entidade só altera a parte do grupo dela.
+    """
+    chunks = []
+    for block in _BLOCK_PATTERN.split(text):
+        block = block.strip()
+        if not block:
+            continue
+
+        lines = block.split('\n')
+        if _is_table(lines):
+            chunks.extend(_split_table(lines, max_chars))
+        elif len(block) <= max_chars:
+            chunks.append(block)
+        else:
+            chunks.extend(_split_lines(lines, max_chars))
+
+    return chunks
+
+
+def _is_table(lines: list[str]) -> bool:
+    columns = _table_columns(lines[0])
+    return len(lines) > 1 and columns > 0 and all(_table_columns(line) == columns for line in lines[1:])
+
+
+def _table_columns(line: str) -> int:
+    return line.count(TABLE_SEPARATOR) - line.count('\\' + TABLE_SEPARATOR)
+
+
+def _split_table(lines: list[str], max_chars: int) -> list[str]:
+    header, rows = lines[0], lines[1:]
+    groups: dict[str, list[str]] = {}
+    for row in rows:
+        first_cell = row.split(TABLE_SEPARATOR, 1)[0]
+        groups.setdefault(first_cell.split('.', 1)[0], []).append(row)
+
+    chunks = []
+    for group_rows in groups.values():
+        chunk = [header]
+        size = len(header)
+        for row in group_rows:
+            if len(chunk) > 1 and size + len(row) + 1 > max_chars:
+                chunks.append('\n'.join(chunk))
+                chunk, size = [header], len(header)
+            chunk.append(row)
+            size += len(row) + 1
+        chunks.append('\n'.join(chunk))
+
+    return chunks
+
+
+def _split_lines(lines: list[str], max_chars: int) -> list[str]:
+    chunks = []
+    chunk: list[str] = []
+    size = 0
+    for line in lines:
+        if len(line) > max_chars:
+            if chunk:
+                chunks.append('\n'.join(chunk))
+                chunk, size = [], 0
+            chunks.extend(_split_line(line, max_chars))
+            continue
+
+        if chunk and size + len(line) + 1 > max_chars:
+            chunks.append('\n'.join(chunk))
+            chunk, size = [], 0
+        chunk.append(line)
+        size += len(line) + 1
+
+    if chunk:
+        chunks.append('\n'.join(chunk))
+    return chunks
+
+
+def _split_line(line: str, max_chars: int) -> list[str]:
+    """Linha longa com JSON é dividida pela estrutura dele, qualquer outra é cortada no tamanho máximo."""
+    start = min((index for index in (line.find('{'), line.find('[')) if index >= 0), default=-1)
+    if start >= 0:
+        try:
+            value = json.loads(line[start:])
+        except ValueError:
+            value = None
+        if isinstance(value, (dict, list)) and value:
+            return _split_json(line[:start], value, max_chars)
+
+    return _cut(line, max_chars)
+
+
+def _split_json(prefix: str, value: dict | list, max_chars: int) -> list[str]:
+    """Agrupa chaves (ou itens) consecutivos enquanto couberem, um item grande demais é dividido por dentro."""
+    if isinstance(value, dict):
+        items = [{key: item} for key, item in value.items()]
+    else:
+        items = [[item] for item in value]
+
+    chunks = []
+    current: dict | list | None = None
+    for item in items:
+        if len(prefix) + len(to_compact_json(item)) > max_chars:
+            if current:
+                chunks.append(prefix + to_compact_json(current))
+            current = None
+            chunks.extend(_split_item(prefix, item, max_chars))
+            continue
+
+        if current is None:
+            candidate = item
+        elif isinstance(current, dict):
+            candidate = {**current, **item}
+        else:
+            candidate = current + item
+
+        if len(prefix) + len(to_compact_json(candidate)) > max_chars:
+            chunks.append(prefix + to_compact_json(current))
+            candidate = item
+        current = candidate
+
+    if current:
+        chunks.append(prefix + to_compact_json(current))
+    return chunks
+
+
+def _split_item(prefix: str, item: dict | list, max_chars: int) -> list[str]:
+    if isinstance(item, dict):
+        key, inner = next(iter(item.items()))
+        opening, closing = '{' + to_compact_json(key) + ':', '}'
+    else:
+        inner = item[0]
+        opening, closing = '[', ']'
+
+    room = max_chars - len(prefix) - len(opening) - len(closing)
+    if not isinstance(inner, (dict, list)) or not inner or room <= 2:
+        return _cut(prefix + to_compact_json(item), max_chars)
+
+    return [prefix + opening + part + closing for part in _split_json('', inner, room)]
+
+
+def _cut(text: str, max_chars: int) -> list[str]:
+    return [text[index:index + max_chars] for index in range(0, len(text), max_chars)]
+
+
+def _table_cell(value: Any) -> str:
+    if value is None:
+        return ''
+    if isinstance(value, (list, tuple, set)):
+        # Uma vírgula dentro do item (label, área) não pode parecer um novo valor da lista
+        text = TABLE_LIST_SEPARATOR.join(
+            str(item).replace(TABLE_LIST_SEPARATOR, '\\' + TABLE_LIST_SEPARATOR) for item in value
+        )
+    elif isinstance(value, dict):
+        text = to_compact_json(value) if value else ''
+    else:
+        text = str(value)
+
+    return text.replace('\n', ' ').replace(TABLE_SEPARATOR, '\\' + TABLE_SEPARATOR)
@@ -1,13 +1,19 @@
+import asyncio
 import json
 import logging
 from abc import abstractmethod
 from dataclasses import dataclass
-from typing import List, Optional
+from typing import Any, List, Optional
 
 from homeassistant.core import HomeAssistant
 
+from .serialization import to_compact_json
+
 _LOGGER = logging.getLogger(__name__)
 
+TOOL_CONCURRENCY_LIMIT = 4
+TOOL_TIMEOUT_SECONDS = 15
+
 _tool_call_example: dict = {
     "tool_call": [
         {
@@ -73,12 +79,22 @@ class Tool:
     name: str
     description: str
     parameters: dict
+    # Tools somente leitura podem ter o resultado reaproveitado no turno, as demais sempre executam
+    read_only: bool = False
 
     @abstractmethod
     async def async_call(self, hass: HomeAssistant, tool_input: ToolInput) -> ToolResult:
         """Call the tool."""
         raise NotImplementedError
 
+    def entity_ids(self, tool_input: ToolInput) -> Optional[frozenset[str]]:
+        """
+        Entidades lidas ou alteradas pela chamada. Chamadas com entidades em comum rodam em sequência,
+        na ordem pedida pelo LLM; um conjunto vazio indica que a chamada é independente.
+        None indica que a chamada pode afetar qualquer entidade e roda isolada das demais.
+        """
+        return frozenset() if self.read_only else None
+
     def to_dict(self) -> dict:
         return {
             "name": self.name,
@@ -93,6 +109,10 @@ class EntityStateTool(Tool):
     parameters = {
         "entity_id": "string"
     }
+    read_only = True
+
+    def entity_ids(self, tool_input: ToolInput) -> Optional[frozenset[str]]:
+        return _parse_entity_ids(tool_input.parameters.get('entity_id'))
 
     async def async_call(self, hass: HomeAssistant, tool_input: ToolInput) -> ToolResult:
         state = hass.states.get(tool_input.parameters['entity_id'])
@@ -128,6 +148,20 @@ class CallServiceTool(Tool):
         except Exception as e:
             return ToolResult.of_fail(tool_input.identifier, {"error": str(e)})
 
+    def entity_ids(self, tool_input: ToolInput) -> Optional[frozenset[str]]:
+        # Serviços na mesma entidade (ex.: ligar e depois ajustar o brilho) e leituras dela mantêm a ordem.
+        # Sem entity_id (área, dispositivo ou serviço global) a chamada pode afetar qualquer entidade.
+        entity_ids: set[str] = set()
+        for container in (tool_input.parameters, tool_input.parameters.get("data")):
+            if not isinstance(container, dict):
+                continue
+            entity_ids |= _parse_entity_ids(container.get("entity_id"))
+            target = container.get("target")
+            if isinstance(target, dict):
+                entity_ids |= _parse_entity_ids(target.get("entity_id"))
+
+        return frozenset(entity_ids) or None
+
 
 class GetTodoItemsTool(Tool):
     name = "get_todo_items"
@@ -136,6 +170,10 @@ class GetTodoItemsTool(Tool):
         "entity_id": "string",
         "status": ["string"]
     }
+    read_only = True
+
+    def entity_ids(self, tool_input: ToolInput) -> Optional[frozenset[str]]:
+        return _parse_entity_ids(tool_input.parameters.get('entity_id'))
 
     async def async_call(self, hass: HomeAssistant, tool_input: ToolInput) -> ToolResult:
         entity_id = tool_input.parameters.get("entity_id")
@@ -169,29 +207,161 @@ TOOLS_CLASS: dict[str, type[Tool]] = {
 }
 
 PROMPT_TOOLS: str = (_tools_orientation
-                     .replace("{{tools}}", json.dumps(_tools, indent=2, ensure_ascii=False))
-                     .replace("{{tool_call_example}}", json.dumps(_tool_call_example, indent=2, ensure_ascii=False))
+                     .replace("{{tools}}", to_compact_json(_tools))
+                     .replace("{{tool_call_example}}", to_compact_json(_tool_call_example))
                      )
 
 
-async def process_response_tools(hass: HomeAssistant, response: str) -> dict:
+async def process_response_tools(hass: HomeAssistant, response: str,
+                                 tool_cache: Optional[dict[str, ToolResult]] = None,
+                                 call_counts: Optional[dict[str, int]] = None) -> dict:
+    """
+    Executa as tools pedidas na resposta do LLM.
+    Chamadas independentes rodam em paralelo (até TOOL_CONCURRENCY_LIMIT, cada uma com TOOL_TIMEOUT_SECONDS),
+    chamadas com entidades em comum (Tool.entity_ids) rodam na ordem pedida.
+
+    Com tool_cache, chamadas idênticas de tools somente leitura reaproveitam o resultado no turno.
+    Uma tool com efeito (call_service) sempre executa e descarta o que estava memorizado, já que o estado mudou.
+    Com call_counts, as chamadas do turno são contadas e "repeated" indica quantas já tinham sido feitas.
+    """
     tools: Optional[List[ToolInput]] = _parse_tool_response(response)
     if not tools:
         return {"tools": False}
 
-    results: list[dict] = []
-    for tool_input in tools:
-        cls: type(Tool) = TOOLS_CLASS[tool_input.name]
-        result: ToolResult = await cls().async_call(hass, tool_input)
-        results.append(result.to_dict())
-
-    result_content: str = json.dumps(results, indent=2, ensure_ascii=False)
+    if tool_cache is None:
+        tool_cache = {}
+    if call_counts is None:
+        call_counts = {}
+
+    keys = [_tool_cache_key(tool_input) for tool_input in tools]
+    has_side_effects = any(_has_side_effects(tool_input) for tool_input in tools)
+    if has_side_effects:
+        # Leituras memorizadas antes da ação não valem mais, e leituras desta resposta podem ver o estado
+        # antes ou depois da ação, por isso não são memorizadas
+        tool_cache.clear()
+
+    repeated = 0
+    for key in keys:
+        repeated += 1 if call_counts.get(key) else 0
+        call_counts[key] = call_counts.get(key, 0) + 1
+
+    # Separa o que precisa executar, leituras idênticas executam uma única vez
+    results: list[Optional[ToolResult]] = [None] * len(tools)
+    to_execute: list[int] = []
+    executing: set[str] = set()
+    for index, tool_input in enumerate(tools):
+        if not has_side_effects and _is_read_only(tool_input):
+            if keys[index] in tool_cache:
+                results[index] = tool_cache[keys[index]]
+                continue
+            if keys[index] in executing:
+                continue
+            executing.add(keys[index])
+        to_execute.append(index)
+
+    dependencies = _dependencies(tools, to_execute)
+    done: dict[int, asyncio.Event] = {index: asyncio.Event() for index in to_execute}
+    semaphore = asyncio.Semaphore(TOOL_CONCURRENCY_LIMIT)
+
+    async def run(index: int) -> None:
+        try:
+            for dependency in dependencies[index]:
+                await done[dependency].wait()
+            async with semaphore:
+                results[index] = await _call_tool(hass, tools[index])
+            if not has_side_effects and _is_read_only(tools[index]):
+                tool_cache[keys[index]] = results[index]
+        finally:
+            done[index].set()
+
+    await asyncio.gather(*(run(index) for index in to_execute))
+
+    content: list[dict] = []
+    for index, tool_input in enumerate(tools):
+        result: ToolResult = results[index] or tool_cache[keys[index]]
+        content.append(ToolResult(tool_input.identifier, result.success, result.result).to_dict())
+
+    result_content: str = to_compact_json(content)
     return {
         "tools": True,
-        "content": result_content
+        "content": result_content,
+        "executed": len(to_execute),
+        "memoized": len(tools) - len(to_execute),
+        "repeated": repeated,
     }
 
 
+async def _call_tool(hass: HomeAssistant, tool_input: ToolInput) -> ToolResult:
+    cls: Optional[type[Tool]] = TOOLS_CLASS.get(tool_input.name)
+    if cls is None:
+        return ToolResult.of_fail(tool_input.identifier, {"error": f"Unknown tool: {tool_input.name}"})
+
+    try:
+        async with asyncio.timeout(TOOL_TIMEOUT_SECONDS):
+            return await cls().async_call(hass, tool_input)
+    except TimeoutError:
+        _LOGGER.warning(f"Tool {tool_input.name} timed out after {TOOL_TIMEOUT_SECONDS}s")
+        return ToolResult.of_fail(tool_input.identifier, {"error": "timeout"})
+
+
+def _is_read_only(tool_input: ToolInput) -> bool:
+    cls: Optional[type[Tool]] = TOOLS_CLASS.get(tool_input.name)
+    return cls is not None and cls.read_only
+
+
+def _has_side_effects(tool_input: ToolInput) -> bool:
+    cls: Optional[type[Tool]] = TOOLS_CLASS.get(tool_input.name)
+    return cls is not None and not cls.read_only
+
+
+def _dependencies(tools: List[ToolInput], to_execute: list[int]) -> dict[int, list[int]]:
+    """
+    Para cada chamada, as chamadas anteriores que precisam terminar antes dela: a última de cada entidade
+    em comum, ou todas quando uma das duas pode afetar qualquer entidade.
+    """
+    dependencies: dict[int, list[int]] = {}
+    last_by_entity: dict[str, int] = {}
+    last_global: Optional[int] = None
+    previous: list[int] = []
+
+    for index in to_execute:
+        entity_ids = _entity_ids(tools[index])
+        if entity_ids is None:
+            dependencies[index] = list(previous)
+            last_global = index
+            last_by_entity.clear()
+        else:
+            depends_on = {last_by_entity[entity_id] for entity_id in entity_ids if entity_id in last_by_entity}
+            if last_global is not None:
+                depends_on.add(last_global)
+            dependencies[index] = sorted(depends_on)
+            for entity_id in entity_ids:
+                last_by_entity[entity_id] = index
+        previous.append(index)
+
+    return dependencies
+
+
+def _entity_ids(tool_input: ToolInput) -> Optional[frozenset[str]]:
+    cls: Optional[type[Tool]] = TOOLS_CLASS.get(tool_input.name)
+    if cls is None:
+        return frozenset()
+    return cls().entity_ids(tool_input)
+
+
+def _parse_entity_ids(value: Any) -> frozenset[str]:
+    """entity_id como string, lista ou string separada por vírgulas."""
+    if isinstance(value, str):
+        value = value.split(',')
+    if not isinstance(value, (list, tuple, set)):
+        return frozenset()
+    return frozenset(part.strip() for item in value for part in str(item).split(',') if part.strip())
+
+
+def _tool_cache_key(tool_input: ToolInput) -> str:
+    return f'{tool_input.name}:{json.dumps(tool_input.parameters, sort_keys=True, default=str)}'
+
+
 def _parse_tool_response(response: str) -> Optional[List[ToolInput]]:
     """
     Valida e converte a resposta do LLM em uma lista de ToolInput.
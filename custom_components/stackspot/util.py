@@ -1,36 +1,65 @@
+import asyncio
 import logging
 import re
 import unicodedata
-from pathlib import Path
+from collections import OrderedDict
+from functools import lru_cache
 from typing import Any
 
-import aiofiles
-import yaml
 from homeassistant.auth.models import User
 from homeassistant.components.conversation import ConversationInput
 from homeassistant.const import STATE_UNKNOWN
 from homeassistant.core import HomeAssistant
 from homeassistant.helpers import entity_registry
 from homeassistant.helpers.device_registry import DeviceInfo, DeviceEntryType
-from homeassistant.helpers.template import Template
+from homeassistant.helpers.template import RenderInfo, Template
+from jinja2 import Environment, TemplateSyntaxError, meta
 
 from . import StackSpotEntityManager
+from .client.scheduler import RequestPriority, RequestScheduler
+from .client.stackspot_client import StackSpotApiClient
+from .client.token_manager import StackSpotTokenManager
+from .catalog import Catalog, ExposedEntityIndex, ScriptCatalog, ServiceCatalog
 from .const import (
     DOMAIN,
     INTEGRATION_NAME,
     MANAGER,
+    API_CLIENT,
+    TOKEN_MANAGER,
+    REQUEST_SCHEDULER,
+    VARIABLES_READY,
+    VARIABLES_READY_TIMEOUT,
+    CONF_REQUEST_CONCURRENCY,
+    CONF_REQUEST_CONCURRENCY_DEFAULT,
+    CONF_REQUEST_CONCURRENCY_AI_TASK,
+    CONF_REQUEST_CONCURRENCY_AI_TASK_DEFAULT,
+    CONF_REQUEST_CONCURRENCY_KS,
+    CONF_REQUEST_CONCURRENCY_KS_DEFAULT,
     TEMPLATE_KEY_EXPOSED_ENTITIES,
     TEMPLATE_KEY_TOOLS,
     TEMPLATE_KEY_TOOLS_PROMPT,
     TEMPLATE_KEY_ALL_VARIABLES,
     TEMPLATE_KEY_SERVICES,
     TEMPLATE_KEY_SCRIPTS,
+    TEMPLATE_FUNCTION_TO_TABLE,
+    TEMPLATE_FUNCTION_TO_COMPACT_JSON,
 )
-from .data_utils import SensorConfig
+from .data_utils import SensorConfig, StackSpotLogin
+from .serialization import to_table, to_compact_json
 from .tools import PROMPT_TOOLS, _tools
 
 _LOGGER = logging.getLogger(__name__)
 
+TEMPLATE_CACHE_SIZE = 32
+_TEMPLATE_CACHE: OrderedDict[str, Template] = OrderedDict()
+TEMPLATE_FUNCTIONS = {
+    TEMPLATE_FUNCTION_TO_TABLE: to_table,
+    TEMPLATE_FUNCTION_TO_COMPACT_JSON: to_compact_json,
+}
+
+# Usado apenas para ler a AST, com as mesmas extensões do ambiente de templates do HA
+_JINJA_PARSER = Environment(extensions=['jinja2.ext.loopcontrols', 'jinja2.ext.do'])
+
 
 def get_device_info_agent(config: SensorConfig) -> DeviceInfo:
     device_identifier = f'stackspot_agent_device_{config.config_id}'
@@ -68,104 +97,88 @@ def get_device_info_ks(entry_id: str, slug: str, name: str) -> DeviceInfo:
     )
 
 
-async def render_template(hass: HomeAssistant, template_str: str, variables: dict = None) -> Any:
-    all_variables = variables | get_variables(hass)
+def get_template(hass: HomeAssistant, template_str: str) -> Template:
+    """
+    Retorna o Template do cache LRU (chave: código do template), o Jinja é compilado apenas uma vez.
+    Um template reconfigurado tem outro código, então gera uma nova entrada e a antiga sai pelo LRU.
+    """
+    tpl = _TEMPLATE_CACHE.get(template_str)
+    if tpl is not None and tpl.hass is hass:
+        _TEMPLATE_CACHE.move_to_end(template_str)
+        return tpl
 
     tpl = Template(template_str, hass)
-    result = tpl.async_render(all_variables, parse_result=False)
+    _TEMPLATE_CACHE[template_str] = tpl
+    if len(_TEMPLATE_CACHE) > TEMPLATE_CACHE_SIZE:
+        _TEMPLATE_CACHE.popitem(last=False)
+    return tpl
 
-    # Decodifica escapes Unicode e caracteres especiais (em outras palavrs: quebra as linhas)
-    if isinstance(result, str):
-        result = result.encode().decode('unicode_escape')
 
-    return result
+def clear_template_cache() -> None:
+    _TEMPLATE_CACHE.clear()
 
 
-async def load_exposed_entities(hass: HomeAssistant):
-    registry = entity_registry.async_get(hass)
-
-    exposed_entities = []
-    for entity_id, entry in registry.entities.items():
-        if entry.options.get('conversation', {}).get('should_expose', False):
-            exposed_entities.append(entry)
-
-    list_dict = []
-    for entity in exposed_entities:
-        list_dict.append({
-            'entity_id': entity.entity_id,
-            'name': entity.as_partial_dict.get('original_name', ''),
-            'aliases': list(entity.aliases),
-            'labels': entity.as_partial_dict.get('labels', [])
-        })
-
-    manager: StackSpotEntityManager = hass.data[DOMAIN][MANAGER]
-    manager.add_objetc(TEMPLATE_KEY_EXPOSED_ENTITIES, list_dict)
-    _LOGGER.info('Expose entities in manager updated!')
-
+async def render_template(hass: HomeAssistant, template_str: str, variables: dict = None) -> Any:
+    all_variables = variables | get_variables(hass, get_template_variable_names(template_str))
 
-async def load_scripts_from_yaml(hass: HomeAssistant):
-    """Lê scripts diretamente do arquivo scripts.yaml."""
+    tpl = get_template(hass, template_str)
+    result = tpl.async_render(all_variables, parse_result=False)
 
-    scripts_list = []
+    return _decode_result(result)
 
-    try:
-        config_path = Path(hass.config.config_dir)
-        scripts_file = config_path / "scripts.yaml"
 
-        if not scripts_file.exists():
-            _LOGGER.warning(f"File scripts.yaml not found in {scripts_file}")
-            return scripts_list
+async def render_template_to_info(hass: HomeAssistant, template_str: str,
+                                  variables: dict = None) -> tuple[Any, RenderInfo]:
+    """Renderiza o template e retorna também o RenderInfo (entidades, domínios e tempo usados no render)."""
+    all_variables = variables | get_variables(hass, get_template_variable_names(template_str))
 
-        data = None
-        async with aiofiles.open(scripts_file, 'r', encoding='utf-8') as file:
-            data = await file.read()
+    tpl = get_template(hass, template_str)
+    render_info = tpl.async_render_to_info(all_variables, parse_result=False)
 
-        scripts_data = yaml.safe_load(data) or {}
+    return _decode_result(render_info.result()), render_info
 
-        registry = entity_registry.async_get(hass)
 
-        for script_id, script_config in scripts_data.items():
-            entity_id = f"script.{script_id}"
+def _decode_result(result: Any) -> Any:
+    # Decodifica escapes Unicode e caracteres especiais (em outras palavrs: quebra as linhas)
+    if isinstance(result, str):
+        result = result.encode().decode('unicode_escape')
 
-            script_dict = {
-                'entity_id': entity_id,
-                'name': script_config.get('alias', script_id),
-                'description': script_config.get('description', ''),
-                'fields': script_config.get('fields', {}),
-            }
+    return result
 
-            entry = registry.entities.get(entity_id)
-            if entry is not None:
-                script_dict['aliases'] = list(entry.aliases)
-                script_dict['labels'] = entry.as_partial_dict.get('labels', [])
 
-            scripts_list.append(script_dict)
+async def load_exposed_entities(hass: HomeAssistant):
+    """Cria o índice de entidades expostas, que depois é mantido pelos eventos do entity registry."""
+    manager: StackSpotEntityManager = hass.data[DOMAIN][MANAGER]
+    if manager.has_object(TEMPLATE_KEY_EXPOSED_ENTITIES):
+        return
 
-        manager: StackSpotEntityManager = hass.data[DOMAIN][MANAGER]
-        manager.add_objetc(TEMPLATE_KEY_SCRIPTS, scripts_list)
-        _LOGGER.info(f'Scripts from YAML loaded! Found {len(scripts_list)} scripts.')
+    index = ExposedEntityIndex(hass)
+    index.async_start()
+    manager.add_objetc(TEMPLATE_KEY_EXPOSED_ENTITIES, index)
 
-    except Exception as e:
-        _LOGGER.error(f"Error reading scripts.yaml: {e}")
 
+async def load_scripts_from_yaml(hass: HomeAssistant):
+    """Carrega os scripts do scripts.yaml, relendo o arquivo apenas quando ele muda."""
+    manager: StackSpotEntityManager = hass.data[DOMAIN][MANAGER]
 
-async def load_services(hass: HomeAssistant):
-    services_list = []
+    if manager.has_object(TEMPLATE_KEY_SCRIPTS):
+        await manager.get_object_by(TEMPLATE_KEY_SCRIPTS).async_refresh()
+        return
 
-    for domain, services in hass.services.async_services().items():
-        for service_name, service_info in services.items():
-            service_dict = {
-                "domain": domain,
-                "service": service_name,
-                "name": f"{domain}.{service_name}"
-            }
+    scripts = ScriptCatalog(hass)
+    await scripts.async_start()
+    manager.add_objetc(TEMPLATE_KEY_SCRIPTS, scripts)
 
-            if domain != "script":
-                services_list.append(service_dict)
 
+async def load_services(hass: HomeAssistant):
+    """Cria o catálogo de serviços, que depois é mantido pelos eventos de registro/remoção de serviços."""
     manager: StackSpotEntityManager = hass.data[DOMAIN][MANAGER]
-    manager.add_objetc(TEMPLATE_KEY_SERVICES, services_list)
-    _LOGGER.info('Services and scripts in manager updated!')
+    if manager.has_object(TEMPLATE_KEY_SERVICES):
+        return
+
+    services = ServiceCatalog(hass)
+    services.async_start()
+    manager.add_objetc(TEMPLATE_KEY_SERVICES, services)
 
 
 def create_slug(text: str) -> str:
@@ -198,6 +211,50 @@ async def get_username_by_conversation_input(hass: HomeAssistant, conversation:
     return STATE_UNKNOWN
 
 
+def unload_variables(hass: HomeAssistant) -> None:
+    """Para os catálogos mantidos por eventos, chamado quando a última entry é descarregada."""
+    manager: StackSpotEntityManager = hass.data[DOMAIN][MANAGER]
+
+    exposed_entities: ExposedEntityIndex | None = manager.remove_object(TEMPLATE_KEY_EXPOSED_ENTITIES)
+    if exposed_entities is not None:
+        exposed_entities.async_stop()
+
+    scripts: ScriptCatalog | None = manager.remove_object(TEMPLATE_KEY_SCRIPTS)
+    if scripts is not None:
+        scripts.async_stop()
+
+    services: ServiceCatalog | None = manager.remove_object(TEMPLATE_KEY_SERVICES)
+    if services is not None:
+        services.async_stop()
+
+    manager.remove_object(VARIABLES_READY)
+
+
+def get_variables_ready(hass: HomeAssistant) -> asyncio.Event:
+    """Sinaliza que as variáveis dos templates (catálogos) foram carregadas."""
+    manager: StackSpotEntityManager = hass.data[DOMAIN][MANAGER]
+    if not manager.has_object(VARIABLES_READY):
+        manager.add_objetc(VARIABLES_READY, asyncio.Event())
+
+    return manager.get_object_by(VARIABLES_READY)
+
+
+async def async_wait_variables_ready(hass: HomeAssistant, timeout: float = VARIABLES_READY_TIMEOUT) -> bool:
+    """Aguarda o carregamento das variáveis, que acontece em background depois do start do HA."""
+    ready = get_variables_ready(hass)
+    if ready.is_set():
+        return True
+
+    try:
+        async with asyncio.timeout(timeout):
+            await ready.wait()
+    except TimeoutError:
+        _LOGGER.warning(f'Template variables not loaded after {timeout}s, rendering without them')
+        return False
+
+    return True
+
+
 async def load_init_variables(hass: HomeAssistant):
     manager: StackSpotEntityManager = hass.data[DOMAIN][MANAGER]
 
@@ -205,17 +262,118 @@ async def load_init_variables(hass: HomeAssistant):
     manager.add_objetc(TEMPLATE_KEY_TOOLS_PROMPT, PROMPT_TOOLS)
 
 
-def get_variables(hass: HomeAssistant) -> dict:
+def get_api_client(hass: HomeAssistant) -> StackSpotApiClient:
+    """Retorna o client compartilhado, que reaproveita o pool de conexões."""
     manager: StackSpotEntityManager = hass.data[DOMAIN][MANAGER]
+    return manager.get_object_by(API_CLIENT)
+
 
-    variables = {
-        TEMPLATE_KEY_EXPOSED_ENTITIES: manager.get_object_by(TEMPLATE_KEY_EXPOSED_ENTITIES),
-        TEMPLATE_KEY_TOOLS: manager.get_object_by(TEMPLATE_KEY_TOOLS),
-        TEMPLATE_KEY_TOOLS_PROMPT: manager.get_object_by(TEMPLATE_KEY_TOOLS_PROMPT),
-        TEMPLATE_KEY_SERVICES: manager.get_object_by(TEMPLATE_KEY_SERVICES),
-        TEMPLATE_KEY_SCRIPTS: manager.get_object_by(TEMPLATE_KEY_SCRIPTS),
-    }
+def get_token_manager(hass: HomeAssistant, login: StackSpotLogin) -> StackSpotTokenManager:
+    """Retorna o gerenciador de token da conta (realm, client_id), criando-o no primeiro uso."""
+    manager: StackSpotEntityManager = hass.data[DOMAIN][MANAGER]
+    key = f'{TOKEN_MANAGER}_{login.realm}_{login.client_id}'
+
+    if not manager.has_object(key):
+        token_manager = StackSpotTokenManager(hass, get_api_client(hass), login.realm, login.client_id,
+                                              login.client_key)
+        manager.add_objetc(key, token_manager)
+
+    return manager.get_object_by(key)
+
+
+def remove_token_manager(hass: HomeAssistant, login: StackSpotLogin) -> None:
+    manager: StackSpotEntityManager = hass.data[DOMAIN][MANAGER]
+    token_manager: StackSpotTokenManager | None = manager.remove_object(
+        f'{TOKEN_MANAGER}_{login.realm}_{login.client_id}')
+    if token_manager is not None:
+        token_manager.async_shutdown()
+
+
+def get_request_scheduler(hass: HomeAssistant, login: StackSpotLogin,
+                          limits: dict[str, int] | None = None) -> RequestScheduler:
+    """
+    Retorna o scheduler de requisições da conta (realm, client_id), criando-o no primeiro uso.
+    limits (as options da conta) só são usados na criação, feita no setup da entry.
+    """
+    manager: StackSpotEntityManager = hass.data[DOMAIN][MANAGER]
+    key = f'{REQUEST_SCHEDULER}_{login.realm}_{login.client_id}'
+
+    if not manager.has_object(key):
+        limits = limits or {}
+        scheduler = RequestScheduler(
+            int(limits.get(CONF_REQUEST_CONCURRENCY, CONF_REQUEST_CONCURRENCY_DEFAULT)),
+            {
+                RequestPriority.AI_TASK: int(
+                    limits.get(CONF_REQUEST_CONCURRENCY_AI_TASK, CONF_REQUEST_CONCURRENCY_AI_TASK_DEFAULT)),
+                RequestPriority.KS_SYNC: int(
+                    limits.get(CONF_REQUEST_CONCURRENCY_KS, CONF_REQUEST_CONCURRENCY_KS_DEFAULT)),
+            },
+        )
+        manager.add_objetc(key, scheduler)
+
+    return manager.get_object_by(key)
+
+
+def remove_request_scheduler(hass: HomeAssistant, login: StackSpotLogin) -> None:
+    manager: StackSpotEntityManager = hass.data[DOMAIN][MANAGER]
+    manager.remove_object(f'{REQUEST_SCHEDULER}_{login.realm}_{login.client_id}')
 
-    variables[TEMPLATE_KEY_ALL_VARIABLES] = variables.copy()
+
+def get_variables_version(hass: HomeAssistant) -> tuple[int, ...]:
+    """Versões dos catálogos (entidades expostas, scripts e serviços), mudam a cada alteração deles."""
+    manager: StackSpotEntityManager = hass.data[DOMAIN][MANAGER]
+
+    versions = []
+    for key in (TEMPLATE_KEY_EXPOSED_ENTITIES, TEMPLATE_KEY_SCRIPTS, TEMPLATE_KEY_SERVICES):
+        catalog: Catalog | None = manager.get_object_by(key)
+        versions.append(catalog.version if catalog is not None else -1)
+
+    return tuple(versions)
+
+
+def get_variables(hass: HomeAssistant, names: frozenset[str] | None = None) -> dict:
+    """
+    Variáveis da integração para os templates. Com names (get_template_variable_names), apenas as variáveis
+    referenciadas pelo template são montadas; um catálogo referenciado entrega a lista completa
+    (materializada uma vez por versão), e referenciar all_variables entrega todas.
+    """
+    manager: StackSpotEntityManager = hass.data[DOMAIN][MANAGER]
+
+    if names is not None and TEMPLATE_KEY_ALL_VARIABLES in names:
+        names = None
+
+    def wanted(key: str) -> bool:
+        return names is None or key in names
+
+    variables = {}
+    for key in (TEMPLATE_KEY_EXPOSED_ENTITIES, TEMPLATE_KEY_SERVICES, TEMPLATE_KEY_SCRIPTS):
+        if wanted(key):
+            catalog: Catalog | None = manager.get_object_by(key)
+            variables[key] = catalog.as_list() if catalog is not None else None
+
+    for key in (TEMPLATE_KEY_TOOLS, TEMPLATE_KEY_TOOLS_PROMPT):
+        if wanted(key):
+            variables[key] = manager.get_object_by(key)
+
+    if names is None:
+        variables[TEMPLATE_KEY_ALL_VARIABLES] = variables.copy()
+
+    # Funções ficam fora do all_variables, que precisa continuar serializável com tojson
+    for key, function in TEMPLATE_FUNCTIONS.items():
+        if wanted(key):
+            variables[key] = function
 
     return variables
+
+
+@lru_cache(maxsize=TEMPLATE_CACHE_SIZE)
+def get_template_variable_names(template_str: str) -> frozenset[str] | None:
+    """
+    Nomes de variáveis usados pelo template, a partir da AST do Jinja (calculado uma vez por template).
+    Retorna None quando não é possível analisar, nesse caso todas as variáveis são entregues.
+    """
+    try:
+        ast = _JINJA_PARSER.parse(template_str)
+    except TemplateSyntaxError:
+        return None
+    return frozenset(meta.find_undeclared_variables(ast))
@@ -0,0 +1,94 @@
+import logging
+import time
+from datetime import datetime, timedelta
+from typing import Callable
+
+from homeassistant.core import HomeAssistant, CALLBACK_TYPE, callback
+from homeassistant.helpers.event import async_track_time_interval
+
+from .client.stackspot_client import StackSpotApiClient, KEEPALIVE_SECONDS
+from .client.token_manager import StackSpotTokenManager
+
+_LOGGER = logging.getLogger(__name__)
+
+# A conexão aquecida só serve enquanto o keep-alive do pool não a fecha: a verificação roda na metade
+# do keep-alive e aquece quando a conexão está parada há pelo menos esse tempo, antes de ela expirar
+WARM_UP_INTERVAL = timedelta(seconds=KEEPALIVE_SECONDS / 2)
+# Sem conversas por mais que isso o warm-up para (até a próxima conversa), para não fazer
+# uma requisição por minuto para sempre em uma instalação sem uso
+WARM_UP_MAX_IDLE = timedelta(hours=2)
+
+
+class StackSpotWarmUp:
+    """
+    Aquece o token e a conexão com o host de inferência no setup e periodicamente enquanto ocioso,
+    para que o primeiro comando de voz não pague DNS, TLS e OAuth.
+    """
+
+    def __init__(self, hass: HomeAssistant, api: StackSpotApiClient, token_manager: StackSpotTokenManager) -> None:
+        self.hass = hass
+        self._api = api
+        self._token_manager = token_manager
+        self._unsub_interval: CALLBACK_TYPE | None = None
+        self._listeners: list[Callable[[], None]] = []
+        self._started_at: float = time.monotonic()
+        self._last_warm_up_at: float = 0.0
+
+        self.last_duration_ms: float | None = None
+        self.last_warm_up: datetime | None = None
+        self.last_success: bool | None = None
+
+    @callback
+    def async_start(self) -> None:
+        """Executa o warm-up em background e agenda as execuções periódicas."""
+        self._started_at = time.monotonic()
+        self.hass.async_create_background_task(self.async_warm_up(), 'stackspot-warm-up')
+        self._unsub_interval = async_track_time_interval(self.hass, self._async_interval, WARM_UP_INTERVAL)
+
+    @callback
+    def async_stop(self) -> None:
+        if self._unsub_interval is not None:
+            self._unsub_interval()
+            self._unsub_interval = None
+
+    @callback
+    def async_add_listener(self, listener: Callable[[], None]) -> CALLBACK_TYPE:
+        self._listeners.append(listener)
+
+        @callback
+        def remove_listener() -> None:
+            if listener in self._listeners:
+                self._listeners.remove(listener)
+
+        return remove_listener
+
+    def should_warm_up(self) -> bool:
+        """
+        A conexão está parada há tempo suficiente para expirar antes da próxima verificação,
+        e houve conversa (ou o setup) há no máximo WARM_UP_MAX_IDLE.
+        """
+        now = time.monotonic()
+        last_activity = max(self._api.last_inference_activity, self._started_at)
+        if now - last_activity > WARM_UP_MAX_IDLE.total_seconds():
+            return False
+
+        last_use = max(self._api.last_inference_activity, self._last_warm_up_at)
+        return now - last_use >= KEEPALIVE_SECONDS - WARM_UP_INTERVAL.total_seconds()
+
+    async def async_warm_up(self) -> None:
+        start = time.perf_counter()
+        access_token = await self._token_manager.async_get_token()
+        connected = await self._api.warm_up()
+        self._last_warm_up_at = time.monotonic()
+
+        self.last_duration_ms = (time.perf_counter() - start) * 1000
+        self.last_warm_up = datetime.now()
+        self.last_success = access_token is not None and connected
+        _LOGGER.debug(f"Warm-up finished in {self.last_duration_ms:.0f} ms (success={self.last_success})")
+
+        for listener in list(self._listeners):
+            listener()
+
+    async def _async_interval(self, now: datetime) -> None:
+        if self.should_warm_up():
+            await self.async_warm_up()
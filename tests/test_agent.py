@@ -1,52 +1,196 @@
-from unittest.mock import AsyncMock, MagicMock
+import asyncio
+from dataclasses import replace
+from unittest.mock import AsyncMock, MagicMock, patch
 
 import pytest
-from aiohttp import ClientSession
 from homeassistant.components.conversation import ConversationInput, ConversationResult
 from homeassistant.core import HomeAssistant
 from homeassistant.helpers.intent import IntentResponse
 
-from custom_components.stackspot.agent import StackSpotAgent
+from custom_components.stackspot import MANAGER, StackSpotEntityManager
+from custom_components.stackspot.agent import (
+    STALE_TURN_RESPONSE,
+    TOOL_LOOP_LIMIT_RESPONSE,
+    ChatLogStream,
+    StackSpotAgent,
+)
+from custom_components.stackspot.const import DOMAIN
+from custom_components.stackspot.data_utils import StackSpotAgentConfig
+
+
+def _agent(hass: HomeAssistant, **config) -> StackSpotAgent:
+    hass.data.setdefault(DOMAIN, {})[MANAGER] = MagicMock(spec=StackSpotEntityManager,
+                                                          get_object_by=MagicMock(return_value=None))
+    config = replace(StackSpotAgentConfig(
+        entry_id="entry", subentry_id="agente", agent_name="agente", agent_id="agent-id", realm="meu-realm",
+        client_id="meu-client-id", client_key="meu-client-key", max_messages_history=10, history_token_budget=1000,
+        history_summary=False, prompt="", allow_control=False, llm_model="", streaming=False, cancel_stale_turn=True,
+        max_tool_iterations=5, tool_loop_timeout=0, tool_loop_token_budget=0,
+    ), **config)
+    with patch("custom_components.stackspot.agent.get_token_manager"), \
+            patch("custom_components.stackspot.agent.get_request_scheduler"), \
+            patch("custom_components.stackspot.agent.get_api_client"):
+        return StackSpotAgent(hass, config)
+
+
+def _user_input(text: str, conversation_id: str | None = "123") -> ConversationInput:
+    return ConversationInput(text=text, language="pt", conversation_id=conversation_id, context=MagicMock(),
+                             device_id="device-test", satellite_id=None, agent_id="stackspot")
 
 
 @pytest.mark.asyncio
 async def test_process_retorna_resposta_valida(hass: HomeAssistant):
     agent_response : str = 'Resposta da Stackspot'
 
-    config = {
-        "realm": "meu-realm",
-        "client_id": "meu-client-id",
-        "client_key": "meu-client-key",
-        "agent": "agent-id"
-    }
+    agent = _agent(hass, cancel_stale_turn=False)
+    agent._get_access_token = AsyncMock(return_value="fake-token")
+    agent._get_system_prompt = AsyncMock(return_value="<system_prompt></system_prompt>")
+    agent._history = MagicMock(get=MagicMock(return_value=None),
+                               async_add_message=AsyncMock(return_value=MagicMock(messages=[])))
+    agent._api = MagicMock(send_prompt=AsyncMock(return_value={"message": agent_response}))
 
-    agent = StackSpotAgent(hass, config)
+    with patch("custom_components.stackspot.agent.get_username_by_conversation_input",
+               AsyncMock(return_value="usuario")):
+        result : ConversationResult = await agent.async_process(_user_input("Oi agente"))
 
-    # Mock do token
-    agent._get_access_token = AsyncMock(return_value="fake-token")
+    assert isinstance(result.response, IntentResponse)
+    assert result.response.speech["plain"]["speech"] == agent_response
+    agent._api.send_prompt.assert_awaited_once()
+
+
+@pytest.mark.asyncio
+async def test_turno_novo_cancela_turno_gravando_a_mensagem(hass: HomeAssistant):
+    agent = _agent(hass)
+    adding, release = asyncio.Event(), asyncio.Event()
+
+    async def add_message(conversation_id, role, content):
+        if content == "primeiro":
+            adding.set()
+            await release.wait()
 
-    # Cria um mock de resposta que funciona com `async with`
-    mock_response = AsyncMock()
-    mock_response.status = 200
-    mock_response.json = AsyncMock(return_value={"message": agent_response})
-
-    # Mock da session com post que suporta `async with`
-    mock_session = MagicMock(spec=ClientSession)
-    mock_session.post.return_value.__aenter__.return_value = mock_response
-    mock_session.post.return_value.__aexit__.return_value = AsyncMock()
-
-    agent._session = mock_session
-
-    user_input = ConversationInput(
-        text="Oi agente",
-        language="pt",
-        conversation_id="123",
-        context=MagicMock(),
-        device_id="device-test",
-        agent_id="stackspot"
+    agent._add_message = AsyncMock(side_effect=add_message)
+    agent._run_agent = AsyncMock(
+        side_effect=lambda user_input, conversation_id, chat_stream: f"resposta {user_input.text}"
     )
 
-    result : ConversationResult = await agent.async_process(user_input)
+    first = asyncio.create_task(agent._run_turn(_user_input("primeiro"), "123"))
+    await adding.wait()
+    second = await agent._run_turn(_user_input("segundo"), "123")
 
-    assert isinstance(result.response, IntentResponse)
-    assert result.response.speech["plain"]["speech"] == agent_response
+    assert await first == STALE_TURN_RESPONSE
+    assert second == "resposta segundo"
+    assert agent._run_agent.await_count == 1
+    assert not agent._turns
+
+
+@pytest.mark.asyncio
+async def test_turnos_na_fila_sao_descartados_pelo_mais_novo(hass: HomeAssistant):
+    agent = _agent(hass)
+    running = asyncio.Event()
+
+    async def run_agent(user_input, conversation_id, chat_stream):
+        if user_input.text == "primeiro":
+            running.set()
+            await asyncio.Event().wait()
+        return f"resposta {user_input.text}"
+
+    agent._add_message = AsyncMock()
+    agent._run_agent = AsyncMock(side_effect=run_agent)
+
+    first = asyncio.create_task(agent._run_turn(_user_input("primeiro"), "123"))
+    await running.wait()
+    queued = asyncio.create_task(agent._run_turn(_user_input("segundo"), "123"))
+    await asyncio.sleep(0)
+    third = await agent._run_turn(_user_input("terceiro"), "123")
+
+    assert await first == STALE_TURN_RESPONSE
+    assert await queued == STALE_TURN_RESPONSE
+    assert third == "resposta terceiro"
+    assert [call.args[0].text for call in agent._run_agent.await_args_list] == ["primeiro", "terceiro"]
+
+
+@pytest.mark.asyncio
+async def test_conversas_novas_nao_cancelam_uma_a_outra(hass: HomeAssistant):
+    agent = _agent(hass)
+    running, release = asyncio.Event(), asyncio.Event()
+
+    async def run_agent(user_input, conversation_id, chat_stream):
+        if user_input.text == "primeiro":
+            running.set()
+            await release.wait()
+        return f"resposta {user_input.text}"
+
+    agent._add_message = AsyncMock()
+    agent._run_agent = AsyncMock(side_effect=run_agent)
+    first_log, second_log = MagicMock(conversation_id="conversa-1"), MagicMock(conversation_id="conversa-2")
+
+    first = asyncio.create_task(agent.async_process_chat_log(_user_input("primeiro", None), first_log, "stackspot"))
+    await running.wait()
+    await agent.async_process_chat_log(_user_input("segundo", None), second_log, "stackspot")
+    release.set()
+    await first
+
+    first_content = first_log.async_add_assistant_content_without_tools.call_args.args[0]
+    second_content = second_log.async_add_assistant_content_without_tools.call_args.args[0]
+    assert first_content.content == "resposta primeiro"
+    assert second_content.content == "resposta segundo"
+
+
+@pytest.mark.asyncio
+async def test_historico_gravado_com_o_id_atribuido_pelo_ha(hass: HomeAssistant):
+    agent = _agent(hass)
+    agent._get_access_token = AsyncMock(return_value="fake-token")
+    agent._get_system_prompt = AsyncMock(return_value="<system_prompt></system_prompt>")
+    agent._history = MagicMock(get=MagicMock(return_value=None),
+                               async_add_message=AsyncMock(return_value=MagicMock(messages=[])))
+    agent._api = MagicMock(send_prompt=AsyncMock(return_value={"message": "resposta"}))
+
+    with patch("custom_components.stackspot.agent.get_username_by_conversation_input",
+               AsyncMock(return_value="usuario")):
+        await agent.async_process_chat_log(_user_input("Oi agente", None), MagicMock(conversation_id="conversa-1"),
+                                           "stackspot")
+
+    keys = {call.args[0] for call in agent._history.async_add_message.await_args_list}
+    assert keys == {("agente", "conversa-1")}
+    agent._history.get.assert_called_with(("agente", "conversa-1"))
+
+
+@pytest.mark.asyncio
+async def test_streaming_retem_tool_call_no_meio_da_resposta(hass: HomeAssistant):
+    agent = _agent(hass, allow_control=True, streaming=True)
+    agent._get_access_token = AsyncMock(return_value="fake-token")
+
+    async def send_prompt_stream(*args):
+        for text in ("Vou ligar ", 'a luz. {"tool_call"', ": []}"):
+            yield {"message": text}
+
+    agent._api = MagicMock(send_prompt_stream=send_prompt_stream)
+    deltas = []
+
+    async def add_delta_content_stream(agent_id, stream):
+        async for delta in stream:
+            deltas.append(delta)
+            yield delta
+
+    chat_stream = ChatLogStream(MagicMock(async_add_delta_content_stream=add_delta_content_stream), "stackspot")
+    text_response = await agent._stream_prompt_to_stackspot("prompt", chat_stream)
+
+    assert text_response == 'Vou ligar a luz. {"tool_call": []}'
+    assert chat_stream.streamed == "Vou ligar a luz. "
+    assert "".join(delta.get("content", "") for delta in deltas) == "Vou ligar a luz. "
+
+
+@pytest.mark.asyncio
+async def test_resposta_final_diferente_do_streaming_e_adicionada(hass: HomeAssistant):
+    agent = _agent(hass, streaming=True)
+
+    async def run_turn(user_input, conversation_id, chat_stream):
+        chat_stream.streamed = "Vou ligar a luz. "
+        return TOOL_LOOP_LIMIT_RESPONSE
+
+    agent._run_turn = run_turn
+    chat_log = MagicMock(conversation_id="conversa-1")
+    await agent.async_process_chat_log(_user_input("Oi agente"), chat_log, "stackspot")
+
+    content = chat_log.async_add_assistant_content_without_tools.call_args.args[0]
+    assert content.content == TOOL_LOOP_LIMIT_RESPONSE
@@ -0,0 +1,206 @@
+from pathlib import Path
+
+import pytest
+from homeassistant.core import HomeAssistant
+from homeassistant.helpers import device_registry, entity_registry
+from pytest_homeassistant_custom_component.common import MockConfigEntry
+
+from custom_components.stackspot.catalog import ExposedEntityIndex, ScriptCatalog, ServiceCatalog, _read_scripts_file
+
+
+def _create_entity(hass: HomeAssistant, object_id: str, exposed: bool = True, **kwargs) -> str:
+    registry = entity_registry.async_get(hass)
+    entry = registry.async_get_or_create("light", "test", object_id, suggested_object_id=object_id, **kwargs)
+    if exposed:
+        registry.async_update_entity_options(entry.entity_id, "conversation", {"should_expose": True})
+    return entry.entity_id
+
+
+@pytest.mark.asyncio
+async def test_indice_contem_apenas_entidades_expostas(hass: HomeAssistant):
+    exposed = _create_entity(hass, "sala")
+    _create_entity(hass, "quarto", exposed=False)
+
+    index = ExposedEntityIndex(hass)
+    index.async_start()
+
+    assert [item["entity_id"] for item in index.as_list()] == [exposed]
+    index.async_stop()
+
+
+@pytest.mark.asyncio
+async def test_eventos_do_registry_atualizam_o_indice(hass: HomeAssistant):
+    registry = entity_registry.async_get(hass)
+    entity_id = _create_entity(hass, "sala")
+    index = ExposedEntityIndex(hass)
+    index.async_start()
+    version = index.version
+
+    registry.async_update_entity(entity_id, area_id="sala")
+    await hass.async_block_till_done()
+    assert index.version == version + 1
+    assert index.as_list()[0]["area_id"] == "sala"
+
+    registry.async_update_entity(entity_id, new_entity_id="light.sala_nova")
+    await hass.async_block_till_done()
+    assert [item["entity_id"] for item in index.as_list()] == ["light.sala_nova"]
+
+    registry.async_update_entity_options("light.sala_nova", "conversation", {"should_expose": False})
+    await hass.async_block_till_done()
+    assert index.as_list() == []
+    index.async_stop()
+
+
+@pytest.mark.asyncio
+async def test_alteracao_sem_efeito_nao_muda_a_versao(hass: HomeAssistant):
+    registry = entity_registry.async_get(hass)
+    entity_id = _create_entity(hass, "sala")
+    _create_entity(hass, "quarto", exposed=False)
+    index = ExposedEntityIndex(hass)
+    index.async_start()
+    view = index.as_list()
+    version = index.version
+
+    registry.async_update_entity(entity_id, icon="mdi:lamp")
+    registry.async_update_entity("light.quarto", area_id="quarto")
+    await hass.async_block_till_done()
+
+    assert index.version == version
+    assert index.as_list() is view
+    index.async_stop()
+
+
+@pytest.mark.asyncio
+async def test_area_do_device_atualiza_entidade_sem_area(hass: HomeAssistant):
+    config_entry = MockConfigEntry(domain="test")
+    config_entry.add_to_hass(hass)
+    devices = device_registry.async_get(hass)
+    device = devices.async_get_or_create(config_entry_id=config_entry.entry_id, identifiers={("test", "sala")})
+    _create_entity(hass, "sala", config_entry=config_entry, device_id=device.id)
+
+    index = ExposedEntityIndex(hass)
+    index.async_start()
+    assert index.as_list()[0]["area_id"] is None
+
+    devices.async_update_device(device.id, area_id="sala")
+    await hass.async_block_till_done()
+
+    assert index.as_list()[0]["area_id"] == "sala"
+    index.async_stop()
+
+
+def _write_scripts(path: Path, content: str) -> None:
+    (path / "scripts.yaml").write_text(content, encoding="utf-8")
+
+
+@pytest.mark.asyncio
+async def test_scripts_relidos_apenas_quando_o_arquivo_muda(hass: HomeAssistant, tmp_path: Path):
+    hass.config.config_dir = str(tmp_path)
+    _write_scripts(tmp_path, "abrir:\n  alias: Abrir portão\n")
+    scripts = ScriptCatalog(hass)
+    await scripts.async_start()
+    view = scripts.as_list()
+    version = scripts.version
+
+    await scripts.async_refresh()
+    assert scripts.version == version
+    assert scripts.as_list() is view
+
+    _write_scripts(tmp_path, "abrir:\n  alias: Abrir portão\nfechar:\n  alias: Fechar portão\n")
+    await scripts.async_refresh()
+    assert scripts.version == version + 1
+    assert [item["name"] for item in scripts.as_list()] == ["Abrir portão", "Fechar portão"]
+    scripts.async_stop()
+
+
+@pytest.mark.asyncio
+async def test_scripts_yaml_invalido_mantem_a_ultima_lista(hass: HomeAssistant, tmp_path: Path):
+    hass.config.config_dir = str(tmp_path)
+    _write_scripts(tmp_path, "abrir:\n  alias: Abrir\n")
+    scripts = ScriptCatalog(hass)
+    await scripts.async_start()
+    version = scripts.version
+
+    _write_scripts(tmp_path, "abrir:\n  alias: [Abrir\n")
+    await scripts.async_refresh()
+    _write_scripts(tmp_path, "- abrir\n- fechar\n")
+    await scripts.async_refresh()
+
+    assert scripts.version == version
+    assert [item["name"] for item in scripts.as_list()] == ["Abrir"]
+
+    _write_scripts(tmp_path, "fechar:\n  alias: Fechar\n")
+    await scripts.async_refresh()
+    assert [item["name"] for item in scripts.as_list()] == ["Fechar"]
+    scripts.async_stop()
+
+
+@pytest.mark.asyncio
+async def test_labels_do_script_vem_do_registry(hass: HomeAssistant, tmp_path: Path):
+    hass.config.config_dir = str(tmp_path)
+    _write_scripts(tmp_path, "abrir:\n  alias: Abrir portão\n")
+    registry = entity_registry.async_get(hass)
+    registry.async_get_or_create("script", "script", "abrir", suggested_object_id="abrir")
+    scripts = ScriptCatalog(hass)
+    await scripts.async_start()
+    version = scripts.version
+
+    registry.async_update_entity("script.abrir", labels={"portao"})
+    await hass.async_block_till_done()
+
+    assert scripts.version == version + 1
+    assert scripts.as_list()[0]["labels"] == ["portao"]
+    scripts.async_stop()
+
+
+def test_leitura_do_arquivo_usa_mtime_e_tamanho(tmp_path: Path):
+    _write_scripts(tmp_path, "abrir:\n  alias: Abrir\n")
+    scripts_file = tmp_path / "scripts.yaml"
+
+    file_key, data = _read_scripts_file(scripts_file, None)
+    assert data == {"abrir": {"alias": "Abrir"}}
+    assert _read_scripts_file(scripts_file, file_key) is None
+
+    scripts_file.unlink()
+    assert _read_scripts_file(scripts_file, file_key) == ((0.0, 0), {})
+    assert _read_scripts_file(scripts_file, (0.0, 0)) is None
+
+
+async def _noop_service(call) -> None:
+    return None
+
+
+@pytest.mark.asyncio
+async def test_catalogo_de_servicos_mantido_pelos_eventos(hass: HomeAssistant):
+    hass.services.async_register("luzes", "acender", _noop_service)
+    services = ServiceCatalog(hass)
+    services.async_start()
+    assert {"domain": "luzes", "service": "acender", "name": "luzes.acender"} in services.as_list()
+    version = services.version
+
+    hass.services.async_register("luzes", "apagar", _noop_service)
+    await hass.async_block_till_done()
+    assert services.version == version + 1
+    assert "luzes.apagar" in [item["name"] for item in services.as_list()]
+
+    hass.services.async_remove("luzes", "acender")
+    await hass.async_block_till_done()
+    assert services.version == version + 2
+    assert "luzes.acender" not in [item["name"] for item in services.as_list()]
+    services.async_stop()
+
+
+@pytest.mark.asyncio
+async def test_catalogo_de_servicos_ignora_scripts(hass: HomeAssistant):
+    services = ServiceCatalog(hass)
+    services.async_start()
+    view = services.as_list()
+    version = services.version
+
+    hass.services.async_register("script", "abrir", _noop_service)
+    await hass.async_block_till_done()
+
+    assert services.version == version
+    assert services.as_list() is view
+    assert list(services.as_list().by_domain("script")) == []
+    services.async_stop()
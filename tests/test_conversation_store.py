@@ -0,0 +1,93 @@
+from unittest.mock import patch
+
+import pytest
+from homeassistant.core import HomeAssistant
+
+from custom_components.stackspot.conversation_store import ConversationStore
+from custom_components.stackspot.data_utils import ContextValue, MessageRole
+
+
+@pytest.mark.asyncio
+async def test_mensagens_limitadas_por_conversa(hass: HomeAssistant):
+    store = ConversationStore(hass, keep_seconds=3600, max_bytes=1024)
+
+    for index in range(5):
+        ctx = await store.async_add_message(("agente", "conversa"), MessageRole.USER, f"mensagem {index}", 3)
+
+    assert [msg["content"] for msg in ctx.get_history()] == ["mensagem 2", "mensagem 3", "mensagem 4"]
+    assert store.bytes == sum(msg.size for msg in ctx.messages)
+    await store.async_shutdown()
+
+
+@pytest.mark.asyncio
+async def test_limite_de_bytes_remove_conversa_menos_usada(hass: HomeAssistant):
+    store = ConversationStore(hass, keep_seconds=3600, max_bytes=25)
+
+    await store.async_add_message(("agente", "a"), MessageRole.USER, "x" * 10, 10)
+    await store.async_add_message(("agente", "b"), MessageRole.USER, "x" * 10, 10)
+    await store.async_add_message(("agente", "a"), MessageRole.ASSISTANT, "x", 10)
+    await store.async_add_message(("agente", "c"), MessageRole.USER, "x" * 10, 10)
+
+    assert store.get(("agente", "b")) is None
+    assert store.get(("agente", "a")) is not None
+    assert store.get(("agente", "c")) is not None
+    await store.async_shutdown()
+
+
+@pytest.mark.asyncio
+async def test_conversas_expiram_pelo_timer(hass: HomeAssistant):
+    store = ConversationStore(hass, keep_seconds=60, max_bytes=1024)
+
+    with patch("custom_components.stackspot.data_utils.time.monotonic", return_value=1000):
+        await store.async_add_message(("agente", "a"), MessageRole.USER, "oi", 10)
+
+    with patch("custom_components.stackspot.conversation_store.time.monotonic", return_value=1061):
+        store._async_expire(None)
+
+    assert store.size == 0
+    assert store.bytes == 0
+    await store.async_shutdown()
+
+
+def test_limite_de_tokens_mantem_a_ultima_mensagem_do_usuario_e_tools():
+    ctx = ContextValue(max_messages=10)
+    ctx.add_message(MessageRole.USER, "mensagem antiga " * 20)
+    ctx.add_message(MessageRole.ASSISTANT, "resposta antiga")
+    ctx.add_message(MessageRole.USER, "ligar a luz")
+    ctx.add_message(MessageRole.ASSISTANT, '{"tool_call":[]}')
+    ctx.add_message(MessageRole.TOOL, "resultado " * 200)
+
+    history = ctx.get_history(token_budget=10)
+
+    assert [msg["role"] for msg in history] == ["user", "assistant", "tool"]
+    assert history[0]["content"] == "ligar a luz"
+    assert len(ctx.get_history()) == 5
+
+
+def test_resumo_substitui_as_mensagens_antigas():
+    ctx = ContextValue(max_messages=4)
+    for index in range(4):
+        ctx.add_message(MessageRole.USER, f"mensagem {index}")
+
+    folded = ctx.messages_to_fold()
+    ctx.add_message(MessageRole.ASSISTANT, "resposta durante o resumo")
+    ctx.apply_summary("resumo", folded)
+
+    assert [msg["content"] for msg in ctx.get_history()] == [
+        "resumo", "mensagem 2", "mensagem 3", "resposta durante o resumo"
+    ]
+    assert ctx.size == sum(msg.size for msg in ctx.messages) + len("resumo")
+
+
+@pytest.mark.asyncio
+async def test_historico_restaurado_apos_reload(hass: HomeAssistant):
+    store = ConversationStore(hass, keep_seconds=3600, max_bytes=1024)
+    await store.async_add_message(("agente", "a"), MessageRole.USER, "ligar a luz", 10)
+    await store.async_add_message(("agente", "a"), MessageRole.ASSISTANT, "luz ligada", 10)
+    await store.async_shutdown()
+
+    restored = ConversationStore(hass, keep_seconds=3600, max_bytes=1024)
+    ctx = await restored.async_add_message(("agente", "a"), MessageRole.USER, "obrigado", 10)
+
+    assert [msg["content"] for msg in ctx.get_history()] == ["ligar a luz", "luz ligada", "obrigado"]
+    await restored.async_shutdown()
@@ -0,0 +1,31 @@
+from unittest.mock import AsyncMock, MagicMock, patch
+
+import pytest
+from homeassistant.core import HomeAssistant
+
+from custom_components.stackspot import MANAGER, StackSpotEntityManager, async_setup_background
+from custom_components.stackspot.const import DOMAIN, SUBENTRY_KS
+from custom_components.stackspot.util import async_wait_variables_ready
+
+
+def _setup_manager(hass: HomeAssistant) -> None:
+    objects = {}
+    manager = MagicMock(spec=StackSpotEntityManager)
+    manager.has_object.side_effect = lambda key: key in objects
+    manager.add_objetc.side_effect = objects.__setitem__
+    manager.get_object_by.side_effect = objects.get
+    hass.data.setdefault(DOMAIN, {})[MANAGER] = manager
+
+
+@pytest.mark.asyncio
+async def test_falha_nas_variaveis_nao_bloqueia_agentes_nem_ks(hass: HomeAssistant):
+    _setup_manager(hass)
+    subentry = MagicMock(subentry_type=SUBENTRY_KS, title="casa")
+    entry = MagicMock(title="StackSpot", subentries={"ks": subentry})
+
+    with patch("custom_components.stackspot.process_variables", AsyncMock(side_effect=RuntimeError("falha"))), \
+            patch("custom_components.stackspot.process_subentry_ks", AsyncMock()) as process_subentry_ks:
+        await async_setup_background(hass, entry)
+
+    assert await async_wait_variables_ready(hass, timeout=0)
+    process_subentry_ks.assert_awaited_once_with(hass, entry, subentry)
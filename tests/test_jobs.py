@@ -0,0 +1,79 @@
+import asyncio
+from datetime import timedelta
+from unittest.mock import AsyncMock, patch
+
+import pytest
+from homeassistant.core import HomeAssistant
+
+from custom_components.stackspot.jobs import JOB_MAX_CONCURRENT_SYNCS, JOB_MAX_JITTER_SECONDS, JobScheduler
+
+
+@pytest.mark.asyncio
+async def test_sincronizacao_aguarda_conversa_em_andamento(hass: HomeAssistant):
+    jobs = JobScheduler(hass)
+    synced = asyncio.Event()
+
+    async def sync():
+        async with jobs.sync_slot():
+            synced.set()
+
+    with jobs.conversation():
+        task = asyncio.create_task(sync())
+        await asyncio.sleep(0)
+        assert not synced.is_set()
+
+    await task
+    assert synced.is_set()
+
+
+@pytest.mark.asyncio
+async def test_sincronizacoes_simultaneas_limitadas(hass: HomeAssistant):
+    jobs = JobScheduler(hass)
+    release = asyncio.Event()
+    running = 0
+    max_running = 0
+
+    async def sync():
+        nonlocal running, max_running
+        async with jobs.sync_slot():
+            running += 1
+            max_running = max(max_running, running)
+            await release.wait()
+            running -= 1
+
+    tasks = [asyncio.create_task(sync()) for _ in range(JOB_MAX_CONCURRENT_SYNCS + 2)]
+    await asyncio.sleep(0)
+    release.set()
+    await asyncio.gather(*tasks)
+
+    assert max_running == JOB_MAX_CONCURRENT_SYNCS
+
+
+@pytest.mark.asyncio
+async def test_jobs_criados_juntos_sao_espalhados(hass: HomeAssistant):
+    jobs = JobScheduler(hass)
+    interval = timedelta(hours=48).total_seconds()
+    with patch("custom_components.stackspot.jobs.time.monotonic", return_value=1000.0):
+        for index in range(10):
+            jobs.async_add_job(f"ks-task_{index}", timedelta(hours=48), AsyncMock())
+
+    next_runs = {job.next_run for job in jobs._jobs.values()}
+    assert len(next_runs) == 10
+    assert all(abs(next_run - 1000.0 - interval) <= JOB_MAX_JITTER_SECONDS for next_run in next_runs)
+    jobs.async_stop()
+    assert not jobs._jobs
+
+
+@pytest.mark.asyncio
+async def test_jitter_adianta_ou_atrasa_a_execucao(hass: HomeAssistant):
+    jobs = JobScheduler(hass)
+    with patch("custom_components.stackspot.jobs.time.monotonic", return_value=1000.0), \
+            patch("custom_components.stackspot.jobs.random.uniform", side_effect=lambda low, high: low):
+        jobs.async_add_job("adiantado", timedelta(minutes=10), AsyncMock())
+    with patch("custom_components.stackspot.jobs.time.monotonic", return_value=1000.0), \
+            patch("custom_components.stackspot.jobs.random.uniform", side_effect=lambda low, high: high):
+        jobs.async_add_job("atrasado", timedelta(minutes=10), AsyncMock())
+
+    assert jobs._jobs["adiantado"].next_run == 1000.0 + 600 - 60
+    assert jobs._jobs["atrasado"].next_run == 1000.0 + 600 + 60
+    jobs.async_stop()
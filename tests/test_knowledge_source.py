@@ -0,0 +1,196 @@
+from unittest.mock import AsyncMock, MagicMock, patch
+
+import pytest
+from homeassistant.core import HomeAssistant
+
+from custom_components.stackspot import MANAGER, StackSpotEntityManager
+from custom_components.stackspot.const import DOMAIN, KS_SYNC_STATE
+from custom_components.stackspot.data_utils import KSData, StackSpotLogin
+from custom_components.stackspot.knowledge_source import KSSyncState, KSUpdater, ks_update, _content_hash
+
+
+def _ks_data() -> KSData:
+    return MagicMock(spec=KSData, subentry_id="ks", slug="casa", template="{{ 1 }}")
+
+
+def _setup_manager(hass: HomeAssistant, sensor) -> KSSyncState:
+    sync_state = KSSyncState(hass)
+    manager = MagicMock(spec=StackSpotEntityManager)
+    manager.get_entity_by.return_value = sensor
+    manager.get_object_by.side_effect = lambda key: sync_state if key == KS_SYNC_STATE else None
+    hass.data.setdefault(DOMAIN, {})[MANAGER] = manager
+    return sync_state
+
+
+@pytest.mark.asyncio
+async def test_estado_persistido_entre_instancias(hass: HomeAssistant):
+    await KSSyncState(hass).async_set_objects("casa", {"hash": "obj-1"})
+
+    assert await KSSyncState(hass).async_get_objects("casa") == {"hash": "obj-1"}
+
+
+@pytest.mark.asyncio
+async def test_conteudo_igual_nao_e_enviado(hass: HomeAssistant):
+    sensor = MagicMock()
+    sync_state = _setup_manager(hass, sensor)
+    await sync_state.async_set_objects("casa", {_content_hash("1"): "obj-1"})
+
+    with patch("custom_components.stackspot.knowledge_source.render_template", AsyncMock(return_value="1")), \
+            patch("custom_components.stackspot.knowledge_source.get_api_client") as get_api_client:
+        await ks_update(hass, MagicMock(spec=StackSpotLogin), _ks_data())
+
+    get_api_client.assert_not_called()
+    sensor.async_set_sync_result.assert_called_once_with(uploaded=0, skipped=1)
+
+
+@pytest.mark.asyncio
+async def test_conteudo_igual_sem_id_dos_objetos_nao_e_enviado(hass: HomeAssistant):
+    sensor = MagicMock()
+    sync_state = _setup_manager(hass, sensor)
+    await sync_state.async_set_objects("casa", {_content_hash("1"): None})
+
+    with patch("custom_components.stackspot.knowledge_source.render_template", AsyncMock(return_value="1")), \
+            patch("custom_components.stackspot.knowledge_source.get_api_client") as get_api_client:
+        await ks_update(hass, MagicMock(spec=StackSpotLogin), _ks_data())
+
+    get_api_client.assert_not_called()
+    sensor.async_set_sync_result.assert_called_once_with(uploaded=0, skipped=1)
+
+
+@pytest.mark.asyncio
+async def test_sem_estado_salvo_limpa_o_ks_antes_do_envio(hass: HomeAssistant):
+    sensor = MagicMock(async_set_datetime=AsyncMock())
+    sync_state = _setup_manager(hass, sensor)
+
+    calls = []
+    api = MagicMock()
+    api.clear_objects_knowledge_sources = AsyncMock(side_effect=lambda *args: calls.append("clear") or {})
+    api.add_content_knowledge_sources = AsyncMock(side_effect=lambda *args: calls.append("add") or {"id": "obj-1"})
+    api.delete_object_knowledge_sources = AsyncMock()
+    token_manager = MagicMock(async_get_token=AsyncMock(return_value="token"))
+
+    with patch("custom_components.stackspot.knowledge_source.render_template", AsyncMock(return_value="1")), \
+            patch("custom_components.stackspot.knowledge_source.get_api_client", return_value=api), \
+            patch("custom_components.stackspot.knowledge_source.get_token_manager", return_value=token_manager), \
+            patch("custom_components.stackspot.knowledge_source.get_request_scheduler") as get_scheduler:
+        get_scheduler.return_value.slot.return_value.__aenter__ = AsyncMock()
+        get_scheduler.return_value.slot.return_value.__aexit__ = AsyncMock(return_value=False)
+        await ks_update(hass, MagicMock(spec=StackSpotLogin), _ks_data())
+
+    assert calls == ["clear", "add"]
+    api.delete_object_knowledge_sources.assert_not_called()
+    assert await sync_state.async_get_objects("casa") == {_content_hash("1"): "obj-1"}
+    sensor.async_set_sync_result.assert_called_once_with(uploaded=1, skipped=0)
+
+
+@pytest.mark.asyncio
+async def test_objeto_sem_id_nao_limpa_o_ks(hass: HomeAssistant):
+    sensor = MagicMock(async_set_datetime=AsyncMock())
+    sync_state = _setup_manager(hass, sensor)
+    await sync_state.async_set_objects("casa", {_content_hash("a"): None})
+
+    api = MagicMock()
+    api.add_content_knowledge_sources = AsyncMock(return_value={})
+    api.delete_object_knowledge_sources = AsyncMock()
+    api.clear_objects_knowledge_sources = AsyncMock()
+    token_manager = MagicMock(async_get_token=AsyncMock(return_value="token"))
+
+    with patch("custom_components.stackspot.knowledge_source.render_template", AsyncMock(return_value="b")), \
+            patch("custom_components.stackspot.knowledge_source.get_api_client", return_value=api), \
+            patch("custom_components.stackspot.knowledge_source.get_token_manager", return_value=token_manager), \
+            patch("custom_components.stackspot.knowledge_source.get_request_scheduler") as get_scheduler:
+        get_scheduler.return_value.slot.return_value.__aenter__ = AsyncMock()
+        get_scheduler.return_value.slot.return_value.__aexit__ = AsyncMock(return_value=False)
+        await ks_update(hass, MagicMock(spec=StackSpotLogin), _ks_data())
+        await ks_update(hass, MagicMock(spec=StackSpotLogin), _ks_data())
+
+    api.clear_objects_knowledge_sources.assert_not_called()
+    api.delete_object_knowledge_sources.assert_not_called()
+    api.add_content_knowledge_sources.assert_awaited_once()
+    assert await sync_state.async_get_objects("casa") == {_content_hash("a"): None, _content_hash("b"): None}
+    assert sensor.async_set_sync_result.call_args_list[-1].kwargs == {"uploaded": 0, "skipped": 1}
+
+
+@pytest.mark.asyncio
+async def test_conteudo_novo_enviado_antes_de_remover_o_antigo(hass: HomeAssistant):
+    sensor = MagicMock(async_set_datetime=AsyncMock())
+    sync_state = _setup_manager(hass, sensor)
+    await sync_state.async_set_objects("casa", {"antigo": "obj-1"})
+
+    calls = []
+    api = MagicMock()
+    api.add_content_knowledge_sources = AsyncMock(side_effect=lambda *args: calls.append("add") or {"id": "obj-2"})
+    api.delete_object_knowledge_sources = AsyncMock(side_effect=lambda *args: calls.append("delete") or {})
+    api.clear_objects_knowledge_sources = AsyncMock()
+    token_manager = MagicMock(async_get_token=AsyncMock(return_value="token"))
+
+    with patch("custom_components.stackspot.knowledge_source.render_template", AsyncMock(return_value="2")), \
+            patch("custom_components.stackspot.knowledge_source.get_api_client", return_value=api), \
+            patch("custom_components.stackspot.knowledge_source.get_token_manager", return_value=token_manager), \
+            patch("custom_components.stackspot.knowledge_source.get_request_scheduler") as get_scheduler:
+        get_scheduler.return_value.slot.return_value.__aenter__ = AsyncMock()
+        get_scheduler.return_value.slot.return_value.__aexit__ = AsyncMock(return_value=False)
+        await ks_update(hass, MagicMock(spec=StackSpotLogin), _ks_data())
+
+    assert calls == ["add", "delete"]
+    api.clear_objects_knowledge_sources.assert_not_called()
+    assert await sync_state.async_get_objects("casa") == {_content_hash("2"): "obj-2"}
+    sensor.async_set_sync_result.assert_called_once_with(uploaded=1, skipped=0)
+
+
+@pytest.mark.asyncio
+async def test_somente_partes_alteradas_sao_enviadas(hass: HomeAssistant):
+    sensor = MagicMock(async_set_datetime=AsyncMock())
+    sync_state = _setup_manager(hass, sensor)
+    await sync_state.async_set_objects("casa", {_content_hash("a"): "obj-a", _content_hash("b"): "obj-b"})
+
+    api = MagicMock()
+    api.add_content_knowledge_sources = AsyncMock(return_value={"id": "obj-c"})
+    api.delete_object_knowledge_sources = AsyncMock(return_value={})
+    token_manager = MagicMock(async_get_token=AsyncMock(return_value="token"))
+
+    with patch("custom_components.stackspot.knowledge_source.render_template", AsyncMock(return_value="a\n\nc")), \
+            patch("custom_components.stackspot.knowledge_source.get_api_client", return_value=api), \
+            patch("custom_components.stackspot.knowledge_source.get_token_manager", return_value=token_manager), \
+            patch("custom_components.stackspot.knowledge_source.get_request_scheduler") as get_scheduler:
+        get_scheduler.return_value.slot.return_value.__aenter__ = AsyncMock()
+        get_scheduler.return_value.slot.return_value.__aexit__ = AsyncMock(return_value=False)
+        await ks_update(hass, MagicMock(spec=StackSpotLogin), _ks_data())
+
+    api.add_content_knowledge_sources.assert_awaited_once_with("token", "casa", "c")
+    api.delete_object_knowledge_sources.assert_awaited_once_with("token", "casa", "obj-b")
+    assert await sync_state.async_get_objects("casa") == {_content_hash("a"): "obj-a", _content_hash("c"): "obj-c"}
+    sensor.async_set_sync_result.assert_called_once_with(uploaded=1, skipped=1)
+
+
+@pytest.mark.asyncio
+async def test_mudanca_respeita_intervalo_minimo(hass: HomeAssistant):
+    data = MagicMock(spec=KSData, slug="casa", update_on_change=True, update_debounce=0, update_min_interval=900)
+    updater = KSUpdater(hass, MagicMock(spec=StackSpotLogin), data)
+
+    with patch("custom_components.stackspot.knowledge_source.ks_update", AsyncMock()) as update:
+        await updater.async_update()
+        await updater._async_changed_update()
+        await updater._async_changed_update()
+
+    update.assert_awaited_once()
+    assert updater._unsub_delayed is not None
+    updater.async_stop()
+    assert updater._unsub_delayed is None
+
+
+@pytest.mark.asyncio
+async def test_cada_mudanca_reinicia_a_espera(hass: HomeAssistant):
+    data = MagicMock(spec=KSData, slug="casa", update_on_change=True, update_debounce=30, update_min_interval=0)
+    updater = KSUpdater(hass, MagicMock(spec=StackSpotLogin), data)
+    unsubs = [MagicMock(), MagicMock()]
+
+    with patch("custom_components.stackspot.knowledge_source.async_call_later", side_effect=unsubs) as call_later:
+        updater._async_catalog_changed()
+        updater._async_catalog_changed()
+
+    assert call_later.call_count == 2
+    unsubs[0].assert_called_once()
+    unsubs[1].assert_not_called()
+    updater.async_stop()
+    unsubs[1].assert_called_once()
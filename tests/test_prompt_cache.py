@@ -0,0 +1,64 @@
+from unittest.mock import MagicMock
+
+import pytest
+from homeassistant.core import HomeAssistant
+
+from custom_components.stackspot import MANAGER, StackSpotEntityManager
+from custom_components.stackspot.catalog import Catalog
+from custom_components.stackspot.const import DOMAIN, TEMPLATE_KEY_SCRIPTS
+from custom_components.stackspot.prompt_cache import PromptRenderCache
+
+
+@pytest.fixture
+def manager(hass: HomeAssistant) -> StackSpotEntityManager:
+    manager = StackSpotEntityManager()
+    hass.data[DOMAIN] = {MANAGER: manager}
+    return manager
+
+
+@pytest.mark.asyncio
+async def test_prompt_invalidado_apenas_pela_entidade_lida(hass: HomeAssistant, manager: StackSpotEntityManager):
+    hass.states.async_set("sensor.sala", "21")
+    hass.states.async_set("sensor.quarto", "19")
+    cache = PromptRenderCache(hass)
+    template = "Sala: {{ states('sensor.sala') }}"
+
+    assert await cache.async_render("agente", template, {}) == "Sala: 21"
+    assert await cache.async_render("agente", template, {}) == "Sala: 21"
+    assert (cache.hits, cache.misses) == (1, 1)
+
+    hass.states.async_set("sensor.quarto", "20")
+    await hass.async_block_till_done()
+    await cache.async_render("agente", template, {})
+    assert (cache.hits, cache.misses) == (2, 1)
+
+    hass.states.async_set("sensor.sala", "22")
+    await hass.async_block_till_done()
+    assert await cache.async_render("agente", template, {}) == "Sala: 22"
+    assert (cache.hits, cache.misses) == (2, 2)
+    cache.async_stop()
+
+
+@pytest.mark.asyncio
+async def test_nova_versao_do_catalogo_gera_nova_chave(hass: HomeAssistant, manager: StackSpotEntityManager):
+    catalog = MagicMock(spec=Catalog, version=0)
+    manager.add_objetc(TEMPLATE_KEY_SCRIPTS, catalog)
+    cache = PromptRenderCache(hass)
+
+    await cache.async_render("agente", "Ola", {})
+    catalog.version = 1
+    await cache.async_render("agente", "Ola", {})
+
+    assert cache.misses == 2
+    assert cache.size == 2
+    cache.async_stop()
+
+
+@pytest.mark.asyncio
+async def test_variaveis_diferentes_nao_compartilham_entrada(hass: HomeAssistant, manager: StackSpotEntityManager):
+    cache = PromptRenderCache(hass)
+
+    assert await cache.async_render("agente", "Ola {{ user }}", {"user": "Ana"}) == "Ola Ana"
+    assert await cache.async_render("agente", "Ola {{ user }}", {"user": "Bia"}) == "Ola Bia"
+    assert cache.misses == 2
+    cache.async_stop()
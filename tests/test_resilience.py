@@ -0,0 +1,69 @@
+import asyncio
+from unittest.mock import AsyncMock, MagicMock, patch
+
+import aiohttp
+import pytest
+
+from custom_components.stackspot.client.resilience import (
+    CircuitBreaker,
+    CircuitState,
+    RetryPolicy,
+    parse_retry_after,
+)
+from custom_components.stackspot.client.stackspot_client import StackSpotApiClient
+
+
+def test_circuit_breaker_abre_e_testa_o_host_apos_o_timeout():
+    breaker = CircuitBreaker("host", failure_threshold=2, reset_timeout=30)
+
+    with patch("custom_components.stackspot.client.resilience.time.monotonic", return_value=100):
+        breaker.record_failure()
+        assert breaker.allow()
+        breaker.record_failure()
+        assert breaker.state == CircuitState.OPEN
+        assert not breaker.allow()
+
+    with patch("custom_components.stackspot.client.resilience.time.monotonic", return_value=131):
+        assert breaker.allow()
+        assert breaker.state == CircuitState.HALF_OPEN
+        assert not breaker.allow()
+
+        breaker.record_success()
+        assert breaker.state == CircuitState.CLOSED
+        assert breaker.open_count == 1
+
+
+def test_retry_after_tem_precedencia_sobre_o_backoff():
+    policy = RetryPolicy(timeout=10, base_delay=1, max_delay=4)
+
+    assert parse_retry_after({"Retry-After": "3"}) == 3.0
+    assert parse_retry_after({"Retry-After": "Wed, 21 Oct 2015 07:28:00 GMT"}) == 0.0
+    assert parse_retry_after({"Retry-After": "invalido"}) is None
+    assert policy.delay(1, retry_after=3.0) == 3.0
+    assert 0 <= policy.delay(10) <= 4
+
+
+def test_requisicao_nao_idempotente_so_repete_falha_de_conexao_e_recusa():
+    policy = RetryPolicy(timeout=10, idempotent=False)
+
+    assert policy.retry_error(aiohttp.ClientConnectorError(MagicMock(), OSError(111, "recusada")))
+    assert not policy.retry_error(asyncio.TimeoutError())
+    assert not policy.retry_error(aiohttp.ServerDisconnectedError())
+    assert policy.retry_status(429) and policy.retry_status(503)
+    assert not policy.retry_status(500) and not policy.retry_status(504)
+
+    idempotent = RetryPolicy(timeout=10)
+    assert idempotent.retry_error(asyncio.TimeoutError())
+    assert idempotent.retry_status(500)
+
+
+@pytest.mark.asyncio
+async def test_probe_liberado_quando_a_requisicao_termina_sem_resultado():
+    client = StackSpotApiClient(MagicMock(request=AsyncMock(side_effect=ValueError("url invalida"))))
+    breaker = client.breaker_for("https://host/v1")
+    breaker.state = CircuitState.HALF_OPEN
+
+    with pytest.raises(ValueError):
+        await client._open("GET", "https://host/v1", RetryPolicy(timeout=10))
+
+    assert breaker.allow()
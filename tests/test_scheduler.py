@@ -0,0 +1,57 @@
+import asyncio
+
+import pytest
+
+from custom_components.stackspot.client.scheduler import RequestPriority, RequestScheduler
+
+
+@pytest.mark.asyncio
+async def test_fila_atende_primeiro_a_conversa_interativa():
+    scheduler = RequestScheduler(1, {})
+    order: list[RequestPriority] = []
+    release = asyncio.Event()
+
+    async def request(priority: RequestPriority, wait: bool = False):
+        async with scheduler.slot(priority):
+            order.append(priority)
+            if wait:
+                await release.wait()
+
+    first = asyncio.create_task(request(RequestPriority.KS_SYNC, wait=True))
+    await asyncio.sleep(0)
+    queued = [
+        asyncio.create_task(request(RequestPriority.KS_SYNC)),
+        asyncio.create_task(request(RequestPriority.AI_TASK)),
+        asyncio.create_task(request(RequestPriority.INTERACTIVE)),
+    ]
+    await asyncio.sleep(0)
+    assert scheduler.queue_depth == 3
+
+    release.set()
+    await asyncio.gather(first, *queued)
+
+    assert order == [RequestPriority.KS_SYNC, RequestPriority.INTERACTIVE, RequestPriority.AI_TASK,
+                     RequestPriority.KS_SYNC]
+    assert scheduler.stats[RequestPriority.INTERACTIVE].requests == 1
+
+
+@pytest.mark.asyncio
+async def test_limite_da_classe_nao_bloqueia_as_demais():
+    scheduler = RequestScheduler(3, {RequestPriority.KS_SYNC: 1})
+    release = asyncio.Event()
+
+    async def request(priority: RequestPriority):
+        async with scheduler.slot(priority):
+            await release.wait()
+
+    tasks = [asyncio.create_task(request(RequestPriority.KS_SYNC)) for _ in range(2)]
+    tasks.append(asyncio.create_task(request(RequestPriority.INTERACTIVE)))
+    await asyncio.sleep(0)
+
+    assert scheduler.stats[RequestPriority.KS_SYNC].active == 1
+    assert scheduler.stats[RequestPriority.KS_SYNC].waiting == 1
+    assert scheduler.stats[RequestPriority.INTERACTIVE].active == 1
+
+    release.set()
+    await asyncio.gather(*tasks)
+    assert scheduler.queue_depth == 0
@@ -0,0 +1,41 @@
+from unittest.mock import MagicMock
+
+import pytest
+from homeassistant.core import HomeAssistant
+
+from custom_components.stackspot.sensor import PromptCacheSensor, RequestQueueSensor
+
+
+@pytest.mark.asyncio
+async def test_sensor_de_fila_agrupa_as_gravacoes_de_estado(hass: HomeAssistant):
+    listeners = []
+    scheduler = MagicMock(async_add_listener=lambda listener: listeners.append(listener) or MagicMock())
+    sensor = RequestQueueSensor("entry", scheduler)
+    sensor.hass = hass
+    sensor.async_write_ha_state = MagicMock()
+    await sensor.async_added_to_hass()
+
+    for _ in range(5):
+        listeners[0]()
+    await hass.async_block_till_done()
+
+    # A primeira mudança é gravada na hora, as demais no fim do intervalo
+    assert sensor.async_write_ha_state.call_count == 1
+    sensor._write_debouncer.async_cancel()
+
+
+@pytest.mark.asyncio
+async def test_sensor_do_cache_de_prompts_agrupa_as_gravacoes_de_estado(hass: HomeAssistant):
+    listeners = []
+    prompt_cache = MagicMock(async_add_listener=lambda listener: listeners.append(listener) or MagicMock())
+    sensor = PromptCacheSensor("entry", prompt_cache)
+    sensor.hass = hass
+    sensor.async_write_ha_state = MagicMock()
+    await sensor.async_added_to_hass()
+
+    for _ in range(5):
+        listeners[0]()
+    await hass.async_block_till_done()
+
+    assert sensor.async_write_ha_state.call_count == 1
+    sensor._write_debouncer.async_cancel()
@@ -0,0 +1,60 @@
+import json
+
+from custom_components.stackspot.serialization import estimate_tokens, split_chunks, to_compact_json, to_table
+
+
+def test_to_table_escreve_as_chaves_uma_unica_vez():
+    items = [
+        {"entity_id": "light.sala", "name": "Luz sala", "aliases": ["luz", "lâmpada"], "labels": []},
+        {"entity_id": "light.quarto", "name": "Luz | quarto", "aliases": [], "area_id": "quarto"},
+    ]
+
+    assert to_table(items) == (
+        "entity_id|name|aliases|labels|area_id\n"
+        "light.sala|Luz sala|luz,lâmpada||\n"
+        "light.quarto|Luz \\| quarto|||quarto"
+    )
+
+
+def test_to_table_escapa_virgula_dentro_dos_itens_da_lista():
+    items = [{"entity_id": "light.sala", "labels": ["sala, jantar", "luz"]}]
+
+    assert to_table(items) == (
+        "entity_id|labels\n"
+        "light.sala|sala\\, jantar,luz"
+    )
+
+
+def test_to_compact_json_e_menor_e_equivalente():
+    value = {"tool_call": [{"identifier": "a", "name": "get_entity_state", "parameters": {"entity_id": "sensor.sala"}}]}
+
+    compact = to_compact_json(value)
+
+    assert json.loads(compact) == value
+    assert len(compact) < len(json.dumps(value, indent=2))
+    assert estimate_tokens(compact) < estimate_tokens(json.dumps(value, indent=2))
+
+
+def test_split_chunks_divide_tabela_por_dominio_repetindo_cabecalho():
+    table = to_table([
+        {"entity_id": "light.sala", "name": "Luz sala"},
+        {"entity_id": "sensor.sala", "name": "Temperatura"},
+        {"entity_id": "light.quarto", "name": "Luz quarto"},
+    ])
+
+    assert split_chunks("Entidades:\n\n" + table, 1000) == [
+        "Entidades:",
+        "entity_id|name\nlight.sala|Luz sala\nlight.quarto|Luz quarto",
+        "entity_id|name\nsensor.sala|Temperatura",
+    ]
+
+
+def test_split_chunks_divide_json_grande_em_partes_validas():
+    value = {"exposed_entities": [{"entity_id": f"light.l{index}"} for index in range(100)], "total": 100}
+    chunks = split_chunks("Valores: " + to_compact_json(value), 300)
+
+    assert len(chunks) > 1
+    assert all(len(chunk) <= 300 for chunk in chunks)
+    parts = [json.loads(chunk.removeprefix("Valores: ")) for chunk in chunks]
+    assert [item for part in parts for item in part.get("exposed_entities", [])] == value["exposed_entities"]
+    assert {"total": 100} in parts
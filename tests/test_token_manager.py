@@ -0,0 +1,45 @@
+import asyncio
+from unittest.mock import AsyncMock, MagicMock
+
+import pytest
+from homeassistant.core import HomeAssistant
+
+from custom_components.stackspot.client.token_manager import StackSpotTokenManager
+
+
+def _token_manager(hass: HomeAssistant, token_data: dict) -> tuple[StackSpotTokenManager, MagicMock]:
+    api = MagicMock()
+    api.generate_access_token = AsyncMock(return_value=token_data)
+    return StackSpotTokenManager(hass, api, "meu-realm", "meu-client-id", "meu-client-key"), api
+
+
+@pytest.mark.asyncio
+async def test_token_renovado_uma_vez_com_chamadas_concorrentes(hass: HomeAssistant):
+    token_manager, api = _token_manager(hass, {"access_token": "token", "expires_in": 1200})
+
+    tokens = await asyncio.gather(*(token_manager.async_get_token() for _ in range(5)))
+
+    assert tokens == ["token"] * 5
+    assert api.generate_access_token.await_count == 1
+    assert token_manager.refresh_count == 1
+    token_manager.async_shutdown()
+
+
+@pytest.mark.asyncio
+async def test_token_recusado_forca_renovacao(hass: HomeAssistant):
+    token_manager, api = _token_manager(hass, {"access_token": "token", "expires_in": 1200})
+
+    token = await token_manager.async_get_token()
+    await token_manager.async_get_token(rejected_token=token)
+    await token_manager.async_get_token(rejected_token="token-antigo")
+
+    assert api.generate_access_token.await_count == 2
+    token_manager.async_shutdown()
+
+
+@pytest.mark.asyncio
+async def test_erro_ao_renovar_retorna_none(hass: HomeAssistant):
+    token_manager, _ = _token_manager(hass, {})
+
+    assert await token_manager.async_get_token() is None
+    assert token_manager.refresh_errors == 1
@@ -0,0 +1,144 @@
+import asyncio
+import json
+
+import pytest
+from homeassistant.core import HomeAssistant
+
+from custom_components.stackspot.tools import ToolInput, ToolResult, _dependencies, process_response_tools
+
+
+def _tool_call(*calls: tuple[str, str, dict]) -> str:
+    return json.dumps({
+        "tool_call": [
+            {"identifier": identifier, "name": name, "parameters": parameters}
+            for identifier, name, parameters in calls
+        ]
+    })
+
+
+@pytest.mark.asyncio
+async def test_chamadas_repetidas_usam_resultado_memorizado(hass: HomeAssistant):
+    hass.states.async_set("sensor.sala", "21")
+    tool_cache: dict[str, ToolResult] = {}
+
+    first = await process_response_tools(
+        hass,
+        _tool_call(("a", "get_entity_state", {"entity_id": "sensor.sala"})),
+        tool_cache,
+    )
+    second = await process_response_tools(
+        hass,
+        _tool_call(("b", "get_entity_state", {"entity_id": "sensor.sala"})),
+        tool_cache,
+    )
+
+    assert first["executed"] == 1
+    assert second["executed"] == 0
+    assert second["memoized"] == 1
+    assert json.loads(second["content"])[0]["identifier"] == "b"
+    assert json.loads(second["content"])[0]["result"]["state"] == "21"
+
+
+@pytest.mark.asyncio
+async def test_resposta_sem_tool_call(hass: HomeAssistant):
+    result = await process_response_tools(hass, "Olá, tudo bem?")
+
+    assert result == {"tools": False}
+
+
+@pytest.mark.asyncio
+async def test_varias_tools_retornam_na_ordem_pedida(hass: HomeAssistant):
+    for index in range(8):
+        hass.states.async_set(f"sensor.sensor_{index}", str(index))
+
+    result = await process_response_tools(
+        hass,
+        _tool_call(*((f"id_{index}", "get_entity_state", {"entity_id": f"sensor.sensor_{index}"}) for index in range(8))),
+    )
+
+    content = json.loads(result["content"])
+    assert [item["identifier"] for item in content] == [f"id_{index}" for index in range(8)]
+    assert [item["result"]["state"] for item in content] == [str(index) for index in range(8)]
+    assert result["executed"] == 8
+
+
+@pytest.mark.asyncio
+async def test_estado_lido_de_novo_depois_de_um_servico(hass: HomeAssistant):
+    hass.states.async_set("light.sala", "off")
+    service_calls = []
+
+    async def turn_on(call):
+        service_calls.append(call)
+        hass.states.async_set("light.sala", "on")
+
+    hass.services.async_register("light", "turn_on", turn_on)
+    tool_cache: dict[str, ToolResult] = {}
+    call_counts: dict[str, int] = {}
+    service = ("b", "call_service", {"domain": "light", "service": "turn_on", "data": {"entity_id": "light.sala"}})
+
+    before = await process_response_tools(
+        hass, _tool_call(("a", "get_entity_state", {"entity_id": "light.sala"})), tool_cache, call_counts
+    )
+    await process_response_tools(hass, _tool_call(service), tool_cache, call_counts)
+    after = await process_response_tools(
+        hass, _tool_call(("c", "get_entity_state", {"entity_id": "light.sala"})), tool_cache, call_counts
+    )
+    retry = await process_response_tools(hass, _tool_call(service), tool_cache, call_counts)
+
+    assert json.loads(before["content"])[0]["result"]["state"] == "off"
+    assert after["executed"] == 1
+    assert json.loads(after["content"])[0]["result"]["state"] == "on"
+    assert retry["executed"] == 1
+    assert retry["repeated"] == 1
+    assert len(service_calls) == 2
+
+
+@pytest.mark.asyncio
+async def test_leitura_da_mesma_entidade_espera_o_servico(hass: HomeAssistant):
+    hass.states.async_set("light.sala", "off")
+
+    async def turn_on(call):
+        await asyncio.sleep(0.01)
+        hass.states.async_set("light.sala", "on")
+
+    hass.services.async_register("light", "turn_on", turn_on)
+
+    result = await process_response_tools(hass, _tool_call(
+        ("a", "call_service", {"domain": "light", "service": "turn_on", "data": {"entity_id": "light.sala"}}),
+        ("b", "get_entity_state", {"entity_id": "light.sala"}),
+    ))
+
+    assert json.loads(result["content"])[1]["result"]["state"] == "on"
+
+
+@pytest.mark.asyncio
+async def test_servicos_com_entidades_em_comum_mantem_a_ordem(hass: HomeAssistant):
+    order: list[str] = []
+
+    async def record(call):
+        await asyncio.sleep(0.01 if call.service == "turn_on" else 0)
+        order.append(call.service)
+
+    hass.services.async_register("light", "turn_on", record)
+    hass.services.async_register("light", "turn_off", record)
+
+    await process_response_tools(hass, _tool_call(
+        ("a", "call_service", {"domain": "light", "service": "turn_on",
+                               "data": {"entity_id": ["light.a", "light.b"]}}),
+        ("b", "call_service", {"domain": "light", "service": "turn_off",
+                               "data": {"target": {"entity_id": "light.c, light.a"}}}),
+    ))
+
+    assert order == ["turn_on", "turn_off"]
+
+
+def test_dependencias_por_entidade():
+    tools = [
+        ToolInput("a", "call_service", {"domain": "light", "service": "turn_on", "data": {"entity_id": "light.a"}}),
+        ToolInput("b", "get_entity_state", {"entity_id": "sensor.b"}),
+        ToolInput("c", "get_entity_state", {"entity_id": "light.a"}),
+        ToolInput("d", "call_service", {"domain": "scene", "service": "turn_on", "data": {"area_id": "sala"}}),
+        ToolInput("e", "get_entity_state", {"entity_id": "sensor.b"}),
+    ]
+
+    assert _dependencies(tools, list(range(5))) == {0: [], 1: [], 2: [0], 3: [0, 1, 2], 4: [3]}
@@ -0,0 +1,69 @@
+import pytest
+from homeassistant.core import HomeAssistant
+
+from custom_components.stackspot import MANAGER, StackSpotEntityManager
+from custom_components.stackspot.const import DOMAIN
+from custom_components.stackspot.util import (
+    TEMPLATE_CACHE_SIZE,
+    clear_template_cache,
+    get_template,
+    get_template_variable_names,
+    get_variables,
+)
+
+
+@pytest.fixture(autouse=True)
+def _clear_template_cache():
+    clear_template_cache()
+    yield
+    clear_template_cache()
+
+
+@pytest.mark.asyncio
+async def test_template_compilado_reaproveitado(hass: HomeAssistant):
+    template = get_template(hass, "{{ 1 + 1 }}")
+
+    assert get_template(hass, "{{ 1 + 1 }}") is template
+    assert get_template(hass, "{{ 2 + 2 }}") is not template
+
+
+@pytest.mark.asyncio
+async def test_cache_de_templates_descarta_o_menos_usado(hass: HomeAssistant):
+    first = get_template(hass, "{{ 0 }}")
+    second = get_template(hass, "{{ 1 }}")
+    for index in range(2, TEMPLATE_CACHE_SIZE):
+        get_template(hass, f"{{{{ {index} }}}}")
+
+    # O primeiro foi usado por último, o segundo passa a ser o menos usado
+    assert get_template(hass, "{{ 0 }}") is first
+    get_template(hass, "{{ novo }}")
+
+    assert get_template(hass, "{{ 0 }}") is first
+    assert get_template(hass, "{{ 1 }}") is not second
+
+
+@pytest.mark.asyncio
+async def test_limpar_cache_recompila_o_template(hass: HomeAssistant):
+    template = get_template(hass, "{{ 1 + 1 }}")
+    clear_template_cache()
+
+    assert get_template(hass, "{{ 1 + 1 }}") is not template
+
+
+def test_nomes_das_variaveis_do_template():
+    names = get_template_variable_names('{% set x = 1 %}{{ to_table(scripts) }} {{ states("sensor.sala") }} {{ x }}')
+
+    assert {"to_table", "scripts", "states"} <= names
+    assert "x" not in names
+    assert get_template_variable_names("{{ erro ") is None
+
+
+@pytest.mark.asyncio
+async def test_apenas_variaveis_referenciadas_sao_montadas(hass: HomeAssistant):
+    hass.data[DOMAIN] = {MANAGER: StackSpotEntityManager()}
+
+    variables = get_variables(hass, frozenset({"scripts", "to_table"}))
+    assert set(variables) == {"scripts", "to_table"}
+
+    variables = get_variables(hass, frozenset({"all_variables"}))
+    assert {"exposed_entities", "scripts", "services", "all_variables", "to_table"} <= set(variables)
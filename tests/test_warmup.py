@@ -0,0 +1,67 @@
+from unittest.mock import AsyncMock, MagicMock, patch
+
+import pytest
+from homeassistant.core import HomeAssistant
+
+from custom_components.stackspot.client.stackspot_client import KEEPALIVE_SECONDS
+from custom_components.stackspot.sensor import WarmUpDurationSensor
+from custom_components.stackspot.warmup import WARM_UP_INTERVAL, WARM_UP_MAX_IDLE, StackSpotWarmUp
+
+
+def _warm_up(hass: HomeAssistant, last_inference_activity: float = 0.0) -> StackSpotWarmUp:
+    api = MagicMock(last_inference_activity=last_inference_activity, warm_up=AsyncMock(return_value=True))
+    token_manager = MagicMock(async_get_token=AsyncMock(return_value="token"))
+    with patch("custom_components.stackspot.warmup.time.monotonic", return_value=0.0):
+        return StackSpotWarmUp(hass, api, token_manager)
+
+
+def _at(seconds: float):
+    return patch("custom_components.stackspot.warmup.time.monotonic", return_value=seconds)
+
+
+def test_intervalo_menor_que_o_keep_alive():
+    assert WARM_UP_INTERVAL.total_seconds() < KEEPALIVE_SECONDS
+
+
+@pytest.mark.asyncio
+async def test_aquece_antes_do_keep_alive_expirar(hass: HomeAssistant):
+    warm_up = _warm_up(hass, last_inference_activity=1000.0)
+    idle_needed = KEEPALIVE_SECONDS - WARM_UP_INTERVAL.total_seconds()
+
+    with _at(1000.0 + idle_needed - 1):
+        assert not warm_up.should_warm_up()
+
+    with _at(1000.0 + idle_needed):
+        assert warm_up.should_warm_up()
+        await warm_up.async_warm_up()
+        # A conexão acabou de ser usada pelo warm-up
+        assert not warm_up.should_warm_up()
+
+    with _at(1000.0 + 2 * idle_needed):
+        assert warm_up.should_warm_up()
+
+
+@pytest.mark.asyncio
+async def test_para_depois_do_tempo_maximo_ocioso(hass: HomeAssistant):
+    warm_up = _warm_up(hass, last_inference_activity=1000.0)
+
+    with _at(1000.0 + WARM_UP_MAX_IDLE.total_seconds() + 1):
+        assert not warm_up.should_warm_up()
+
+    warm_up._api.last_inference_activity = 1000.0 + WARM_UP_MAX_IDLE.total_seconds()
+    with _at(1000.0 + WARM_UP_MAX_IDLE.total_seconds() + KEEPALIVE_SECONDS):
+        assert warm_up.should_warm_up()
+
+
+@pytest.mark.asyncio
+async def test_sensor_atualizado_apos_warm_up(hass: HomeAssistant):
+    warm_up = _warm_up(hass)
+    sensor = WarmUpDurationSensor("entry", warm_up)
+    listener = MagicMock()
+    warm_up.async_add_listener(listener)
+
+    await warm_up.async_warm_up()
+
+    listener.assert_called_once()
+    assert sensor.native_value is not None
+    assert sensor.extra_state_attributes["success"] is True